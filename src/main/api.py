@@ -0,0 +1,390 @@
+## -*- coding: UTF-8 -*-
+## api.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+
+import logging
+Logger = logging.getLogger(__name__)
+import sys
+import pickle
+from time import sleep
+from queue import Queue as LocalQueue
+from threading import Thread, Event, Semaphore
+from multiprocessing import SimpleQueue
+from argparse import Namespace
+from construct.lib import Container
+
+from src.main.directives import ParseDirectiveMixin
+from src.main.exceptions import ParseCancelledError
+from src.parsers.evtx import EventLogX
+from src.utils.xpath import compile_query
+import src.utils.parallel as parallel
+import src.main.tasks as tasks
+
+class RecordBatch(list):
+    '''
+    Records parsed from one EVTX chunk, with the path of the file
+    (filepath) and index of the chunk (chunkidx) they were parsed from
+    '''
+    def __init__(self, records, filepath, chunkidx):
+        super(RecordBatch, self).__init__(records)
+        self.filepath = filepath
+        self.chunkidx = chunkidx
+
+class RecordIterator(ParseDirectiveMixin):
+    '''
+    Iterator over the records of EVTX files parsed by a pool of worker
+    processes (or in this process if there are no workers), yielding a
+    RecordBatch per chunk with records in file and chunk order. Chunks
+    are submitted by a reader thread at most window chunks ahead of the
+    chunk the caller has reached, so a slow caller holds back parsing
+    instead of parsed records piling up in memory. Uses the same frontier,
+    chunk pruning, shared memory ring and supervised parser pool as the
+    parse directives (see ParseDirectiveMixin)
+    '''
+    def __init__(self, args):
+        self.args = args
+        self._frontier = None
+        self._pipeline = None
+        self._progress = None
+        self._ring = None
+        self._tuner = None
+        self._readahead = None
+        self._limit = None
+        self._journal = None
+        self._results = None
+        self._window = None
+        self._window_size = 0
+        self._reader = None
+        self._chunks = dict()
+        self._next_order = 0
+        self._stopped = Event()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    def _prepare_args(self):
+        '''
+        @ParseDirectiveMixin._prepare_args
+        '''
+        self.args.inline = self.args.threads == 0
+        self.args.threads = max(1, self.args.threads)
+        if isinstance(self.args.query, str):
+            self.args.query = compile_query(self.args.query)
+    def _prepare_frontier(self):
+        '''
+        @ParseDirectiveMixin._prepare_frontier
+        '''
+        self.frontier = self._get_frontier(self.args.sources)
+    def _should_parse(self):
+        '''
+        @ParseDirectiveMixin._should_parse
+        '''
+        return len(self.frontier) > 0 and self.args.count > 0
+    def _get_quarantine_path(self):
+        '''
+        @ParseDirectiveMixin._get_quarantine_path
+        '''
+        return None if self.args.log_path is None else super(RecordIterator, self)._get_quarantine_path()
+    def _quarantine_task(self, task):
+        '''
+        @ParseDirectiveMixin._quarantine_task
+        NOTE:
+            the chunk is returned to the caller as an empty batch, so the
+            chunks after it are not held back
+        '''
+        try:
+            if self._get_quarantine_path() is not None:
+                super(RecordIterator, self)._quarantine_task(task)
+            elif isinstance(task.source, int):
+                self.ring.release(task.source)
+        finally:
+            self._results.put([(task.context.order, list())])
+    def _drop_tasks(self, error, tasks):
+        '''
+        @ParseDirectiveMixin._drop_tasks
+        NOTE:
+            error is also passed to the caller (without a total, so it is
+            raised at once), which may be waiting on the records of the
+            dropped chunks
+        '''
+        try:
+            super(RecordIterator, self)._drop_tasks(error, tasks)
+        finally:
+            self._results.put(Container(total=None, error=error))
+    def _prepare_worker_pools(self):
+        '''
+        @ParseDirectiveMixin._prepare_worker_pools
+        '''
+        self.pipeline = parallel.Pipeline()
+        self.progress = parallel.ProgressCounter(len(self.frontier))
+        self._window_size = 4 * self.args.threads * self.args.batch_size
+        self._window = Semaphore(self._window_size)
+        task_kwargs = dict(\
+            query=self.args.query,
+            grep=self.args.grep,
+            fields=self.args.fields,
+            record_filter=self.args.record_filter\
+        )
+        if self.args.inline:
+            self._results = LocalQueue()
+            self.pipeline.add_stage(\
+                'parser',
+                tasks.ParseRecordsTask,
+                inline=True,
+                worker_kwargs=dict(progress=self.progress, limit=self.limit, result_queue=self._results),
+                task_kwargs=task_kwargs\
+            )
+            return
+        ## Workers put their results straight into the pipe (rather than through
+        ## a feeder thread), so the results of an entry are not lost if the
+        ## worker dies after reporting the entry done
+        self._results = SimpleQueue()
+        self._prepare_ring()
+        self.pipeline.add_stage(\
+            'parser',
+            tasks.ParseRecordsTask,
+            worker_count=self.args.threads,
+            batch_size=self.args.batch_size,
+            queue_size=self._get_queue_size(),
+            supervised=True,
+            on_quarantine=self._quarantine_task,
+            on_error=self._drop_tasks,
+            worker_kwargs=dict(\
+                result_queue=self._results,
+                progress=self.progress,
+                ring=self.ring,
+                limit=self.limit,
+                log_path=self.args.log_path\
+            ),
+            task_kwargs=task_kwargs\
+        )
+    def _get_schedule(self, node_counts):
+        '''
+        @ParseDirectiveMixin._get_schedule
+        NOTE:
+            always in frontier order, as records are returned in the
+            order chunks are submitted
+        '''
+        return [nodeidx for nodeidx in range(len(self.frontier)) if node_counts[nodeidx] != 0]
+    def _stage_chunk(self, raw_chunk):
+        '''
+        @ParseDirectiveMixin._stage_chunk
+        NOTE:
+            blocks while window chunks have been submitted but not yet
+            returned to the caller (first adding any partial batch to the
+            queue, as the caller may be waiting on a chunk in it), and
+            raises ParseCancelledError once the caller has stopped
+        '''
+        if not self._window.acquire(blocking=False):
+            self.pools.parser.flush()
+            self._window.acquire()
+        if self._stopped.is_set():
+            raise ParseCancelledError('caller stopped reading records')
+        return super(RecordIterator, self)._stage_chunk(raw_chunk)
+    def _add_tasks(self, evtx_chunk, nodeidx, chunkidx, count):
+        '''
+        @ParseDirectiveMixin._add_tasks
+        '''
+        self._chunks[self._next_order] = (nodeidx, chunkidx)
+        self.pipeline.submit(evtx_chunk, nodeidx, chunkidx, count=count, order=self._next_order)
+        self._next_order += 1
+    def _read(self, schedule, node_counts):
+        '''
+        Args:
+            schedule: List<Integer>     => indices of nodes to parse in order
+            node_counts: List<Integer>  => number of records to process from each node
+        Procedure:
+            Submit the chunks of every node in schedule to the parser pool,
+            then tell the caller how many chunks were submitted (and any
+            error raised) and wait for the parser pool to finish
+        Preconditions:
+            The parser pool has been started
+        '''
+        error = None
+        try:
+            for nodeidx in schedule:
+                if self._stopped.is_set() or self._limit_reached():
+                    break
+                node = self.frontier[nodeidx]
+                Logger.info('Parsing EVTX file %s (node %d)'%(node, nodeidx))
+                self._add_file_tasks(EventLogX(node), nodeidx, node_counts[nodeidx])
+            self.pools.parser.flush()
+        except ParseCancelledError:
+            pass
+        except Exception as e:
+            Logger.error('Failed to submit EVTX chunks (%s)'%str(e))
+            error = e
+        finally:
+            self._results.put(Container(total=self._next_order, error=error))
+            try:
+                self._close_pipeline()
+            except Exception as e:
+                Logger.error('Failed to parse EVTX chunks (%s)'%str(e))
+            finally:
+                self._stop_readahead()
+    def start(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Start the parser pool and the reader thread submitting chunks to it
+        Preconditions:
+            N/A
+        '''
+        self._prepare_args()
+        self._prepare_filters()
+        self._prepare_frontier()
+        if not self._should_parse():
+            self._results = LocalQueue()
+            self._results.put(Container(total=0, error=None))
+            return
+        self._prepare_limit()
+        self._prepare_worker_pools()
+        node_counts = self._get_node_counts()
+        self._start_pipeline()
+        schedule = self._get_schedule(node_counts)
+        self._start_readahead(schedule)
+        self._reader = Thread(target=self._read, args=(schedule, node_counts), daemon=True)
+        self._reader.start()
+    def __iter__(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Gen<RecordBatch>
+            Records of every chunk (that has any record to return), in
+            file and chunk order
+        Preconditions:
+            N/A
+        '''
+        if self._results is None:
+            self.start()
+        pending = dict()
+        end = None
+        next_order = 0
+        remaining = self.args.count
+        try:
+            while (end is None or next_order < end.total) and remaining > 0:
+                if next_order not in pending:
+                    item = self._results.get()
+                    if isinstance(item, Container) and item.total is None:
+                        raise item.error
+                    elif isinstance(item, Container):
+                        end = item
+                    else:
+                        for order, records in item:
+                            pending[order] = records
+                    continue
+                records = pending.pop(next_order)
+                nodeidx, chunkidx = self._chunks.pop(next_order)
+                next_order += 1
+                self._window.release()
+                if len(records) > 0:
+                    records = records[:remaining]
+                    remaining -= len(records)
+                    yield RecordBatch(records, self.frontier[nodeidx], chunkidx)
+            if end is not None and end.error is not None:
+                raise end.error
+        finally:
+            self.close()
+    def close(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Stop submitting chunks and wait for the parser pool to finish the
+            chunks already submitted (discarding their records)
+        Preconditions:
+            N/A
+        '''
+        if self._reader is None:
+            return
+        self._stopped.set()
+        for i in range(self._window_size):
+            self._window.release()
+        while self._reader.is_alive():
+            if self._results.empty():
+                sleep(0.05)
+            else:
+                self._results.get()
+        self._reader = None
+        self._close_ring()
+        self._report_stage_stats()
+
+def parse_files(paths, workers=None, fields=None, filter=None, grep=None, count=None, batch_size=1, max_inflight_mb=256, readahead_mb=64, log_path=None):
+    '''
+    Args:
+        paths: List<String>|String      => paths to EVTX files or directories of
+                                           EVTX files (or '-' for stdin)
+        workers: Integer                => number of worker processes (0 to parse
+                                           in this process, default as parse directives)
+        fields: List<String>            => dotted paths of fields to return (i.e.
+                                           System.EventID), all fields if None
+        filter: String|Callable         => XPath query records must match (i.e.
+                                           *[System[EventID=4624]]) or predicate
+                                           called with each serialized record
+                                           (must be picklable if workers > 0, or
+                                           TypeError is raised)
+        grep: List<String>              => keywords records must contain (raw data)
+        count: Integer                  => maximum number of records to return
+        batch_size: Integer             => number of chunks to send to a worker at a time
+        max_inflight_mb: Integer        => maximum size of chunks queued for or held
+                                           by workers, in MB
+        readahead_mb: Integer           => how far ahead of parsing to read files, in MB
+        log_path: String                => directory of worker logs (no worker logs if None)
+    Returns:
+        RecordIterator
+        Iterator of RecordBatch (list of records, as dictionaries, of one
+        chunk) in file and chunk order; closing it (or leaving a with block
+        using it) stops parsing early
+    Preconditions:
+        workers is of type Integer >= 0                     (assumed True)
+        batch_size is of type Integer > 0                   (assumed True)
+    '''
+    if isinstance(paths, str):
+        paths = [paths]
+    if workers is None:
+        workers = 2 if parallel.CPU_COUNT <= 4 else 4
+    if filter is None or callable(filter):
+        query, record_filter = None, filter
+    else:
+        query, record_filter = filter, None
+    if record_filter is not None and workers > 0:
+        try:
+            pickle.dumps(record_filter)
+        except Exception as e:
+            raise TypeError('filter must be picklable to be sent to worker processes (%s)'%str(e))
+    return RecordIterator(Namespace(\
+        sources=list(paths),
+        threads=workers,
+        fields=list(fields) if fields is not None else None,
+        query=query,
+        record_filter=record_filter,
+        grep=list(grep) if grep is not None else None,
+        count=count if count is not None else sys.maxsize,
+        batch_size=batch_size,
+        max_inflight_mb=max_inflight_mb,
+        readahead_mb=readahead_mb,
+        inline_below_mb=0,
+        log_path=log_path\
+    ))
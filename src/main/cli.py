@@ -26,7 +26,10 @@ from os import path
 from argparse import ArgumentParser, ArgumentTypeError
 
 from src.main.directives import DirectiveRegistry
+from src.main.tasks import SUMMARY_COLUMNS
+from src.main.exceptions import QueryCompilationError
 from src.utils.parallel import CPU_COUNT
+from src.utils.xpath import compile_query
 
 def DBConnectConfig(arg):
     '''
@@ -62,6 +65,109 @@ def FileFormatList(arg):
     except Exception as e:
         raise ArgumentTypeError(str(e))
 
+def SummaryColumnList(arg):
+    '''
+    Args:
+        arg: String => comma-separated CSV summary columns
+    Returns:
+        List<String>
+        Columns to output, in order
+    Preconditions:
+        arg is of type String   (assumed True)
+    '''
+    columns = [item.strip() for item in arg.strip().split(',') if len(item.strip()) > 0]
+    if len(columns) == 0:
+        raise ArgumentTypeError('at least one column must be selected')
+    for column in columns:
+        if column not in SUMMARY_COLUMNS:
+            raise ArgumentTypeError('%s is not a summary column (choices: %s)'%(column, ', '.join(SUMMARY_COLUMNS)))
+    return columns
+
+def CSVSeparator(arg):
+    '''
+    Args:
+        arg: String => CSV field separator
+    Returns:
+        String
+        Separator
+    Preconditions:
+        arg is of type String   (assumed True)
+    '''
+    if len(arg) != 1:
+        raise ArgumentTypeError('separator must be a single character')
+    return arg
+
+def EventQuery(arg):
+    '''
+    Args:
+        arg: String => XPath event query (i.e. *[System[EventID=4624]])
+    Returns:
+        XPathQuery
+        Compiled event query
+    Preconditions:
+        arg is of type String   (assumed True)
+    '''
+    try:
+        return compile_query(arg)
+    except QueryCompilationError as e:
+        raise ArgumentTypeError(str(e))
+
+def KeywordTerm(arg):
+    '''
+    Args:
+        arg: String => keyword to search raw records for
+    Returns:
+        String
+        Keyword
+    Preconditions:
+        arg is of type String   (assumed True)
+    '''
+    if len(arg) == 0:
+        raise ArgumentTypeError('keyword cannot be empty')
+    return arg
+
+def ThreadCount(arg):
+    '''
+    Args:
+        arg: String => number of worker processes, or 'auto'
+    Returns:
+        Integer|String
+        Number of worker processes, or 'auto' to scale the number
+        of worker processes while parsing
+    Preconditions:
+        arg is of type String   (assumed True)
+    '''
+    if arg == 'auto':
+        return arg
+    try:
+        threads = int(arg)
+    except ValueError:
+        raise ArgumentTypeError('threads must be an integer or auto')
+    if threads <= 0:
+        raise ArgumentTypeError('threads must be greater than 0')
+    return threads
+
+def HostAddress(arg):
+    '''
+    Args:
+        arg: String => address in the form host:port
+    Returns:
+        Tuple<String, Integer>
+        Host and port of address
+    Preconditions:
+        arg is of type String   (assumed True)
+    '''
+    host, sep, port = arg.rpartition(':')
+    if sep == '' or host == '':
+        raise ArgumentTypeError('address must be in the form host:port')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ArgumentTypeError('port must be an integer')
+    if not 0 < port < 65536:
+        raise ArgumentTypeError('port must be between 1 and 65535')
+    return (host, port)
+
 def initialize_parser():
     '''
     Args:
@@ -84,17 +190,30 @@ def initialize_parser():
 
     ## Base parse parent
     base_parse_parent = ArgumentParser(add_help=False)
-    base_parse_parent.add_argument('-s', '--source', action='append', help='Path to input file(s)', dest='sources')
-    base_parse_parent.add_argument('-c', '--count', default=sys.maxsize, type=int, help='Number of records to process', dest='count')
-    base_parse_parent.add_argument('--threads', default=(2 if CPU_COUNT <= 4 else 4), type=int, help='Number of threads to use', dest='threads')
+    base_parse_parent.add_argument('-s', '--source', action='append', help='Path to input file(s) or pipe(s), or - for stdin', dest='sources')
+    base_parse_parent.add_argument('-c', '--count', default=sys.maxsize, type=int, help='Number of records to output (parsing stops once this many records have been output)', dest='count')
+    base_parse_parent.add_argument('--threads', default=(2 if CPU_COUNT <= 4 else 4), type=ThreadCount, help='Number of threads to use, or auto to scale with load', dest='threads')
+    base_parse_parent.add_argument('--batch-size', default=1, type=int, help='Number of chunks to send to a worker process at a time (default: 1)', dest='batch_size')
+    base_parse_parent.add_argument('--max-inflight-mb', default=256, type=int, help='Maximum size of chunks queued for or held by worker processes, in MB (default: 256)', dest='max_inflight_mb')
+    base_parse_parent.add_argument('--inline-below-mb', default=8, type=int, help='Parse in this process, without worker processes, if the input totals at most this many MB (default: 8, 0 to disable)', dest='inline_below_mb')
+    base_parse_parent.add_argument('--readahead-mb', default=64, type=int, help='Read input files up to this many MB ahead of parsing (default: 64, 0 to disable)', dest='readahead_mb')
+    base_parse_parent.add_argument('--query', type=EventQuery, default=None, help='XPath query records must match to be output (i.e. "*[System[EventID=4624]]")', dest='query')
+    base_parse_parent.add_argument('--grep', action='append', type=KeywordTerm, default=None, help='Only output records containing keyword (matched against raw record data before decoding) - can use multiple times', dest='grep')
+    base_parse_parent.add_argument('--resume', action='store_true', help='Resume an interrupted run from its checkpoint journal, skipping chunks already parsed (without a journal, output of an earlier run is rewritten)', dest='resume')
 
     ## Base output parent
     base_output_parent = ArgumentParser(add_help=False)
     base_output_parent.add_argument('-t', '--target', type=str, required=True, help='Path to output file', dest='target')
+    base_output_parent.add_argument('--compress', type=str, default=None, choices=['gzip', 'bz2', 'xz'], help='Compress output, each worker compressing its own output (default: no compression)', dest='compress')
 
     ## CSV output parent parser
     csv_output_parent = ArgumentParser(parents=[base_output_parent], add_help=False)
-    csv_output_parent.add_argument('-S', '--sep', default=',', help='Output file separator (default: ",")', dest='sep')
+    csv_output_parent.add_argument('-S', '--sep', type=CSVSeparator, default=',', help='Output file separator (default: ",")', dest='sep')
+    csv_output_parent.add_argument('--columns', type=SummaryColumnList, default=None, help='Comma-separated list of columns of CSV summary output, in order (default: all, see README)', dest='columns')
+
+    ## Shard output parent parser
+    shard_output_parent = ArgumentParser(add_help=False)
+    shard_output_parent.add_argument('--shard-by', type=str, default=None, choices=['channel', 'provider', 'event_id', 'computer'], help='Write records to a separate output file per value of this System field (i.e. output.Security.json)', dest='shard_by')
 
     ## DB connect parent parser
     db_connect_parent = ArgumentParser(add_help=False)
@@ -111,7 +230,7 @@ def initialize_parser():
     parse_subdirectives = parse_directive.add_subparsers()
 
     # CSV parse directive
-    csv_parse_directive = parse_subdirectives.add_parser('csv', parents=[base_parent, base_parse_parent, csv_output_parent], help='Parse EVTX file to csv')
+    csv_parse_directive = parse_subdirectives.add_parser('csv', parents=[base_parent, base_parse_parent, csv_output_parent, shard_output_parent], help='Parse EVTX file to csv')
     csv_parse_directive.add_argument('info_type', \
         type=str, \
         default='summary', \
@@ -120,21 +239,43 @@ def initialize_parser():
     csv_parse_directive.set_defaults(func=DirectiveRegistry.retrieve('ParseCSVDirective'))
     
     # JSON parse directive
-    json_parse_directive = parse_subdirectives.add_parser('json', parents=[base_parent, base_parse_parent, base_output_parent], help='Parse EVTX file to JSON')
+    json_parse_directive = parse_subdirectives.add_parser('json', parents=[base_parent, base_parse_parent, base_output_parent, shard_output_parent], help='Parse EVTX file to JSON')
     json_parse_directive.add_argument('-p', '--pretty', action='store_true', help='Whether to pretty-print the JSON output', dest='pretty')
     json_parse_directive.set_defaults(func=DirectiveRegistry.retrieve('ParseJSONDirective'))
 
+    # Columnar parse directive
+    columnar_parse_directive = parse_subdirectives.add_parser('columnar', parents=[base_parent, base_parse_parent], help='Parse EVTX file to columnar file')
+    columnar_parse_directive.add_argument('-t', '--target', type=str, required=True, help='Path to output file (overwritten)', dest='target')
+    columnar_parse_directive.set_defaults(func=DirectiveRegistry.retrieve('ParseColumnarDirective'))
+
     # File parse directive
-    file_parse_directive = parse_subdirectives.add_parser('file', parents=[base_parent, base_parse_parent, csv_output_parent], help='Parse EVTX file to multiple output formats')
+    file_parse_directive = parse_subdirectives.add_parser('file', parents=[base_parent, base_parse_parent, csv_output_parent, shard_output_parent], help='Parse EVTX file to multiple output formats')
     file_parse_directive.add_argument('-f', '--format', type=FileFormatList, required=True, help='Comma-separated list of output formats (choices: csv, body, and json)', dest='formats')
     file_parse_directive.add_argument('-p', '--pretty', action='store_true', help='Whether to pretty-print the JSON output', dest='pretty')
-    file_parse_directive.add_argument('-i', '--info-type', type=str, help='Information type for CSV output', dest='info_type')
+    file_parse_directive.add_argument('-i', '--info-type', type=str, default='summary', choices=['summary'], help='Information type for CSV output (default: summary)', dest='info_type')
     file_parse_directive.set_defaults(func=DirectiveRegistry.retrieve('ParseFILEDirective'))
 
     # Database parse directive
     db_parse_directive = parse_subdirectives.add_parser('db', parents=[base_parent, base_parse_parent, db_connect_parent], help='Parse EVTX file to database')
     db_parse_directive.set_defaults(func=DirectiveRegistry.retrieve('ParseDBDirective'))
 
+    ## Serve directive
+    serve_directive = main_directives.add_parser('serve', parents=[base_parent, base_parse_parent, csv_output_parent], help='Coordinate parsing of EVTX files by remote workers')
+    serve_directive.add_argument('-f', '--format', type=str, default='json', choices=['csv', 'json'], help='Output format (default: json)', dest='format')
+    serve_directive.add_argument('-i', '--info-type', type=str, default='summary', choices=['summary'], help='Information type for CSV output (default: summary)', dest='info_type')
+    serve_directive.add_argument('--bind', type=HostAddress, default=('127.0.0.1', 5640), help='Address to listen for workers on (default: 127.0.0.1:5640)', dest='bind')
+    serve_directive.add_argument('--authkey', type=str, required=True, help='Shared secret workers must present to connect', dest='authkey')
+    serve_directive.add_argument('--lease-chunks', type=int, default=16, help='Number of chunks leased to a worker at a time (default: 16)', dest='lease_chunks')
+    serve_directive.add_argument('--lease-timeout', type=float, default=300, help='Seconds before an uncompleted lease is given to another worker (default: 300)', dest='lease_timeout')
+    serve_directive.set_defaults(func=DirectiveRegistry.retrieve('ServeDirective'))
+
+    ## Worker directive
+    worker_directive = main_directives.add_parser('worker', parents=[base_parent], help='Parse EVTX chunks leased from a coordinator')
+    worker_directive.add_argument('--connect', type=HostAddress, required=True, help='Address of coordinator (i.e. host:5640)', dest='connect')
+    worker_directive.add_argument('--authkey', type=str, required=True, help='Shared secret of coordinator', dest='authkey')
+    worker_directive.add_argument('--threads', default=(2 if CPU_COUNT <= 4 else 4), type=int, help='Number of worker processes', dest='threads')
+    worker_directive.set_defaults(func=DirectiveRegistry.retrieve('WorkerDirective'))
+
     ## Query directive
     query_directive = main_directives.add_parser('query', parents=[base_parent, db_connect_parent], help='Submit queries to EVTX database')
     query_directive.add_argument('-t', '--target', type=str, help='Path to output file (default: stdout)', dest='target')
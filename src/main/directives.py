@@ -24,9 +24,13 @@
 import logging
 Logger = logging.getLogger(__name__)
 import sys
-from os import path, stat, mkdir, rmdir
+from os import path, stat, mkdir, rmdir, rename, remove
 from time import sleep
+from uuid import uuid4
 from glob import glob
+from threading import Thread
+from multiprocessing import Process
+from multiprocessing.connection import Listener, Client
 from argparse import Namespace
 from construct.lib import Container
 from tqdm import tqdm
@@ -36,8 +40,13 @@ from terminaltables import AsciiTable
 from src.utils.config import initialize_logger, synthesize_log_path
 from src.utils.registry import RegistryMetaclassMixin 
 from src.utils.logging import closeFileHandlers
-from src.parsers.evtx import EventLogX
+from src.parsers.evtx import EventLogX, EVTX_CHUNK_SIZE, EVTX_FILE_HEADER_SIZE
+from src.utils.search import compile_keywords
+from src.utils.readahead import FileReadahead
+from src.utils.leases import LeaseTable
+from src.utils.checkpoint import CheckpointJournal
 import src.utils.parallel as parallel
+import src.utils.columnar as columnar
 import src.main.tasks as tasks
 from src.database.manager import DBManager
 import src.database.models as db
@@ -108,20 +117,36 @@ class BaseDirective(object, metaclass=DirectiveRegistry):
             self.args.log_path is of type String
             self.args.log_prefix is of type String
             self.args.count is of type Integer       (optional)
-            self.args.threads is of type Integer > 0 (optional)
+            self.args.threads is of type Integer > 0 or 'auto' (optional)
+            self.args.batch_size is of type Integer > 0 (optional)
+            self.args.max_inflight_mb is of type Integer > 0 (optional)
+            self.args.inline_below_mb is of type Integer >= 0 (optional)
+            self.args.readahead_mb is of type Integer >= 0 (optional)
             ** Any other preconditions must be checked by subclasses
         '''
         assert isinstance(self.args, Namespace), 'Args is not of type Namespace'
         assert hasattr(self.args, 'log_path'), 'Args does not contain log_path attribute'
         assert hasattr(self.args, 'log_prefix'), 'Args does not contain log_prefix attribute'
         if hasattr(self.args, 'threads'):
+            if self.args.threads == 'auto':
+                self.args.autotune = True
+                self.args.threads = min(parallel.CPU_COUNT, 2 if parallel.CPU_COUNT <= 4 else 4)
             assert self.args.threads > 0, 'Threads is not greater than 0'
             if self.args.threads > parallel.CPU_COUNT:
                 self.args.threads = parallel.CPU_COUNT
+        if hasattr(self.args, 'batch_size'):
+            assert self.args.batch_size > 0, 'Batch_size is not greater than 0'
+        if hasattr(self.args, 'max_inflight_mb'):
+            assert self.args.max_inflight_mb > 0, 'Max_inflight_mb is not greater than 0'
+        if hasattr(self.args, 'inline_below_mb'):
+            assert self.args.inline_below_mb >= 0, 'Inline_below_mb is less than 0'
+        if hasattr(self.args, 'readahead_mb'):
+            assert self.args.readahead_mb >= 0, 'Readahead_mb is less than 0'
         initialize_logger(self.args.log_path)
         Logger.info('BEGIN: %s'%type(self).__name__)
         self.run()
-        sleep(0.5)
+        if not getattr(self.args, 'inline', False):
+            sleep(0.5)
         Logger.info('END: %s'%type(self).__name__)
         logging.shutdown()
         closeFileHandlers()
@@ -135,21 +160,45 @@ class ParseDirectiveMixin(object):
     @staticmethod
     def _get_frontier(sources):
         '''
+        Args:
+            sources: List<String>   => paths to input files or directories ('-' for stdin)
+        Returns:
+            List<String>
+            Paths of files to parse, including non-regular files such as
+            pipes (i.e. process substitution) and stdin
+        Preconditions:
+            sources is of type List<String> (assumed True)
         '''
         frontier = list()
         for src in sources:
-            src = path.abspath(src)
-            if path.isfile(src):
+            if src == '-':
                 frontier.append(src)
-            elif path.isdir(src):
+                continue
+            src = path.abspath(src)
+            if path.isdir(src):
                 for subsrc in glob(path.join(src, '*')):
                     frontier.append(subsrc)
+            elif path.exists(src):
+                frontier.append(src)
         return frontier
     @classmethod
     def _get_remaining_count(cls, filepath, record_count, max_records):
         '''
+        Args:
+            filepath: String        => path to EVTX file
+            record_count: Integer   => number of records processed so far
+            max_records: Integer    => maximum number of records to process
+        Returns:
+            Integer
+            Number of records to process from EVTX file at filepath,
+            None if unknown because the file is a stream
+        Preconditions:
+            filepath points to existing file    (assumed True)
         '''
-        raise NotImplementedError('_get_remaining_count method not implemented for %s'%cls.__name__)
+        file_record_count = EventLogX(filepath).get_record_count()
+        if file_record_count is None:
+            return None
+        return max(0, min(file_record_count, max_records - record_count))
 
     @property
     def frontier(self):
@@ -166,19 +215,110 @@ class ParseDirectiveMixin(object):
         '''
         self._frontier = value
     @property
+    def ring(self):
+        '''
+        @ring.getter
+        '''
+        return self._ring
+    @ring.setter
+    def ring(self, value):
+        '''
+        @ring.setter
+        Preconditions:
+            value is of type SharedChunkRing    (assumed True)
+        '''
+        self._ring = value
+    @property
+    def readahead(self):
+        '''
+        @readahead.getter
+        '''
+        return self._readahead
+    @readahead.setter
+    def readahead(self, value):
+        '''
+        @readahead.setter
+        Preconditions:
+            value is of type FileReadahead  (assumed True)
+        '''
+        self._readahead = value
+    @property
+    def tuner(self):
+        '''
+        @tuner.getter
+        '''
+        return self._tuner
+    @tuner.setter
+    def tuner(self, value):
+        '''
+        @tuner.setter
+        Preconditions:
+            value is of type WorkerAutoTuner    (assumed True)
+        '''
+        self._tuner = value
+    @property
+    def progress(self):
+        '''
+        @progress.getter
+        '''
+        return self._progress
+    @progress.setter
+    def progress(self, value):
+        '''
+        @progress.setter
+        Preconditions:
+            value is of type ProgressCounter    (assumed True)
+        '''
+        self._progress = value
+    @property
+    def pipeline(self):
+        '''
+        @pipeline.getter
+        '''
+        return self._pipeline
+    @pipeline.setter
+    def pipeline(self, value):
+        '''
+        @pipeline.setter
+        Preconditions:
+            value is of type Pipeline   (assumed True)
+        '''
+        self._pipeline = value
+    @property
     def pools(self):
         '''
         @pools.getter
+        Returns worker pools of the stages of self.pipeline by name
+        '''
+        return self.pipeline.pools if self.pipeline is not None else None
+    @property
+    def journal(self):
+        '''
+        @journal.getter
+        '''
+        return self._journal
+    @journal.setter
+    def journal(self, value):
+        '''
+        @journal.setter
+        Preconditions:
+            value is of type CheckpointJournal  (assumed True)
+        '''
+        self._journal = value
+    @property
+    def limit(self):
+        '''
+        @limit.getter
         '''
-        return self._pools
-    @pools.setter
-    def pools(self, value):
+        return self._limit
+    @limit.setter
+    def limit(self, value):
         '''
-        @pools.setter
+        @limit.setter
         Preconditions:
-            value is (subclass of) dict (assumed True)
+            value is of type RecordLimit    (assumed True)
         '''
-        self._pools = value
+        self._limit = value
     def _prepare_args(self):
         '''
         Args:
@@ -189,6 +329,17 @@ class ParseDirectiveMixin(object):
             N/A
         '''
         raise NotImplementedError('method _prepare_args not implemented for %s'%type(self).__name__)
+    def _prepare_filters(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Compile record filters (i.e. keywords to search for) from CLI arguments
+        Preconditions:
+            N/A
+        '''
+        if getattr(self.args, 'grep', None) is not None:
+            self.args.grep = compile_keywords(tuple(self.args.grep))
     def _prepare_frontier(self):
         '''
         Args:
@@ -215,7 +366,7 @@ class ParseDirectiveMixin(object):
         Args:
             N/A
         Procedure:
-            Construct necessary worker pools and store in self.pools
+            Construct the stages of self.pipeline
         Preconditions:
             N/A
         '''
@@ -230,16 +381,748 @@ class ParseDirectiveMixin(object):
             N/A
         '''
         raise NotImplementedError('method _parse_preamble not implemented for %s'%type(self).__name__)
+    def _add_tasks(self, evtx_chunk, nodeidx, chunkidx, count):
+        '''
+        Args:
+            evtx_chunk: ByteString  => EVTX chunk to add to task
+            nodeidx: Integer        => index of node (EVTX file) being parsed
+            chunkidx: Integer       => index of EVTX chunk being parsed
+            count: Integer          => maximum number of records to process from chunk
+        Procedure:
+            Add task(s) to parsing queue
+        Preconditions:
+            evtx_chunk is of type ByteString    (assumed True)
+            nodeidx is of type Integer          (assumed True)
+            chunkidx is of type Integer         (assumed True)
+            count is of type Integer            (assumed True)
+        '''
+        raise NotImplementedError('method _add_tasks not implemented for %s'%type(self).__name__)
+    def _skip_records(self, nodeidx, count):
+        '''
+        Args:
+            nodeidx: Integer    => index of node (EVTX file) records belong to
+            count: Integer      => number of records skipped
+        Procedure:
+            Report records that were not submitted to the parsing queue
+            (i.e. chunks pruned by query) to the progress tracker
+        Preconditions:
+            nodeidx is of type Integer  (assumed True)
+            count is of type Integer    (assumed True)
+        '''
+        self.progress.increment(nodeidx, self._get_progress_count(count))
+    def _get_progress_count(self, record_count):
+        '''
+        Args:
+            record_count: Integer   => number of records to process
+        Returns:
+            Integer
+            Number of progress updates expected for record_count records
+        Preconditions:
+            record_count is of type Integer (assumed True)
+        '''
+        return record_count
+    def _get_queue_size(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Maximum number of items in a task queue such that the chunks
+            queued plus those held by workers stay within the in-flight
+            memory budget (self.args.max_inflight_mb)
+        Preconditions:
+            N/A
+        '''
+        item_size = EVTX_CHUNK_SIZE * self.args.batch_size
+        return max(1, (self.args.max_inflight_mb * 1024 * 1024) // item_size - self.args.threads)
+    def _report_stage_stats(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Log the metrics of every pipeline stage: tasks run, time workers
+            spent running them, and high-water mark of the stage's task queue
+            and time spent blocked waiting for space in it
+        Preconditions:
+            N/A
+        '''
+        item_size = EVTX_CHUNK_SIZE * self.args.batch_size
+        stats = self.pipeline.stats
+        for name in stats:
+            stage = stats[name]
+            Logger.info('%s stage: %d worker(s), batch size %d, %d task(s) in %.3fs (%.0f%% busy), queue high-water mark: %d of %d item(s)%s, blocked for %.3fs'%(\
+                name.capitalize(),
+                stage.worker_count,
+                stage.batch_size,
+                stage.tasks,
+                stage.busy_time,
+                stage.utilization * 100,
+                stage.high_water_mark,
+                self._get_queue_size(),
+                ' (%.1f MB of chunks)'%(stage.high_water_mark * item_size / (1024 * 1024)) if name == 'parser' else '',
+                stage.blocked_time\
+            ))
+    def _start_progress(self, node_counts):
+        '''
+        Args:
+            node_counts: List<Integer>  => number of records to process from each node
+        Returns:
+            ProgressSampler
+            Started sampler rendering progress of self.progress
+        Preconditions:
+            node_counts is of type List<Integer>    (assumed True)
+        '''
+        sampler = parallel.ProgressSampler(\
+            self.progress,
+            [self._get_progress_count(node_count) if node_count is not None else None for node_count in node_counts],
+            desc='Records',
+            unit='records'\
+        )
+        sampler.start()
+        return sampler
+    def _start_readahead(self, schedule):
+        '''
+        Args:
+            schedule: List<Integer> => indices of nodes in the order they will be read
+        Procedure:
+            Start reading the files in schedule ahead of the reader, at most
+            self.args.readahead_mb MB ahead (disabled if 0 or parsing inline)
+        Preconditions:
+            schedule is of type List<Integer>   (assumed True)
+        '''
+        readahead_mb = getattr(self.args, 'readahead_mb', 0)
+        if readahead_mb == 0 or getattr(self.args, 'inline', False):
+            return
+        filepaths = [self.frontier[nodeidx] for nodeidx in schedule if path.isfile(self.frontier[nodeidx])]
+        if len(filepaths) == 0:
+            return
+        self.readahead = FileReadahead(filepaths, readahead_mb * 1024 * 1024)
+        self.readahead.start()
+    def _stop_readahead(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Stop reading ahead (if started)
+        Preconditions:
+            N/A
+        '''
+        if self.readahead is not None:
+            self.readahead.stop()
+    def _retry_task(self, task):
+        '''
+        Args:
+            task: BaseParseFileOutputTask   => task being requeued after a worker died
+        Returns:
+            BaseParseFileOutputTask
+            task, marked so it writes its output apart from the chunks its
+            worker runs in order
+        Preconditions:
+            N/A
+        '''
+        task.context.retry = True
+        return task
+    def _drop_tasks(self, error, tasks):
+        '''
+        Args:
+            error: Exception                        => exception the parser pool failed with
+            tasks: List<BaseParseFileOutputTask>    => tasks the parser pool dropped
+        Procedure:
+            Release the ring slots of tasks, so submitting the next chunk
+            raises error instead of waiting for a free slot
+        Preconditions:
+            N/A
+        '''
+        for task in tasks:
+            if isinstance(task.source, int):
+                self.ring.release(task.source)
+    def _get_quarantine_path(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            String
+            Path of file to append chunks that repeatedly crash workers to
+        Preconditions:
+            N/A
+        '''
+        return path.join(self.args.log_path, 'aevtx_quarantine.chunks')
+    def _quarantine_task(self, task):
+        '''
+        Args:
+            task: BaseParseFileOutputTask   => task that was running when workers repeatedly died
+        Procedure:
+            Append the raw chunk of task to the quarantine file, release its
+            ring slot and count its records as processed
+        Preconditions:
+            N/A
+        '''
+        raw_chunk = self.ring.view(task.source) if isinstance(task.source, int) else task.source
+        quarantine_path = self._get_quarantine_path()
+        try:
+            with open(quarantine_path, 'ab') as quarantine:
+                quarantine.write(bytes(raw_chunk))
+        except Exception as e:
+            Logger.error('Failed to quarantine EVTX chunk %d from node %d (%s)'%(task.chunkidx, task.nodeidx, str(e)))
+        else:
+            Logger.error('Quarantined EVTX chunk %d from node %d (%s) to %s'%(task.chunkidx, task.nodeidx, self.frontier[task.nodeidx], quarantine_path))
+        finally:
+            del raw_chunk
+            if isinstance(task.source, int):
+                self.ring.release(task.source)
+            self.progress.increment(task.nodeidx, task.context.get('count') or 0)
+    def _get_journal_path(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            String
+            Path of checkpoint journal of this run
+        Preconditions:
+            N/A
+        '''
+        return path.join(self.args.log_path, 'aevtx_checkpoint.journal')
+    def _get_checkpoint_outputs(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<String>
+            Names of outputs each chunk is checkpointed for separately
+            (None if each chunk has a single output)
+        Preconditions:
+            N/A
+        '''
+        return None
+    def _get_file_key(self, nodeidx):
+        '''
+        Args:
+            nodeidx: Integer    => index of node (EVTX file)
+        Returns:
+            String
+            Key chunks of node are checkpointed under (see EventLogX.get_identity)
+        Preconditions:
+            self.frontier[nodeidx] is a regular file   (assumed True)
+        '''
+        return EventLogX(self.frontier[nodeidx]).get_identity()
+    def _discard_output(self, nodeidx=None):
+        '''
+        Args:
+            nodeidx: Integer    => index of node (EVTX file) to discard output of
+                                   (None to discard output of every node)
+        Procedure:
+            Remove output written for node by an interrupted run that cannot
+            be resumed (i.e. the node is now a different file)
+        Preconditions:
+            N/A
+        '''
+        pass
+    def _should_checkpoint(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Boolean
+            Whether to record parsed chunks in a checkpoint journal: unless
+            parsing inline (which is fast enough that an interrupted run
+            is just run again), so any run can be resumed (see --resume)
+        Preconditions:
+            N/A
+        '''
+        return not self._should_inline()
+    def _discard_targets(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Remove the output an earlier run wrote to the targets of this
+            run, when resuming without a journal to resume from (the run
+            is complete, or was parsed inline), so it is rewritten instead
+            of appended to
+        Preconditions:
+            N/A
+        '''
+        pass
+    def _prepare_journal(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Open the checkpoint journal if checkpointing (see _should_checkpoint),
+            continuing from it if resuming (see --resume) or starting a new
+            one, else remove the journal and output of an earlier interrupted run.
+            When resuming, any output an interrupted merge appended to a
+            target is truncated, and if there is no journal to resume from
+            the targets are rewritten (see _discard_targets)
+        Preconditions:
+            N/A
+        '''
+        resume = getattr(self.args, 'resume', False)
+        if not self._should_checkpoint():
+            CheckpointJournal(self._get_journal_path()).remove()
+            self._discard_output()
+            if resume:
+                Logger.info('Not checkpointing when parsing in process, parsing from the beginning')
+                self._discard_targets()
+            return
+        self.journal = CheckpointJournal(self._get_journal_path())
+        if resume:
+            if self.journal.exists():
+                self.journal.load()
+                for target, size in self.journal.merges:
+                    if path.isfile(target) and path.getsize(target) > size:
+                        Logger.info('Truncating %s to %d bytes (interrupted while merging output)'%(target, size))
+                        with open(target, 'r+b') as target_file:
+                            target_file.truncate(size)
+                self.journal.compact()
+                Logger.info('Resuming from checkpoint journal %s'%self.journal.filepath)
+                return
+            Logger.warning('No checkpoint journal found at %s, parsing from the beginning'%self.journal.filepath)
+            self._discard_targets()
+        self._discard_output()
+        self.journal.reset()
+    def _start_checkpoint(self, nodeidx):
+        '''
+        Args:
+            nodeidx: Integer    => index of node (EVTX file) about to be parsed
+        Returns:
+            List<String>
+            Keys of outputs of node in the checkpoint journal (see
+            CheckpointJournal.get_keys), None if the node is not
+            checkpointed (no journal, or the node is a stream)
+        Preconditions:
+            N/A
+        '''
+        if self.journal is None:
+            return None
+        node = self.frontier[nodeidx]
+        key = None
+        if path.isfile(node):
+            try:
+                key = self._get_file_key(nodeidx)
+            except Exception as e:
+                Logger.error('Failed to identify EVTX file %s, not checkpointing it (%s)'%(node, str(e)))
+        if key is None or self.journal.get_key(nodeidx) != key:
+            self._discard_output(nodeidx)
+        self.journal.set_key(nodeidx, key)
+        if key is None:
+            return None
+        return self.journal.get_keys(key, self._get_checkpoint_outputs())
+    def _get_checkpoint(self, nodeidx, output=None):
+        '''
+        Args:
+            nodeidx: Integer    => index of node (EVTX file)
+            output: String      => name of output (see _get_checkpoint_outputs)
+        Returns:
+            String
+            Key tasks parsing chunks of node (for output) checkpoint under,
+            None if the node is not checkpointed
+        Preconditions:
+            N/A
+        '''
+        if self.journal is None or self.journal.get_key(nodeidx) is None:
+            return None
+        return self.journal.get_keys(self.journal.get_key(nodeidx), None if output is None else [output])[0]
+    def _merge_output(self, glob_pattern, target):
+        '''
+        Args:
+            glob_pattern: String    => glob pattern of spill files to merge
+            target: String          => path of file to merge results into
+        Procedure:
+            Merge spill files into target (see merge_tagged_files, or
+            merge_tagged_members if compressing output), at most
+            self.args.count records if limited, recording
+            the merge in the checkpoint journal and keeping the spill files
+            until the journal is finished (see _finish_journal)
+        Preconditions:
+            N/A
+        '''
+        if self.journal is not None:
+            self.journal.begin_merge(target)
+        compress = getattr(self.args, 'compress', None)
+        if compress is not None:
+            parallel.merge_tagged_members(\
+                glob_pattern,
+                target,
+                compress,
+                clean=self.journal is None,
+                limit=self.limit.limit if self.limit is not None else None\
+            )
+        else:
+            parallel.merge_tagged_files(\
+                glob_pattern,
+                target,
+                clean=self.journal is None,
+                limit=self.limit.limit if self.limit is not None else None\
+            )
+    def _finish_journal(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Remove the checkpoint journal and then the spill files, once all
+            output has been written
+        Preconditions:
+            N/A
+        '''
+        if self.journal is not None:
+            self.journal.remove()
+            self._discard_output()
+    def _filters_records(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Boolean
+            Whether records are filtered (i.e. by --query or --grep), so
+            not every record examined is output
+        Preconditions:
+            N/A
+        '''
+        return any(getattr(self.args, name, None) is not None for name in ('query', 'grep', 'record_filter'))
+    def _get_examine_count(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Maximum number of records to examine: self.args.count if every
+            record examined is output, otherwise unbounded (parsing stops
+            once self.args.count records have been output, see _prepare_limit)
+        Preconditions:
+            N/A
+        '''
+        return sys.maxsize if self._filters_records() else self.args.count
+    def _prepare_limit(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Create the shared count of records output against self.args.count
+            (one count per output, see _get_checkpoint_outputs), if limited
+        Preconditions:
+            N/A
+        '''
+        if self.args.count < sys.maxsize:
+            self.limit = parallel.RecordLimit(self.args.count, len(self._get_checkpoint_outputs() or [None]))
+    def _limit_reached(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Boolean
+            Whether self.args.count records have been output, so no more
+            chunks need to be submitted
+        Preconditions:
+            N/A
+        '''
+        return self.limit is not None and self.limit.reached
+    def _get_node_counts(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<Integer>
+            Number of records to process from each node in the frontier,
+            such that no more than self._get_examine_count() records are
+            processed in total (None for streams, whose record count is not
+            known in advance)
+        Preconditions:
+            N/A
+        '''
+        node_counts = list()
+        record_count = 0
+        for node in self.frontier:
+            try:
+                remaining_count = self._get_remaining_count(node, record_count, self._get_examine_count())
+            except Exception as e:
+                Logger.error('Failed to get record count of EVTX file %s (%s)'%(node, str(e)))
+                remaining_count = 0
+            node_counts.append(remaining_count)
+            if remaining_count is not None:
+                record_count += remaining_count
+        return node_counts
+    def _get_schedule(self, node_counts):
+        '''
+        Args:
+            node_counts: List<Integer>  => number of records to process from each node
+        Returns:
+            List<Integer>
+            Indices of nodes with records to process, in the order their
+            chunks should be submitted: streams first (as their size is
+            unknown), then the remaining files largest first, so that the
+            chunks of large files are spread over every worker and small
+            files fill in behind them instead of a large file being the
+            last thing left running
+            (or in frontier order when parsing inline, as output is then
+            written in the order chunks are submitted, or when the number of
+            records to output is limited, so the chunks parsed before the
+            limit is reached are the first chunks of the output)
+        Preconditions:
+            node_counts is of type List<Integer>    (assumed True)
+        '''
+        if getattr(self.args, 'inline', False) or self.limit is not None:
+            return [nodeidx for nodeidx in range(len(self.frontier)) if node_counts[nodeidx] != 0]
+        def node_weight(nodeidx):
+            node = self.frontier[nodeidx]
+            if node_counts[nodeidx] is None or not path.isfile(node):
+                return float('inf')
+            return path.getsize(node)
+        schedule = sorted(\
+            (nodeidx for nodeidx in range(len(self.frontier)) if node_counts[nodeidx] != 0),
+            key=node_weight,
+            reverse=True\
+        )
+        Logger.info('Scheduled %d of %d file(s) largest first'%(len(schedule), len(self.frontier)))
+        return schedule
+    def _add_file_tasks(self, evtx_file, nodeidx, remaining_count):
+        '''
+        Args:
+            evtx_file: EventLogX        => EVTX file to parse
+            nodeidx: Integer            => index of node (EVTX file) being parsed
+            remaining_count: Integer    => maximum number of records to process from file
+                                           (None to process up to self.args.count records)
+        Returns:
+            Integer
+            Number of records submitted to the parsing queue or skipped
+        Preconditions:
+            evtx_file is of type EventLogX      (assumed True)
+            nodeidx is of type Integer          (assumed True)
+            remaining_count is of type Integer  (assumed True)
+        '''
+        grep = getattr(self.args, 'grep', None)
+        keys = self._start_checkpoint(nodeidx)
+        if keys is not None and remaining_count is not None and self.journal.is_file_complete(self.journal.get_key(nodeidx), keys):
+            Logger.info('Skipping EVTX file %s (node %d) (completed by interrupted run)'%(self.frontier[nodeidx], nodeidx))
+            self._skip_records(nodeidx, remaining_count)
+            return remaining_count
+        if remaining_count is None:
+            remaining_count = self._get_examine_count()
+        record_count = 0
+        chunk_count = 0
+        for evtx_chunk in evtx_file.chunks:
+            if record_count >= remaining_count or self._limit_reached():
+                break
+            chunk_count += 1
+            count = min(evtx_chunk.record_count, remaining_count - record_count)
+            if keys is not None and self.journal.is_complete(keys, evtx_chunk.index):
+                Logger.info('Skipping EVTX chunk %d from node %d (completed by interrupted run)'%(evtx_chunk.index, nodeidx))
+                self._skip_records(nodeidx, count)
+            elif grep is not None and not grep.search(evtx_chunk.raw_chunk):
+                Logger.info('Skipping EVTX chunk %d from node %d (no keywords found)'%(evtx_chunk.index, nodeidx))
+                self._skip_records(nodeidx, count)
+                if keys is not None:
+                    self.journal.complete(keys, evtx_chunk.index, evtx_chunk.index + 1)
+            else:
+                self._add_tasks(self._stage_chunk(evtx_chunk.raw_chunk), nodeidx, evtx_chunk.index, count)
+                if self.tuner is not None:
+                    self.tuner.step()
+            if self.readahead is not None:
+                self.readahead.advance(self.frontier[nodeidx], EVTX_FILE_HEADER_SIZE + (evtx_chunk.index + 1) * EVTX_CHUNK_SIZE)
+            record_count += count
+        else:
+            if keys is not None:
+                self.journal.end_file(self.journal.get_key(nodeidx), chunk_count)
+        return record_count
+    def _get_max_threads(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Maximum number of parser workers that can be running at once
+            (all CPUs if the worker count is autotuned)
+        Preconditions:
+            N/A
+        '''
+        if getattr(self.args, 'inline', False):
+            return 1
+        return parallel.CPU_COUNT if getattr(self.args, 'autotune', False) else self.args.threads
+    def _should_inline(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Boolean
+            Whether the frontier is small enough (see --inline-below-mb) to parse
+            in this process, writing straight to the target, rather than start
+            worker processes and merge their output
+        Preconditions:
+            N/A
+        '''
+        inline_below_mb = getattr(self.args, 'inline_below_mb', 0)
+        if inline_below_mb == 0 or not all(path.isfile(node) for node in self.frontier):
+            return False
+        return sum(path.getsize(node) for node in self.frontier) <= inline_below_mb * 1024 * 1024
+    def _prepare_tuner(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Create the autotuner that scales the parser pool while chunks
+            are submitted, if the worker count is autotuned (--threads auto)
+        Preconditions:
+            The parser (and writer, if any) pools have been started
+        '''
+        if not getattr(self.args, 'autotune', False) or getattr(self.args, 'inline', False):
+            return
+        self.tuner = parallel.WorkerAutoTuner(\
+            self.pools.parser,
+            self.progress,
+            max_workers=self._get_max_threads(),
+            stalls=[self.pools.parser] + ([self.ring] if self.ring is not None else list()),
+            downstream=self.pools.get('writer')\
+        )
+    def _report_tuner(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Log the configuration the autotuner settled on, so it can be
+            pinned for repeat runs
+        Preconditions:
+            N/A
+        '''
+        if self.tuner is not None:
+            Logger.info('Autotuned configuration after %d change(s): --threads %d --batch-size %d --max-inflight-mb %d'%(\
+                self.tuner.changes,
+                self.pools.parser.worker_count,
+                self.args.batch_size,
+                self.args.max_inflight_mb\
+            ))
+    def _get_chunk_refs(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Number of tasks created for (and so releasing) each chunk
+        Preconditions:
+            N/A
+        '''
+        return 1
+    def _prepare_ring(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Create the shared memory ring chunks are handed to workers through,
+            sized to keep every worker busy within the in-flight memory budget
+            (workers receive chunks as pickled bytes if shared memory is unavailable)
+        Preconditions:
+            N/A
+        '''
+        slot_count = min(\
+            max(1, (self.args.max_inflight_mb * 1024 * 1024) // EVTX_CHUNK_SIZE),
+            4 * self._get_max_threads() * self.args.batch_size\
+        )
+        try:
+            self.ring = parallel.SharedChunkRing(slot_count, EVTX_CHUNK_SIZE)
+        except Exception as e:
+            Logger.warning('Failed to create shared memory ring, sending chunks through queue (%s)'%str(e))
+            self.ring = None
+    def _close_ring(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Destroy the shared memory ring (if any)
+        Preconditions:
+            All worker processes have been joined
+        '''
+        if self.ring is not None:
+            self.ring.close(unlink=True)
+            self.ring = None
+    def _stage_chunk(self, raw_chunk):
+        '''
+        Args:
+            raw_chunk: ByteString   => raw EVTX chunk
+        Returns:
+            Integer|ByteString
+            Index of ring slot raw_chunk was copied into (blocking until one
+            is free), or raw_chunk itself if there is no shared memory ring
+        Preconditions:
+            raw_chunk is of type ByteString (assumed True)
+        '''
+        if self.ring is None:
+            return raw_chunk
+        slot = self.ring.acquire(self._get_chunk_refs())
+        self.ring.write(slot, raw_chunk)
+        return slot
+    def _prepare_nodes(self, node_counts):
+        '''
+        Args:
+            node_counts: List<Integer>  => number of records to process from each node
+        Returns:
+            List<Integer>
+            Number of records to process from each node, after any per-file
+            setup (nodes set to 0 are skipped)
+        Preconditions:
+            node_counts is of type List<Integer>    (assumed True)
+        '''
+        return node_counts
+    def _start_pipeline(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Start the stages of self.pipeline (and the autotuner, if any)
+        Preconditions:
+            N/A
+        '''
+        self.pipeline.start()
+        self._prepare_tuner()
+    def _close_pipeline(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Wait for every task submitted to self.pipeline to be processed
+        Preconditions:
+            All tasks have been submitted
+        '''
+        self.pipeline.close()
+    def _stop_pipeline(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Release resources held for self.pipeline, whether or not
+            parsing finished (i.e. the shared memory ring)
+        Preconditions:
+            N/A
+        '''
+        self._close_ring()
     def _parse_loop(self):
         '''
         Args:
             N/A
         Procedure:
-            Main loop (parse files in frontier)
+            Main loop (parse files in frontier): submit the chunks of every
+            file to the pipeline in schedule order and wait for it to finish
         Preconditions:
             N/A
         '''
-        raise NotImplementedError('method _parse_loop not implemented for %s'%type(self).__name__)
+        node_counts = self._prepare_nodes(self._get_node_counts())
+        self._start_pipeline()
+        sampler = self._start_progress(node_counts)
+        try:
+            schedule = self._get_schedule(node_counts)
+            self._start_readahead(schedule)
+            for nodeidx in schedule:
+                if self._limit_reached():
+                    Logger.info('Output %d record(s), not parsing remaining files'%self.args.count)
+                    break
+                node = self.frontier[nodeidx]
+                Logger.info('Parsing EVTX file %s (node %d)'%(node, nodeidx))
+                self._add_file_tasks(EventLogX(node), nodeidx, node_counts[nodeidx])
+            self._close_pipeline()
+        finally:
+            self._stop_readahead()
+            sampler.stop()
+            self._stop_pipeline()
+        self._report_stage_stats()
+        self._report_tuner()
     def _parse_postamble(self):
         '''
         Args:
@@ -260,8 +1143,11 @@ class ParseDirectiveMixin(object):
             @BaseDirective.run_directive
         '''
         self._prepare_args()
+        self._prepare_filters()
         self._prepare_frontier()
         if self._should_parse():
+            self._prepare_journal()
+            self._prepare_limit()
             self._prepare_worker_pools()
             self._parse_preamble()
             self._parse_loop()
@@ -307,15 +1193,45 @@ class BaseParseFileOutputDirective(ParseDirectiveMixin, BaseDirective):
 
     def __init__(self, args):
         self._frontier = None
-        self._pools = None
+        self._pipeline = None
+        self._progress = None
+        self._ring = None
+        self._tuner = None
+        self._readahead = None
+        self._limit = None
+        self._journal = None
         super(BaseParseFileOutputDirective, self).__init__(args)
     def _prepare_args(self):
         '''
         @ParseDirectiveMixin._prepare_args
         '''
-        assert path.isdir(path.dirname(self.args.target)), 'Target does not point to existing directory'
-        self.args.target = path.abspath(self.args.target)
-        self.args.target_parent = path.dirname(self.args.target)
+        assert path.isdir(path.dirname(self.args.target)), 'Target does not point to existing directory'
+        self.args.target = path.abspath(self.args.target)
+        self.args.target_parent = path.dirname(self.args.target)
+        self._check_shard_args()
+    def _check_shard_args(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Check output can be sharded (if --shard-by is given)
+        Preconditions:
+            N/A
+        '''
+        if self._get_shard_by() is not None:
+            assert self.args.count == sys.maxsize, 'Cannot limit number of records output (--count) when sharding output'
+    def _get_shard_by(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            String
+            System field output is sharded by (see tasks.SHARD_FIELDS),
+            None if output is not sharded
+        Preconditions:
+            N/A
+        '''
+        return getattr(self.args, 'shard_by', None)
     def _prepare_frontier(self):
         '''
         @ParseDirectiveMixin._prepare_frontier
@@ -326,6 +1242,115 @@ class BaseParseFileOutputDirective(ParseDirectiveMixin, BaseDirective):
         @ParseDirectiveMixin._should_parse
         '''
         return len(self.frontier) > 0 and self.args.count > 0
+    def _get_quarantine_path(self):
+        '''
+        @ParseDirectiveMixin._get_quarantine_path
+        '''
+        return self.args.target + '.quarantine'
+    def _get_journal_path(self):
+        '''
+        @ParseDirectiveMixin._get_journal_path
+        '''
+        return self.args.target + '.journal'
+    def _get_spill_dirs(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<String>
+            Directories spill files are written to (in a subdirectory per
+            shard if output is sharded)
+        Preconditions:
+            N/A
+        '''
+        if self._get_shard_by() is not None:
+            return [self.args.target + '.shards']
+        return [self.args.target_parent]
+    def _get_output_dirs(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<String>
+            Directories spill files are written to (the shard directories
+            created so far if output is sharded)
+        Preconditions:
+            N/A
+        '''
+        if self._get_shard_by() is None:
+            return self._get_spill_dirs()
+        return [\
+            shard_dir \
+            for spill_dir in self._get_spill_dirs() \
+            for shard_dir in sorted(glob(path.join(spill_dir, '*'))) \
+            if path.isdir(shard_dir)\
+        ]
+    def _merge_spill_dir(self, spill_dir, target):
+        '''
+        Args:
+            spill_dir: String   => directory spill files were written to
+            target: String      => path of output file
+        Procedure:
+            Merge spill files in spill_dir into target, or the spill files
+            of each shard into the output file of the shard if output is
+            sharded (see get_shard_path)
+        Preconditions:
+            N/A
+        '''
+        if self._get_shard_by() is None:
+            self._merge_output(path.join(spill_dir, '*_tmp_aevtx.out'), target)
+            return
+        for shard_dir in sorted(glob(path.join(spill_dir, '*'))):
+            if path.isdir(shard_dir):
+                self._merge_output(\
+                    path.join(shard_dir, '*_tmp_aevtx.out'),
+                    parallel.get_shard_path(target, path.basename(shard_dir))\
+                )
+    def _remove_shard_dirs(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Remove the (emptied) shard directories once all output has
+            been merged and the spill files removed
+        Preconditions:
+            N/A
+        '''
+        if self._get_shard_by() is not None:
+            for shard_dir in self._get_output_dirs():
+                rmdir(shard_dir)
+    def _get_targets(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<String>
+            Paths of output files of this run (before sharding, see get_shard_path)
+        Preconditions:
+            N/A
+        '''
+        return [self.args.target]
+    def _discard_targets(self):
+        '''
+        @ParseDirectiveMixin._discard_targets
+        '''
+        filepaths = [self._get_quarantine_path()]
+        for target in self._get_targets():
+            filepaths.append(target)
+            if self._get_shard_by() is not None:
+                filepaths.extend(glob(parallel.get_shard_path(target, '*')))
+        for filepath in filepaths:
+            if path.isfile(filepath):
+                Logger.info('Removing %s (output of an earlier run)'%filepath)
+                remove(filepath)
+    def _discard_output(self, nodeidx=None):
+        '''
+        @ParseDirectiveMixin._discard_output
+        '''
+        prefix = '%08d_'%nodeidx if nodeidx is not None else ''
+        for output_dir in self._get_output_dirs():
+            for filepath in glob(path.join(output_dir, prefix + '*_tmp_aevtx.out')):
+                remove(filepath)
     def _get_task_kwargs(self):
         '''
         Args:
@@ -352,20 +1377,30 @@ class BaseParseFileOutputDirective(ParseDirectiveMixin, BaseDirective):
         '''
         @ParseDirectiveMixin._prepare_worker_pools
         '''
-        if self.pools is None:
-            self.pools = Container()
-        self.pools.progress = parallel.WorkerPool(\
-            parallel.JoinableQueue(-1), 
-            None,
-            daemonize=False,
-            worker_class=parallel.ProgressTrackerWorker,
-            worker_count=1\
-        )
-        self.pools.parser = parallel.WorkerPool(\
-            parallel.JoinableQueue(-1), 
-            self._TASK_CLASS, 
-            daemonize=False, 
+        self.pipeline = parallel.Pipeline()
+        self.progress = parallel.ProgressCounter(len(self.frontier))
+        self.args.inline = self._should_inline()
+        if self.args.inline:
+            Logger.info('Parsing %d file(s) in process (at most %d MB)'%(len(self.frontier), self.args.inline_below_mb))
+            self.pipeline.add_stage(\
+                'parser',
+                self._TASK_CLASS,
+                inline=True,
+                worker_kwargs=self._get_worker_kwargs(),
+                task_kwargs=self._get_task_kwargs()\
+            )
+            return
+        self._prepare_ring()
+        self.pipeline.add_stage(\
+            'parser',
+            self._TASK_CLASS,
             worker_count=self.args.threads,
+            batch_size=self.args.batch_size,
+            queue_size=self._get_queue_size(),
+            supervised=True,
+            on_retry=self._retry_task,
+            on_quarantine=self._quarantine_task,
+            on_error=self._drop_tasks,
             worker_kwargs=self._get_worker_kwargs(),
             task_kwargs=self._get_task_kwargs()\
         )
@@ -374,63 +1409,23 @@ class BaseParseFileOutputDirective(ParseDirectiveMixin, BaseDirective):
         @ParseDirectiveMixin._parse_preamble
         '''
         tqdm.set_lock(parallel.RLock())
-    def _add_tasks(self, evtx_record, nodeidx, recordidx):
-        '''
-        Args:
-            evtx_record: ByteString  => EVTX record to add to task
-            nodeidx: Integer        => index of node (EVTX file) being parsed
-            recordidx: Integer      => index of EVTX record being parsed
-        Procedure:
-            Add task(s) to parsing queue
-        Preconditions:
-            evtx_record is of type ByteString    (assumed True)
-            nodeidx is of type Integer          (assumed True)
-            recordidx is of type Integer        (assumed True)
-        '''
-        self.pools.parser.add_task(evtx_record, nodeidx, recordidx)
-    def _parse_loop(self):
+        for spill_dir in self._get_spill_dirs():
+            if not path.isdir(spill_dir):
+                mkdir(spill_dir)
+    def _add_tasks(self, evtx_chunk, nodeidx, chunkidx, count):
         '''
-        @ParseDirectiveMixin._parse_loop
+        @ParseDirectiveMixin._add_tasks
         '''
-        self.pools.parser.start()
-        record_count = 0
-        with tqdm(total=len(self.frontier), desc='Total', unit='files') as node_progress:
-            for nodeidx, node in enumerate(self.frontier):
-                Logger.info('Parsing EVTX file %s (node %d)'%(node, nodeidx))
-                evtx_file = EventLogX(node)
-                try:
-                    recordidx = 0
-                    remaining_count = self._get_remaining_count(node, record_count, self.args.count)
-                    if remaining_count > 0:
-                        self.pools.progress.worker_kwargs = dict(\
-                            pcount=remaining_count,
-                            pdesc='%d. %s'%(nodeidx, path.basename(node)),
-                            punit='records'\
-                        )
-                        self.pools.progress.refresh()
-                        self.pools.progress.start()
-                        for evtx_record in evtx_file.records:
-                            if remaining_count == 0:
-                                break
-                            self._add_tasks(evtx_record, nodeidx, recordidx)
-                            recordidx += 1
-                            remaining_count -= 1
-                finally:
-                    record_count += (recordidx + 1)
-                self.pools.parser.join_tasks()
-                self.pools.progress.join_tasks()
-                self.pools.progress.add_poison_pills()
-                self.pools.progress.join_workers()
-                node_progress.update(1)
-                if record_count >= self.args.count:
-                    break
-        self.pools.parser.add_poison_pills()
-        self.pools.parser.join_workers()
+        self.pipeline.submit(evtx_chunk, nodeidx, chunkidx, count=count, checkpoint=self._get_checkpoint(nodeidx))
     def _parse_postamble(self):
         '''
         @ParseDirectiveMixin._parse_postamble
         '''
-        parallel.coalesce_files(path.join(self.args.target_parent, '*_tmp_aevtx.out'), self.args.target)
+        self._merge_spill_dir(self._get_spill_dirs()[0], self.args.target)
+        self._finish_journal()
+        self._remove_shard_dirs()
+        if self._get_shard_by() is not None:
+            rmdir(self._get_spill_dirs()[0])
 
 class ParseCSVDirective(BaseParseFileOutputDirective):
     '''
@@ -442,12 +1437,23 @@ class ParseCSVDirective(BaseParseFileOutputDirective):
         '''
         @BaseParseFileOutputDirective._get_task_kwargs
         '''
-        return dict(info_type=self.args.info_type, target=self.args.target_parent, sep=self.args.sep)
+        return dict(\
+            info_type=self.args.info_type,
+            columns=self.args.columns,
+            target=self._get_spill_dirs()[0],
+            output=self.args.target if self.args.inline else None,
+            journal=self.journal.filepath if self.journal is not None else None,
+            compress=self.args.compress,
+            shard_by=self.args.shard_by,
+            sep=self.args.sep,
+            query=self.args.query,
+            grep=self.args.grep\
+        )
     def _get_worker_kwargs(self):
         '''
         @BaseParseFileOutputDirective._get_worker_kwargs
         '''
-        return dict(result_queue=self.pools.progress.queue, log_path=self.args.log_path)
+        return dict(progress=self.progress, ring=self.ring, limit=self.limit, log_path=self.args.log_path)
     def run(self):
         '''
         Args:
@@ -474,12 +1480,21 @@ class ParseJSONDirective(BaseParseFileOutputDirective):
         '''
         @BaseParseFileOutputDirective._get_task_kwargs
         '''
-        return dict(target=self.args.target_parent, pretty=self.args.pretty if self.args.threads == 1 else False)
+        return dict(\
+            target=self._get_spill_dirs()[0],
+            output=self.args.target if self.args.inline else None,
+            journal=self.journal.filepath if self.journal is not None else None,
+            compress=self.args.compress,
+            shard_by=self.args.shard_by,
+            pretty=self.args.pretty if self._get_max_threads() == 1 else False,
+            query=self.args.query,
+            grep=self.args.grep\
+        )
     def _get_worker_kwargs(self):
         '''
         @BaseParseFileOutputDirective._get_worker_kwargs
         '''
-        return dict(result_queue=self.pools.progress.queue, log_path=self.args.log_path)
+        return dict(progress=self.progress, ring=self.ring, limit=self.limit, log_path=self.args.log_path)
     def run(self):
         '''
         Args:
@@ -495,6 +1510,57 @@ class ParseJSONDirective(BaseParseFileOutputDirective):
         '''
         super(ParseJSONDirective, self).run()
 
+class ParseColumnarDirective(BaseParseFileOutputDirective):
+    '''
+    Directive for parsing EVTX file to a columnar file (see ColumnarReader)
+    '''
+    _TASK_CLASS = tasks.ParseColumnarTask
+
+    def _get_task_kwargs(self):
+        '''
+        @BaseParseFileOutputDirective._get_task_kwargs
+        '''
+        return dict(\
+            target=self.args.target_parent,
+            output=None,
+            journal=self.journal.filepath if self.journal is not None else None,
+            query=self.args.query,
+            grep=self.args.grep\
+        )
+    def _get_worker_kwargs(self):
+        '''
+        @BaseParseFileOutputDirective._get_worker_kwargs
+        '''
+        return dict(progress=self.progress, ring=self.ring, limit=self.limit, log_path=self.args.log_path)
+    def _merge_output(self, glob_pattern, target):
+        '''
+        @ParseDirectiveMixin._merge_output
+        NOTE:
+            target is written as a new columnar file (see merge_tagged_blocks)
+        '''
+        if self.journal is not None:
+            self.journal.begin_merge(target)
+        columnar.merge_tagged_blocks(\
+            glob_pattern,
+            target,
+            self.frontier,
+            clean=self.journal is None,
+            limit=self.limit.limit if self.limit is not None else None\
+        )
+    def run(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Parse EVTX information to columnar format
+        Preconditions:
+            @BaseDirective.run_directive
+            args.sources is of type List<String>        (assumed True)
+            args.target is of type String               (assumed True)
+            args.target points to existing directory
+        '''
+        super(ParseColumnarDirective, self).run()
+
 class ParseFILEDirective(BaseParseFileOutputDirective):
     '''
     Directive for parsing EVTX file to multiple output formats
@@ -508,6 +1574,22 @@ class ParseFILEDirective(BaseParseFileOutputDirective):
         assert len(self.args.target_name) > 0, 'Could not extract target filename from %s'%args.target
         self.args.target_parent = path.abspath(path.dirname(self.args.target))
         self.args.target = path.join(self.args.target_parent, self.args.target_name)
+        self._check_shard_args()
+    def _get_output_path(self, fmt):
+        '''
+        Args:
+            fmt: String => output format
+        Returns:
+            String
+            Path of output file for fmt (target with format extension, and
+            compression extension if compressing output)
+        Preconditions:
+            N/A
+        '''
+        output_path = self.args.target + '.' + fmt
+        if self.args.compress is not None:
+            output_path += parallel.COMPRESSED_EXTENSIONS[self.args.compress]
+        return output_path
     def _get_task_kwargs(self):
         '''
         @BaseParseFileOutputDirective._get_task_kwargs
@@ -517,82 +1599,73 @@ class ParseFILEDirective(BaseParseFileOutputDirective):
         '''
         @BaseParseFileOutputDirective._get_worker_kwargs
         '''
-        return dict(result_queue=self.pools.progress.queue, log_path=self.args.log_path)
-    def _parse_preamble(self):
-        '''
-        @ParseDirectiveMixin._parse_preamble
-        '''
-        tqdm.set_lock(parallel.RLock())
-        for fmt in self.args.formats:
-            mkdir(path.join(self.args.target_parent, fmt))
-    def _add_tasks(self, evtx_record, nodeidx, recordidx):
-        '''
-        @BaseParseFileOutputDirective._add_tasks
-        '''
-        for fmt in self.args.formats:
-            kwargs = dict(target=path.join(self.args.target_parent, fmt))
-            if fmt != 'json':
+        return dict(progress=self.progress, ring=self.ring, limit=self.limit, log_path=self.args.log_path)
+    def _add_tasks(self, evtx_chunk, nodeidx, chunkidx, count):
+        '''
+        @ParseDirectiveMixin._add_tasks
+        '''
+        for fmtidx, fmt in enumerate(self.args.formats):
+            kwargs = dict(\
+                target=path.join(self.args.target_parent, fmt),
+                outputidx=fmtidx,
+                output=self._get_output_path(fmt) if self.args.inline else None,
+                journal=self.journal.filepath if self.journal is not None else None,
+                checkpoint=self._get_checkpoint(nodeidx, fmt),
+                compress=self.args.compress,
+                shard_by=self.args.shard_by,
+                count=count,
+                query=self.args.query,
+                grep=self.args.grep\
+            )
+            if fmt == 'csv':
                 kwargs['sep'] = self.args.sep
-                if fmt == 'csv':
-                    kwargs['info_type'] = self.args.info_type
-            else:
-                kwargs['pretty'] = self.args.pretty if self.args.threads == 1 else False
-            self.pools.parser.add_task(\
+                kwargs['info_type'] = self.args.info_type
+                kwargs['columns'] = self.args.columns
+            elif fmt == 'json':
+                kwargs['pretty'] = self.args.pretty if self._get_max_threads() == 1 else False
+            self.pipeline.submit(\
                 getattr(tasks, 'Parse' + fmt.upper() + 'Task')(\
-                    evtx_record,
+                    evtx_chunk,
                     nodeidx,
-                    recordidx,
+                    chunkidx,
                     **kwargs\
                 ),
                 included=True\
             )
-    def _parse_loop(self):
+    def _get_progress_count(self, record_count):
         '''
-        @ParseDirectiveMixin._parse_loop
+        @ParseDirectiveMixin._get_progress_count
         '''
-        self.pools.parser.start()
-        record_count = 0
-        with tqdm(total=len(self.frontier), desc='Total', unit='files') as node_progress:
-            for nodeidx, node in enumerate(self.frontier):
-                Logger.info('Parsing EVTX file %s (node %d)'%(node, nodeidx))
-                evtx_file = EventLogX(node)
-                try:
-                    recordidx = 0
-                    remaining_count = self._get_remaining_count(node, record_count, self.args.count)
-                    if remaining_count > 0:
-                        self.pools.progress.worker_kwargs = dict(\
-                            pcount=remaining_count * len(self.args.formats),
-                            pdesc='%d. %s'%(nodeidx, path.basename(node)),
-                            punit='records'\
-                        )
-                        self.pools.progress.refresh()
-                        self.pools.progress.start()
-                        for evtx_record in evtx_file.records:
-                            if remaining_count == 0:
-                                break
-                            self._add_tasks(evtx_record, nodeidx, recordidx)
-                            recordidx += 1
-                            remaining_count -= 1
-                finally:
-                    record_count += (recordidx + 1)
-                self.pools.parser.join_tasks()
-                self.pools.progress.join_tasks()
-                self.pools.progress.add_poison_pills()
-                self.pools.progress.join_workers()
-                node_progress.update(1)
-                if record_count >= self.args.count:
-                    break
-        self.pools.parser.add_poison_pills()
-        self.pools.parser.join_workers()
+        return record_count * len(self.args.formats)
+    def _get_chunk_refs(self):
+        '''
+        @ParseDirectiveMixin._get_chunk_refs
+        '''
+        return len(self.args.formats)
+    def _get_checkpoint_outputs(self):
+        '''
+        @ParseDirectiveMixin._get_checkpoint_outputs
+        '''
+        return self.args.formats
+    def _get_targets(self):
+        '''
+        @BaseParseFileOutputDirective._get_targets
+        '''
+        return [self._get_output_path(fmt) for fmt in self.args.formats]
+    def _get_spill_dirs(self):
+        '''
+        @BaseParseFileOutputDirective._get_spill_dirs
+        '''
+        return [path.join(self.args.target_parent, fmt) for fmt in self.args.formats]
     def _parse_postamble(self):
         '''
         @ParseDirectiveMixin._parse_postamble
         '''
         for fmt in self.args.formats:
-            parallel.coalesce_files(\
-                path.join(self.args.target_parent, fmt, '*_tmp_aevtx.out'),
-                self.args.target + '.' + fmt\
-            )
+            self._merge_spill_dir(path.join(self.args.target_parent, fmt), self._get_output_path(fmt))
+        self._finish_journal()
+        self._remove_shard_dirs()
+        for fmt in self.args.formats:
             rmdir(path.join(self.args.target_parent, fmt))
 
 class ParseDBDirective(ParseDirectiveMixin, BaseDirective, DBConnectionMixin):
@@ -601,9 +1674,16 @@ class ParseDBDirective(ParseDirectiveMixin, BaseDirective, DBConnectionMixin):
     '''
     def __init__(self, args):
         self._frontier = None
-        self._pools = None
+        self._pipeline = None
+        self._progress = None
+        self._ring = None
+        self._tuner = None
+        self._readahead = None
+        self._limit = None
+        self._journal = None
         self._conn_string = None
         self._manager = None
+        self._metadata = None
         super(ParseDBDirective, self).__init__(args)
     @property
     def conn_string(self):
@@ -655,106 +1735,169 @@ class ParseDBDirective(ParseDirectiveMixin, BaseDirective, DBConnectionMixin):
         '''
         @ParseDirectiveMixin._prepare_worker_pools
         '''
-        if self.pools is None:
-            self.pools = Container()
-        self.pools.progress = parallel.WorkerPool(\
-            parallel.JoinableQueue(-1), 
-            tasks.ParseDBTaskStage2,
-            daemonize=False, 
-            worker_class=parallel.DBProgressTrackerWorker,
-            worker_count=1\
-        )
-        self.pools.parser = parallel.WorkerPool(\
-            parallel.JoinableQueue(-1), 
-            tasks.ParseDBTaskStage1, 
-            daemonize=False, 
+        self.pipeline = parallel.Pipeline()
+        self.progress = parallel.ProgressCounter(len(self.frontier))
+        self._prepare_ring()
+        self.pipeline.add_stage(\
+            'parser',
+            tasks.ParseDBTaskStage1,
             worker_count=self.args.threads,
+            batch_size=self.args.batch_size,
+            queue_size=self._get_queue_size(),
+            supervised=True,
+            on_retry=self._retry_task,
+            on_quarantine=self._quarantine_task,
+            on_error=self._drop_tasks,
             worker_kwargs=dict(\
-                result_queue=self.pools.progress.queue, 
+                progress=self.progress,
+                ring=self.ring,
+                limit=self.limit,
                 log_path=self.args.log_path\
             )
         )
+        self.pipeline.add_stage(\
+            'writer',
+            tasks.ParseDBTaskStage2,
+            worker_class=parallel.DBWriterWorker,
+            queue_size=self._get_queue_size()\
+        )
     def _parse_preamble(self):
         '''
         @ParseDirectiveMixin._parse_preamble
         '''
         tqdm.set_lock(parallel.RLock())
+    def _add_tasks(self, evtx_chunk, nodeidx, chunkidx, count):
+        '''
+        @ParseDirectiveMixin._add_tasks
+        '''
+        self.pipeline.submit(\
+            evtx_chunk,
+            nodeidx,
+            chunkidx,
+            self._metadata[nodeidx],
+            count=count,
+            query=self.args.query,
+            grep=self.args.grep,
+            journal=self.journal.filepath if self.journal is not None else None,
+            checkpoint=self._get_checkpoint(nodeidx)\
+        )
+    def _should_inline(self):
+        '''
+        @ParseDirectiveMixin._should_inline
+        NOTE:
+            the database is always written to by a separate writer process
+        '''
+        return False
+    def _should_checkpoint(self):
+        '''
+        @ParseDirectiveMixin._should_checkpoint
+        NOTE:
+            always, as the journal records which files are complete (see
+            _parse_postamble), keyed by the file ledger hashes of the files
+        '''
+        return True
+    def _get_journal_path(self):
+        '''
+        @ParseDirectiveMixin._get_journal_path
+        '''
+        return path.join(self.args.log_path, 'aevtx_%s.journal'%path.basename(self.args.db_name))
+    def _get_file_key(self, nodeidx):
+        '''
+        @ParseDirectiveMixin._get_file_key
+        '''
+        return self._metadata[nodeidx].sha2hash
+    def _get_file_metadata(self, node):
+        '''
+        Args:
+            node: String    => path to EVTX file
+        Returns:
+            Container<String, Any>
+            Metadata of EVTX file, including the id of its file ledger
+            entry (created if it does not exist), None if unable to
+            retrieve or create the file ledger entry
+        Preconditions:
+            node is of type String  (assumed True)
+        '''
+        try:
+            if self.manager.session is None:
+                try:
+                    self.manager.create_session()
+                except Exception as e:
+                    Logger.critical('Failed to establish database session (%s)'%str(e))
+                    return None
+            metadata = EventLogX(node).get_metadata()
+            fileledger = self.manager.query(db.FileLedger, sha2hash=metadata.sha2hash).first()
+            if fileledger is not None:
+                for field in metadata:
+                    metadata[field] = getattr(fileledger, field)
+                metadata.id = fileledger.id
+                metadata.completed = fileledger.completed
+            else:
+                fileledger = db.FileLedger().populate_fields(metadata)
+                try:
+                    self.manager.add(fileledger, commit=True)
+                except Exception as e:
+                    Logger.error('Failed to add metadata for %s to database (%s)'%(node, str(e)))
+                    return None
+                else:
+                    metadata.id = fileledger.id
+        except Exception as e:
+            Logger.error('Failed to get metadata for file %s (%s)'%(node, str(e)))
+            return None
+        return metadata
+    def _prepare_nodes(self, node_counts):
+        '''
+        @ParseDirectiveMixin._prepare_nodes
+        NOTE:
+            gets (or creates) the file ledger entry of every file to parse,
+            skipping files that could not be added to the database and,
+            if resuming, files already completed
+        '''
+        self._metadata = list()
+        for nodeidx, node in enumerate(self.frontier):
+            metadata = self._get_file_metadata(node) if node_counts[nodeidx] != 0 else None
+            if metadata is None:
+                node_counts[nodeidx] = 0
+            elif self.args.resume and metadata.get('completed'):
+                Logger.info('Skipping EVTX file %s (node %d) (already in database)'%(node, nodeidx))
+                node_counts[nodeidx] = 0
+            self._metadata.append(metadata)
+        self.manager.close_session()
+        self.manager.engine.dispose()
+        self.pools.writer.worker_kwargs = dict(\
+            log_path=self.args.log_path,
+            progress=self.progress,
+            manager=DBManager(conn_string=self.conn_string)\
+        )
+        return node_counts
     def _parse_loop(self):
         '''
         @ParseDirectiveMixin._parse_loop
         '''
         try:
-            self.pools.parser.start()
-            record_count = 0
-            with tqdm(total=len(self.frontier), desc='Total', unit='files') as node_progress:
-                for nodeidx, node in enumerate(self.frontier):
-                    Logger.info('Parsing EVTX file %s (node %d)'%(node, nodeidx))
-                    evtx_file = EventLogX(node)
-                    try:
-                        recordidx = 0
-                        remaining_count = self._get_remaining_count(node, record_count, self.args.count)
-                        if remaining_count > 0:
-                            try:
-                                if self.manager.session is None:
-                                    try:
-                                        self.manager.create_session()
-                                    except Exception as e:
-                                        Logger.critical('Failed to establish database session (%s)'%str(e))
-                                        break
-                                metadata = evtx_file.get_metadata()
-                                fileledger = self.manager.query(db.FileLedger, sha2hash=metadata.sha2hash).first()
-                                if fileledger is not None:
-                                    for field in metadata:
-                                        metadata[field] = getattr(fileledger, field)
-                                    metadata.id = fileledger.id
-                                else:
-                                    fileledger = db.FileLedger().populate_fields(metadata)
-                                    try:
-                                        self.manager.add(fileledger, commit=True)
-                                    except Exception as e:
-                                        Logger.error('Failed to add metadata for %s to database (%s)'%(node, str(e)))
-                                        continue
-                                    else:
-                                        metadata.id = fileledger.id
-                            except Exception as e:
-                                Logger.error('Failed to get metadata for file %s (%s)'%(node, str(e)))
-                                continue
-                            else:
-                                self.manager.close_session()
-                                self.manager.engine.dispose()
-                                self.pools.progress.worker_kwargs = dict(\
-                                    log_path=self.args.log_path,
-                                    pcount=remaining_count,
-                                    pdesc='%d. %s'%(nodeidx, path.basename(node)),
-                                    punit='records',
-                                    manager=DBManager(conn_string=self.conn_string)\
-                                )
-                                self.pools.progress.refresh()
-                                self.pools.progress.start()
-                                for evtx_record in evtx_file.records:
-                                    if remaining_count == 0:
-                                        break
-                                    self.pools.parser.add_task(evtx_record, nodeidx, recordidx, metadata)
-                                    recordidx += 1
-                                    remaining_count -= 1
-                    finally:
-                        record_count += (recordidx + 1)
-                    self.pools.parser.join_tasks()
-                    self.pools.progress.join_tasks()
-                    self.pools.progress.add_poison_pills()
-                    self.pools.progress.join_workers()
-                    node_progress.update(1)
-                    if record_count >= self.args.count:
-                        break
-            self.pools.parser.add_poison_pills()
-            self.pools.parser.join_workers()
+            super(ParseDBDirective, self)._parse_loop()
         finally:
             self.manager.close_session()
     def _parse_postamble(self):
         '''
         @ParseDirectiveMixin._parse_postamble
         '''
-        pass
+        journal = CheckpointJournal(self.journal.filepath)
+        journal.load()
+        try:
+            self.manager.create_session()
+            for metadata in self._metadata:
+                if metadata is None or metadata.get('completed') or \
+                    not journal.is_file_complete(metadata.sha2hash, [metadata.sha2hash]):
+                    continue
+                fileledger = self.manager.query(db.FileLedger, id=metadata.id).first()
+                fileledger.completed = True
+                self.manager.commit()
+        except Exception as e:
+            Logger.error('Failed to mark parsed files as completed in database (%s)'%str(e))
+        finally:
+            self.manager.close_session()
+        self._finish_journal()
     def run(self):
         '''
         Args:
@@ -835,3 +1978,302 @@ class DBQueryDirective(BaseDirective, DBConnectionMixin):
                             print(self.args.sep.join([str(item) for item in result]))
             else:
                 Logger.info('No results found for query %s'%self.args.query)
+
+class ServeDirective(BaseParseFileOutputDirective):
+    '''
+    Directive for coordinating parsing of EVTX files by remote workers
+    (see WorkerDirective). Ranges of chunks from one file are leased to
+    workers over TCP (multiprocessing.connection) along with the raw
+    chunks, workers send back the output records, and each completed
+    range is spilled to its own file and merged in order at the end.
+    '''
+    _TASK_CLASSES = dict(csv='ParseCSVTask', json='ParseJSONTask')
+
+    def __init__(self, args):
+        self._leases = None
+        self._unit = None
+        self._listener = None
+        super(ServeDirective, self).__init__(args)
+    def _get_task_kwargs(self):
+        '''
+        @BaseParseFileOutputDirective._get_task_kwargs
+        '''
+        task_kwargs = dict(target=None, query=self.args.query, grep=self.args.grep)
+        if self.args.format == 'csv':
+            task_kwargs.update(info_type=self.args.info_type, columns=self.args.columns, sep=self.args.sep)
+        else:
+            task_kwargs.update(pretty=False)
+        return task_kwargs
+    def _get_worker_kwargs(self):
+        '''
+        @BaseParseFileOutputDirective._get_worker_kwargs
+        '''
+        return dict()
+    def _should_inline(self):
+        '''
+        @ParseDirectiveMixin._should_inline
+        NOTE:
+            chunks are always parsed by workers
+        '''
+        return False
+    def _discard_output(self, nodeidx=None):
+        '''
+        @BaseParseFileOutputDirective._discard_output
+        '''
+        super(ServeDirective, self)._discard_output(nodeidx)
+        if nodeidx is None:
+            for filepath in glob(path.join(self.args.target_parent, '*_tmp_aevtx.part')):
+                remove(filepath)
+    def _prepare_worker_pools(self):
+        '''
+        @ParseDirectiveMixin._prepare_worker_pools
+        '''
+        self.pipeline = parallel.Pipeline()
+        self.progress = parallel.ProgressCounter(len(self.frontier))
+        self.args.inline = self._should_inline()
+        self._leases = LeaseTable(\
+            self.args.lease_timeout,
+            max(1, (self.args.max_inflight_mb * 1024 * 1024) // (EVTX_CHUNK_SIZE * self.args.lease_chunks))\
+        )
+    def _parse_preamble(self):
+        '''
+        @ParseDirectiveMixin._parse_preamble
+        '''
+        super(ServeDirective, self)._parse_preamble()
+        self._listener = Listener(self.args.bind, authkey=self.args.authkey.encode('utf8'))
+        Thread(target=self._accept_workers, daemon=True).start()
+        Logger.info('Serving leases on %s:%d'%self.args.bind)
+    def _accept_workers(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Accept worker connections until the listener is closed,
+            serving each from its own thread
+        Preconditions:
+            N/A
+        '''
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._listener is None:
+                    break
+                Logger.warning('Failed to accept worker connection (%s)'%str(e))
+                continue
+            Thread(target=self._serve_worker, args=(conn,), daemon=True).start()
+    def _serve_worker(self, conn):
+        '''
+        Args:
+            conn: Connection    => connection to worker
+        Procedure:
+            Answer lease requests and results sent by worker until it disconnects:
+                ('lease',)                          => ('lease', unit), ('wait', seconds) or ('done',)
+                ('result', unitid, chunk_results)   => ('ok', accepted)
+            then release the units still leased to worker, so they are leased
+            again at once instead of once their leases expire
+        Preconditions:
+            N/A
+        '''
+        try:
+            while True:
+                request = conn.recv()
+                if request[0] == 'lease':
+                    unit = self._leases.acquire(conn)
+                    if unit is not None:
+                        conn.send(('lease', unit))
+                    elif self._leases.finished:
+                        conn.send(('done',))
+                    else:
+                        conn.send(('wait', 0.5))
+                elif request[0] == 'result':
+                    conn.send(('ok', self._complete_unit(request[1], request[2])))
+        except EOFError:
+            pass
+        except Exception as e:
+            Logger.error('Lost connection to worker (%s)'%str(e))
+        finally:
+            released = self._leases.release(conn)
+            if released > 0:
+                Logger.warning('Worker disconnected holding %d lease(s), requeueing them'%released)
+            conn.close()
+    def _complete_unit(self, unitid, chunk_results):
+        '''
+        Args:
+            unitid: Integer                                             => ID of completed unit
+            chunk_results: List<Tuple<Integer, Integer, List<Tuple>>>   => chunk index, number of
+                                                                           records examined and
+                                                                           results of each chunk
+        Returns:
+            Boolean
+            Whether the results were accepted (False if another worker
+            already completed the unit after this worker's lease expired)
+        Preconditions:
+            N/A
+        '''
+        part_file = path.join(self.args.target_parent, '%s_tmp_aevtx.part'%uuid4())
+        if self.args.compress is not None:
+            with open(part_file, 'wb') as f:
+                for chunkidx, record_count, results in chunk_results:
+                    lines = [result for recordidx, result in results]
+                    f.write(parallel.tag_member(parallel.compress_results(lines, self.args.compress), lines, chunkidx))
+        else:
+            with open(part_file, 'w') as f:
+                for chunkidx, record_count, results in chunk_results:
+                    for recordidx, result in results:
+                        f.write(parallel.tag_result(result, chunkidx, recordidx))
+        unit = self._leases.complete(unitid, lambda unit: self._commit_unit(unit, part_file))
+        if unit is None:
+            remove(part_file)
+            return False
+        for chunkidx, record_count, results in chunk_results:
+            self.progress.increment(unit.nodeidx, record_count)
+            if self.limit is not None:
+                self.limit.add(len(results))
+        Logger.info('Completed unit %d (%d chunk(s) from node %d)'%(unitid, len(unit.chunks), unit.nodeidx))
+        return True
+    def _commit_unit(self, unit, part_file):
+        '''
+        Args:
+            unit: Container<String, Any>    => unit completed for the first time
+            part_file: String               => path of file results of unit were written to
+        Procedure:
+            Move results of unit to the spill file merged into the target and
+            checkpoint its chunks
+        Preconditions:
+            Called by LeaseTable.complete
+        '''
+        rename(part_file, path.join(self.args.target_parent, '%08d_lease_%08d_tmp_aevtx.out'%(unit.nodeidx, unit.chunks[0].chunkidx)))
+        if unit.checkpoint is not None:
+            for chunk in unit.chunks:
+                self.journal.complete([unit.checkpoint], chunk.chunkidx, chunk.chunkidx + 1)
+    def _flush_unit(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Make the chunks collected so far available to lease (blocking
+            while the in-flight memory budget is used by outstanding units)
+        Preconditions:
+            N/A
+        '''
+        if self._unit is not None:
+            self._leases.add(self._unit)
+            self._unit = None
+    def _add_tasks(self, evtx_chunk, nodeidx, chunkidx, count):
+        '''
+        @ParseDirectiveMixin._add_tasks
+        '''
+        if self._unit is not None and (self._unit.nodeidx != nodeidx or len(self._unit.chunks) >= self.args.lease_chunks):
+            self._flush_unit()
+        if self._unit is None:
+            self._unit = Container(\
+                nodeidx=nodeidx,
+                checkpoint=self._get_checkpoint(nodeidx),
+                task=self._TASK_CLASSES[self.args.format],
+                context=self._get_task_kwargs(),
+                chunks=list()\
+            )
+        self._unit.chunks.append(Container(chunkidx=chunkidx, raw_chunk=bytes(evtx_chunk), count=count))
+    def _start_pipeline(self):
+        '''
+        @ParseDirectiveMixin._start_pipeline
+        NOTE:
+            chunks are leased to remote workers instead of run by local stages
+        '''
+        pass
+    def _close_pipeline(self):
+        '''
+        @ParseDirectiveMixin._close_pipeline
+        '''
+        self._flush_unit()
+        self._leases.close()
+        self._leases.wait_finished()
+    def _stop_pipeline(self):
+        '''
+        @ParseDirectiveMixin._stop_pipeline
+        '''
+        listener, self._listener = self._listener, None
+        listener.close()
+    def run(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Lease EVTX chunks to workers and write their results to a CSV or JSON file
+        Preconditions:
+            @BaseDirective.run_directive
+            self.args.format is one of csv or json          (assumed True)
+            self.args.bind is of type Tuple<String, Integer> (assumed True)
+            self.args.authkey is of type String             (assumed True)
+            self.args.lease_chunks is of type Integer > 0
+            self.args.lease_timeout is of type Float > 0
+        '''
+        assert self.args.lease_chunks > 0, 'Lease_chunks is not greater than 0'
+        assert self.args.lease_timeout > 0, 'Lease_timeout is not greater than 0'
+        super(ServeDirective, self).run()
+
+class WorkerDirective(BaseDirective):
+    '''
+    Directive for parsing chunks leased from a coordinator (see ServeDirective)
+    '''
+    def _lease_loop(self, log=False):
+        '''
+        Args:
+            log: Boolean    => whether to log to a worker log file (i.e. in a child process)
+        Procedure:
+            Request leases from the coordinator, parse their chunks and send
+            back the output records until the coordinator has no more work
+        Preconditions:
+            N/A
+        '''
+        worker = parallel.InlineWorker(name=str(uuid4()))
+        if log:
+            initialize_logger(self.args.log_path, worker.name + '_tmp_aevtx')
+        try:
+            conn = Client(self.args.connect, authkey=self.args.authkey.encode('utf8'))
+        except Exception as e:
+            Logger.error('Failed to connect to coordinator at %s:%d (%s)'%(self.args.connect + (str(e),)))
+            return
+        try:
+            while True:
+                conn.send(('lease',))
+                reply = conn.recv()
+                if reply[0] == 'done':
+                    break
+                elif reply[0] == 'wait':
+                    sleep(reply[1])
+                    continue
+                unit = reply[1]
+                task_class = getattr(tasks, unit.task)
+                chunk_results = list()
+                for chunk in unit.chunks:
+                    task = task_class(chunk.raw_chunk, unit.nodeidx, chunk.chunkidx, count=chunk.count, **unit.context)
+                    results = task.collect_results(worker)
+                    chunk_results.append((chunk.chunkidx, task.record_count, results))
+                conn.send(('result', unit.unitid, chunk_results))
+                if not conn.recv()[1]:
+                    Logger.warning('Coordinator discarded results of unit %d (lease expired)'%unit.unitid)
+        except (EOFError, OSError):
+            Logger.warning('Coordinator closed connection')
+        finally:
+            conn.close()
+    def run(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Run self.args.threads lease loops (in worker processes if more than one)
+        Preconditions:
+            @BaseDirective.run_directive
+            self.args.connect is of type Tuple<String, Integer>
+            self.args.authkey is of type String
+        '''
+        if self.args.threads == 1:
+            self._lease_loop()
+            return
+        workers = [Process(target=self._lease_loop, kwargs=dict(log=True)) for i in range(self.args.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -55,3 +55,17 @@ class PathInitializationError(BaseCustomException):
     directory to sys.path
     '''
     _MESSAGE = 'Unable to append lib directory to path (%(err)s)'
+
+class QueryCompilationError(BaseCustomException):
+    '''
+    Exception thrown when unable to compile an XPath
+    event query into a record predicate
+    '''
+    _MESSAGE = 'Unable to compile query (%(err)s)'
+
+class ParseCancelledError(BaseCustomException):
+    '''
+    Exception thrown to stop submitting chunks once
+    the consumer of parsed records has stopped
+    '''
+    _MESSAGE = 'Parsing was cancelled (%(err)s)'
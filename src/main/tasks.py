@@ -23,7 +23,9 @@
 
 import logging
 Logger = logging.getLogger(__name__)
-from os import path
+import re
+import csv
+from os import path, makedirs
 from hashlib import md5
 from itertools import chain as itertools_chain
 from datetime import datetime, timezone, timedelta
@@ -31,7 +33,32 @@ from json import dumps
 from construct.lib import Container
 
 import src.database.models as db
-from src.parsers.evtx import EventLogXRecord
+from src.parsers.evtx import EventLogXChunk
+from src.utils.parallel import tag_result, tag_member, compress_results, get_shard_path
+from src.utils.jsonl import JSONLinesEncoder
+from src.utils.columnar import encode_block, tag_block
+from src.utils.checkpoint import append_checkpoint
+
+SHARD_FIELDS = dict(channel='Channel', provider='Provider', event_id='EventID', computer='Computer')
+## Columns of CSV summary output, in default order: EventRecordID and WriteTime
+## come from the record header, EventData is the EventData (or UserData) section
+## encoded as JSON and the rest are System fields
+SUMMARY_COLUMNS = (\
+    'EventRecordID',
+    'WriteTime',
+    'EventID',
+    'Level',
+    'Task',
+    'Opcode',
+    'Keywords',
+    'Provider',
+    'Channel',
+    'Computer',
+    'ProcessID',
+    'ThreadID',
+    'UserID',
+    'EventData'\
+)
 
 class BaseParseTask(object):
     '''
@@ -110,10 +137,13 @@ class BaseParseFileOutputTask(BaseParseTask):
     '''
     NULL = ''
 
-    def __init__(self, source, nodeidx, recordidx, **context):
+    def __init__(self, source, nodeidx, chunkidx, **context):
         super(BaseParseFileOutputTask, self).__init__(source)
         self._nodeidx = nodeidx
-        self._recordidx = recordidx
+        self._chunkidx = chunkidx
+        self._record_count = 0
+        self._chunk = None
+        self._shards = None
         if 'target' not in context:
             raise KeyError('target was not provided as a keyword argument')
         self._context = Container(**context)
@@ -132,19 +162,25 @@ class BaseParseFileOutputTask(BaseParseTask):
         '''
         raise AttributeError('nodeidx attribute must be set in the constructor')
     @property
-    def recordidx(self):
+    def chunkidx(self):
         '''
-        @recordidx.getter
+        @chunkidx.getter
         '''
-        return self._recordidx
-    @recordidx.setter
-    def recordidx(self, value):
+        return self._chunkidx
+    @chunkidx.setter
+    def chunkidx(self, value):
         '''
-        @recordidx.setter
+        @chunkidx.setter
         Preconditions:
             N/A
         '''
-        raise AttributeError('recordidx attribute must be set in the constructor')
+        raise AttributeError('chunkidx attribute must be set in the constructor')
+    @property
+    def record_count(self):
+        '''
+        @record_count.getter
+        '''
+        return self._record_count
     @property
     def context(self):
         '''
@@ -163,81 +199,548 @@ class BaseParseFileOutputTask(BaseParseTask):
             self._context = value
         else:
             raise AttributeError('context attribute has already been set')
+    def _get_chunk(self, worker):
+        '''
+        Args:
+            worker: BaseQueueWorker => worker that called this task
+        Returns:
+            ByteString|memoryview
+            Raw EVTX chunk, read directly out of the worker's shared memory
+            ring if the source is a ring slot index
+        Preconditions:
+            worker is subclass of BaseQueueWorker
+        '''
+        if isinstance(self.source, int):
+            return worker.ring.view(self.source)
+        return self.source
+    def __call__(self, worker):
+        '''
+        @BaseParseTask.__call__
+        '''
+        try:
+            self._chunk = self._get_chunk(worker)
+            return super(BaseParseFileOutputTask, self).__call__(worker)
+        finally:
+            self._chunk = None
+            if isinstance(self.source, int):
+                worker.ring.release(self.source)
+    def _write_checkpoint(self, writer=None):
+        '''
+        Args:
+            writer: OutputWriter    => writer the output of this task was written to
+        Procedure:
+            Record this task's chunk as complete in the checkpoint journal
+            (context.journal) under context.checkpoint, if given (once writer
+            has synced the output to disk if writer is given)
+        Preconditions:
+            The output of this task has been written
+        '''
+        journal = self.context.get('journal')
+        checkpoint = self.context.get('checkpoint')
+        if journal is not None and checkpoint is not None:
+            if writer is not None:
+                writer.add_checkpoint(journal, checkpoint, self.chunkidx, self.chunkidx + 1)
+                return
+            try:
+                append_checkpoint(journal, checkpoint, self.chunkidx, self.chunkidx + 1)
+            except Exception as e:
+                Logger.error('Failed to checkpoint EVTX chunk %d from node %d (%s)'%(self.chunkidx, self.nodeidx, str(e)))
+    def _limit_results(self, worker, results, reserve=False):
+        '''
+        Args:
+            worker: BaseQueueWorker => worker that called this task
+            results: List<Any>      => results about to be output
+            reserve: Boolean        => whether to drop results past the limit, rather
+                                       than leave them to be dropped when merging
+        Returns:
+            List<Any>
+            results, counted against the record limit of worker (if any) for
+            output context.outputidx (0 if not given), and truncated to fit
+            within it if reserve is True
+        Preconditions:
+            N/A
+        '''
+        if worker.limit is None:
+            return results
+        outputidx = self.context.get('outputidx', 0)
+        if reserve:
+            return results[:worker.limit.reserve(len(results), outputidx)]
+        worker.limit.add(len(results), outputidx)
+        return results
+    def _format_result(self, result):
+        '''
+        Args:
+            result: Any => entry of result set
+        Returns:
+            String
+            Output record for result (fields joined by context.sep if given)
+        Preconditions:
+            N/A
+        '''
+        if 'sep' in self.context:
+            return self.context.sep.join(result)
+        return result
+    def _format_results(self, results):
+        '''
+        Args:
+            results: List<Tuple<Integer, Any>>  => record ID and entry of result set of
+                                                   each result
+        Returns:
+            List<Tuple<Integer, String>>
+            Record ID and output record of each result that could be
+            formatted (see _format_result)
+        Preconditions:
+            N/A
+        '''
+        formatted = list()
+        for recordidx, result in results:
+            try:
+                formatted.append((recordidx, self._format_result(result)))
+            except Exception as e:
+                Logger.error('Failed to format result for EVTX record %d in chunk %d from node %d (%s)'%(recordidx, self.chunkidx, self.nodeidx, str(e)))
+        return formatted
+    def collect_results(self, worker):
+        '''
+        Args:
+            worker: Any => worker running this task (i.e. InlineWorker)
+        Returns:
+            List<Tuple<Integer, String>>
+            Record ID and output record of each result, for callers that
+            write (or send) output themselves instead of calling this task
+        Preconditions:
+            N/A
+        '''
+        try:
+            self._chunk = self._get_chunk(worker)
+            self.extract_resultset(worker)
+            return self._format_results(self.result_set)
+        finally:
+            self._chunk = None
+    def _get_shard(self, evtx_record):
+        '''
+        Args:
+            evtx_record: EventLogXRecord    => record to get shard of
+        Returns:
+            String
+            Name of shard record is output to: the System field selected by
+            context.shard_by (see SHARD_FIELDS), with any run of characters
+            other than letters, digits, underscores and dashes replaced by
+            an underscore so it can be used in a file name (none if empty)
+        Preconditions:
+            context.shard_by is a key of SHARD_FIELDS   (assumed True)
+        '''
+        value = evtx_record.get_system_field(SHARD_FIELDS[self.context.shard_by])
+        shard = re.sub(r'[^\w-]+', '_', str(value)) if value is not None else ''
+        return shard if len(shard) > 0 else 'none'
+    def _get_records(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Gen<EventLogXRecord>
+            Records in source chunk that contain any of the keywords and
+            satisfy the query in the task context (if any), examining at
+            most context.count records. If output is sharded, the shard
+            of each record is kept by record ID (see _get_shard)
+        Preconditions:
+            Called from within __call__ (so self._chunk is set)
+        '''
+        query = self.context.get('query')
+        grep = self.context.get('grep')
+        count = self.context.get('count')
+        shard_by = self.context.get('shard_by')
+        self._record_count = 0
+        self._shards = dict()
+        for evtx_record in EventLogXChunk(self._chunk, self.chunkidx).records:
+            if count is not None and self._record_count >= count:
+                break
+            self._record_count += 1
+            if grep is not None and not grep.search(evtx_record.raw_entry):
+                continue
+            try:
+                if query is not None and not query.matches(evtx_record):
+                    continue
+            except Exception as e:
+                Logger.error('Failed to apply query to EVTX record %d in chunk %d from node %d (%s)'%(self._record_count - 1, self.chunkidx, self.nodeidx, str(e)))
+                continue
+            if shard_by is not None:
+                try:
+                    self._shards[evtx_record.get_record_id()] = self._get_shard(evtx_record)
+                except Exception as e:
+                    Logger.error('Failed to get shard of EVTX record %d in chunk %d from node %d (%s)'%(self._record_count - 1, self.chunkidx, self.nodeidx, str(e)))
+                    continue
+            yield evtx_record
+        if count is not None and self._record_count < count:
+            ## Records the chunk header claims but that could not be read are
+            ## reported as examined so progress for the node still completes
+            self._record_count = count
+    def _is_binary(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Boolean
+            Whether output is written in binary mode (i.e. compressed)
+        Preconditions:
+            N/A
+        '''
+        return self.context.get('compress') is not None
+    def _write_results(self, writer, results, output):
+        '''
+        Args:
+            writer: OutputWriter                => writer to write results to
+            results: List<Tuple<Integer, Any>>  => record ID and entry of result set of
+                                                   each result to write
+            output: String                      => path of output file if writing
+                                                   straight to it, None if writing to
+                                                   a spill file
+        Returns:
+            Integer
+            Number of results written
+        Preconditions:
+            len(results) > 0
+        '''
+        compress = self.context.get('compress')
+        lines = list()
+        for recordidx, result in self._format_results(results):
+            if output is not None or compress is not None:
+                lines.append(result)
+            else:
+                lines.append(tag_result(result, self.chunkidx, recordidx))
+        if compress is not None:
+            member = compress_results(lines, compress)
+            writer.write(member if output is not None else tag_member(member, lines, self.chunkidx))
+        elif output is not None:
+            writer.write(''.join(result + '\n' for result in lines))
+        else:
+            writer.write(''.join(lines))
+        return len(lines)
+    def _get_target_file(self, worker, shard=None):
+        '''
+        Args:
+            worker: BaseQueueWorker => worker that called this task
+            shard: String           => shard of results (None if output is not sharded)
+        Returns:
+            String
+            Path of file to write results to: context.output (or its shard)
+            if writing straight to the output file, else the spill file of
+            worker (in the directory of shard, which is created if needed)
+        Preconditions:
+            N/A
+        '''
+        output = self.context.get('output')
+        if output is not None:
+            return output if shard is None else get_shard_path(output, shard)
+        target = self.context.target
+        if shard is not None:
+            target = path.join(target, shard)
+            makedirs(target, exist_ok=True)
+        if self.context.get('retry'):
+            return path.join(target, '%08d_retry_%08d_%s_tmp_aevtx.out'%(self.nodeidx, self.chunkidx, worker.name))
+        return path.join(target, '%08d_%s_tmp_aevtx.out'%(self.nodeidx, worker.name))
     def process_resultset(self, worker):
         '''
         @BaseParseTask.process_resultset
         '''
-        target_file = path.join(self.context.target, '%s_tmp_amft.out'%worker.name)
+        output = self.context.get('output')
         try:
-            if len(self.result_set) > 0:
-                successful_results = 0
-                with open(target_file, 'a') as f:
-                    for result in self.result_set:
-                        try:
-                            if 'sep' in self.context:
-                                f.write(self.context.sep.join(result) + '\n')
-                            else:
-                                f.write(result + '\n')
-                            successful_results += 1
-                        except Exception as e:
-                            Logger.error('Failed to write result for EVTX record %d from node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
+            results = self._limit_results(worker, self.result_set, output is not None)
+            if self.context.get('shard_by') is None:
+                writer = worker.writers.get(self._get_target_file(worker), binary=self._is_binary())
+                written = self._write_results(writer, results, output) if len(results) > 0 else 0
+            else:
+                writer = worker.writers
+                shards = dict()
+                for result in results:
+                    shards.setdefault(self._shards[result[0]], list()).append(result)
+                written = 0
+                for shard, shard_results in shards.items():
+                    written += self._write_results(worker.writers.get(self._get_target_file(worker, shard), binary=self._is_binary()), shard_results, output)
         except Exception as e:
-            Logger.error('Failed to write results for EVTX record %d from node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
+            Logger.error('Failed to write results for EVTX chunk %d from node %d (%s)'%(self.chunkidx, self.nodeidx, str(e)))
         else:
-            Logger.info('Successfully wrote %d result(s) for EVTX record %d from node %d'%(successful_results, self.recordidx, self.nodeidx))
+            Logger.info('Successfully wrote %d result(s) for EVTX chunk %d from node %d'%(written, self.chunkidx, self.nodeidx))
+            self._write_checkpoint(writer)
         finally:
-            return [True]
+            if worker.progress is not None:
+                worker.progress.increment(self.nodeidx, self.record_count)
+            return list()
+
+class _RowBuffer(list):
+    '''
+    List that csv.writer can write to, collecting each row it writes
+    (the writer writes every row in one call) as a separate entry
+    '''
+    write = list.append
 
 class ParseCSVTask(BaseParseFileOutputTask):
     '''
-    Class for parsing single EVTX record to CSV format
+    Class for parsing EVTX chunk to CSV format. Summary output only decodes
+    the parts of each record its columns (context.columns, SUMMARY_COLUMNS
+    if not given) need, so EventData is only rendered if it is selected
     '''
+    _encoder = JSONLinesEncoder()
+    def _get_summary_value(self, evtx_record, column):
+        '''
+        Args:
+            evtx_record: EventLogXRecord    => record to get value of column from
+            column: String                  => summary column (see SUMMARY_COLUMNS)
+        Returns:
+            Any
+            Value of column for evtx_record (None if the record has no value)
+        Preconditions:
+            column is in SUMMARY_COLUMNS    (assumed True)
+        '''
+        if column == 'EventRecordID':
+            return evtx_record.get_record_id()
+        if column == 'WriteTime':
+            return evtx_record.get_write_time().strftime('%Y-%m-%d %H:%M:%S.%f%z')
+        if column == 'EventData':
+            eventdata = evtx_record.get_eventdata()
+            if len(eventdata) == 0:
+                eventdata = evtx_record.get_userdata()
+            return self._encoder.encode(eventdata) if eventdata else None
+        return evtx_record.get_system_field(column)
+    def _get_csv_writer(self, buffer):
+        '''
+        Args:
+            buffer: _RowBuffer  => buffer to write rows to
+        Returns:
+            _csv.writer
+            CSV writer that writes rows to buffer, separating fields with
+            context.sep and quoting fields only where needed
+        Preconditions:
+            len(self.context.sep) == 1  (assumed True)
+        '''
+        return csv.writer(buffer, delimiter=self.context.sep, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+    def _format_result(self, result):
+        '''
+        @BaseParseFileOutputTask._format_result
+        '''
+        buffer = _RowBuffer()
+        self._get_csv_writer(buffer).writerow(result)
+        return buffer[0][:-1]
+    def _format_results(self, results):
+        '''
+        @BaseParseFileOutputTask._format_results
+        Procedure:
+            Write all results in one batch (falling back to one result at
+            a time so a result that cannot be written is logged and skipped)
+        '''
+        buffer = _RowBuffer()
+        try:
+            self._get_csv_writer(buffer).writerows(result for recordidx, result in results)
+        except Exception:
+            return super(ParseCSVTask, self)._format_results(results)
+        return [(recordidx, row[:-1]) for (recordidx, result), row in zip(results, buffer)]
     def extract_resultset(self, worker):
         '''
         @BaseParseTask.extract_resultset
         '''
         self.result_set = list()
         if self.context.info_type == 'summary':
+            columns = self.context.get('columns') or SUMMARY_COLUMNS
+            for evtx_record in self._get_records():
+                try:
+                    result = [self._get_summary_value(evtx_record, column) for column in columns]
+                except Exception as e:
+                    Logger.error('Failed to create CSV output record of EVTX record %d in chunk %d for node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
+                else:
+                    self.result_set.append((evtx_record.get_record_id(), result))
+
+class ParseJSONTask(BaseParseFileOutputTask):
+    '''
+    Class for parsing EVTX chunk to JSON format
+    '''
+    _encoder = JSONLinesEncoder()
+    def _encode_record(self, evtx_record):
+        '''
+        Args:
+            evtx_record: EventLogXRecord    => parsed record to encode
+        Returns:
+            String
+            JSON encoding of evtx_record (pretty-printed if context.pretty)
+        Preconditions:
+            N/A
+        '''
+        if self.context.pretty:
+            return dumps(evtx_record.serialize(), sort_keys=True, indent=2)
+        return self._encoder.encode(evtx_record)
+    def extract_resultset(self, worker):
+        '''
+        @BaseParseTask.extract_resultset
+        '''
+        self.result_set = list()
+        for evtx_record in self._get_records():
             try:
-                evtx_record = EventLogXRecord(self.source)
-                evtx_record.parse()
+                result = self._encode_record(evtx_record.parse())
             except Exception as e:
-                Logger.error('Failed to parse EVTX record %d for node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
+                Logger.error('Failed to parse EVTX record %d in chunk %d for node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
             else:
                 try:
-                    result = list()
-                    self.result_set.append(result)
+                    self.result_set.append((evtx_record.get_record_id(), result))
                 except Exception as e:
-                    Logger.error('Failed to create CSV output record of EVTX record %d for node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
+                    Logger.error('Failed to create JSON output records of EVTX record %d in chunk %d for node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
 
-class ParseJSONTask(BaseParseFileOutputTask):
+class ParseBODYTask(BaseParseFileOutputTask):
     '''
-    Class for parsing single EVTX record to JSON format
+    Class for parsing EVTX chunk to body file (mactime) format, using the
+    write time from the record header and decoding only the System fields
+    the entry names (Provider, EventID and Computer)
     '''
+    BODY_SEP = '|'
+
+    def _format_result(self, result):
+        '''
+        @BaseParseFileOutputTask._format_result
+        '''
+        return self.BODY_SEP.join(result)
     def extract_resultset(self, worker):
         '''
         @BaseParseTask.extract_resultset
         '''
         self.result_set = list()
-        try:
-            evtx_record = EventLogXRecord(self.source)
-            result = dumps(evtx_record.parse().serialize(), sort_keys=True, indent=(2 if self.context.pretty else None))
-        except Exception as e:
-            Logger.error('Failed to parse EVTX record %d for node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
-        else:
+        for evtx_record in self._get_records():
+            try:
+                record_id = evtx_record.get_record_id()
+                timestamp = str(evtx_record.get_write_timestamp() // 1000000000)
+                name = '[EVTX] %s EventID %s on %s (record %d)'%(\
+                    evtx_record.get_system_field('Provider'),
+                    evtx_record.get_system_field('EventID'),
+                    evtx_record.get_system_field('Computer'),
+                    record_id\
+                )
+            except Exception as e:
+                Logger.error('Failed to parse EVTX record %d in chunk %d for node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
+            else:
+                ## MD5|name|inode|mode_as_string|UID|GID|size|atime|mtime|ctime|crtime
+                self.result_set.append((record_id, [\
+                    '0',
+                    name.replace(self.BODY_SEP, '_').replace('\n', ' '),
+                    '0',
+                    '0',
+                    '0',
+                    '0',
+                    '0',
+                    timestamp,
+                    timestamp,
+                    timestamp,
+                    timestamp\
+                ]))
+
+class ParseColumnarTask(BaseParseFileOutputTask):
+    '''
+    Class for parsing EVTX chunk to a block of typed columns (see
+    src.utils.columnar), decoding only the System fields the columns
+    hold and the EventData section
+    '''
+    def extract_resultset(self, worker):
+        '''
+        @BaseParseTask.extract_resultset
+        '''
+        self.result_set = list()
+        for evtx_record in self._get_records():
             try:
-                self.result_set.append(result)
+                eventdata = evtx_record.get_eventdata()
+                row = Container(\
+                    record_id=evtx_record.get_record_id(),
+                    timestamp=evtx_record.get_write_timestamp(),
+                    event_id=evtx_record.get_system_field('EventID'),
+                    provider=evtx_record.get_system_field('Provider'),
+                    channel=evtx_record.get_system_field('Channel'),
+                    computer=evtx_record.get_system_field('Computer'),
+                    event_data=eventdata if len(eventdata) > 0 else None\
+                )
             except Exception as e:
-                Logger.error('Failed to create JSON output records of EVTX record %d for node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
+                Logger.error('Failed to parse EVTX record %d in chunk %d for node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
+            else:
+                self.result_set.append((row.record_id, row))
+    def _is_binary(self):
+        '''
+        @BaseParseFileOutputTask._is_binary
+        '''
+        return True
+    def _write_results(self, writer, results, output):
+        '''
+        @BaseParseFileOutputTask._write_results
+        NOTE:
+            blocks are always written to spill files, as the columnar
+            file is only written when merging (see merge_tagged_blocks)
+        '''
+        block, meta = encode_block([row for recordidx, row in results])
+        writer.write(tag_block(block, meta, self.chunkidx))
+        return len(results)
+
+class ParseRecordsTask(BaseParseFileOutputTask):
+    '''
+    Class for parsing EVTX chunk to records returned to the caller
+    (see src.main.api.parse_files) instead of written to file
+    '''
+    def __init__(self, source, nodeidx, chunkidx, **context):
+        super(ParseRecordsTask, self).__init__(source, nodeidx, chunkidx, target=None, **context)
+    @staticmethod
+    def _get_field(record, field):
+        '''
+        Args:
+            record: Container<String, Any>  => serialized EVTX record
+            field: String                   => dotted path of field (i.e. System.EventID)
+        Returns:
+            Any
+            Value of field in record, None if record has no such field
+        Preconditions:
+            field is of type String (assumed True)
+        '''
+        value = record
+        for key in field.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+        return value
+    def extract_resultset(self, worker):
+        '''
+        @BaseParseTask.extract_resultset
+        '''
+        self.result_set = list()
+        fields = self.context.get('fields')
+        record_filter = self.context.get('record_filter')
+        for evtx_record in self._get_records():
+            try:
+                record = evtx_record.parse().serialize()
+                if record_filter is not None and not record_filter(record):
+                    continue
+                if fields is not None:
+                    record = dict((field, self._get_field(record, field)) for field in fields)
+            except Exception as e:
+                Logger.error('Failed to parse EVTX record %d in chunk %d for node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
+            else:
+                self.result_set.append(record)
+    def process_resultset(self, worker):
+        '''
+        @BaseParseTask.process_resultset
+        NOTE:
+            returns a single result, (context.order, records), even if
+            no record was parsed, so the caller can put chunks back in order
+        '''
+        if worker.progress is not None:
+            worker.progress.increment(self.nodeidx, self.record_count)
+        return [(self.context.order, self._limit_results(worker, self.result_set))]
+    def __call__(self, worker):
+        '''
+        @BaseParseTask.__call__
+        '''
+        try:
+            return super(ParseRecordsTask, self).__call__(worker)
+        except Exception as e:
+            Logger.error('Failed to parse EVTX chunk %d from node %d (%s)'%(self.chunkidx, self.nodeidx, str(e)))
+            return [(self.context.order, list())]
 
 class ParseDBTaskStage1(BaseParseFileOutputTask):
     '''
-    Task class to parse single EVTX record in preparation for insertion into DB
+    Task class to parse EVTX chunk in preparation for insertion into DB
     '''
 
-    def __init__(self, source, nodeidx, recordidx, fileledger):
-        super(ParseDBTaskStage1, self).__init__(source, nodeidx, recordidx, target=None)
-        self._context = None
+    def __init__(self, source, nodeidx, chunkidx, fileledger, **context):
+        super(ParseDBTaskStage1, self).__init__(source, nodeidx, chunkidx, target=None, **context)
         self._fileledger = fileledger
     @property
     def fileledger(self):
@@ -259,21 +762,40 @@ class ParseDBTaskStage1(BaseParseFileOutputTask):
         @BaseParseTask.extract_resultset
         '''
         self.result_set = list()
-        try:
-            evtx_record = EventLogXRecord(self.source)
-            evtx_record.parse()
-            evtx_record._stream = None
-        except Exception as e:
-            Logger.error('Failed to parse EVTX record %d from node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
-        else:
+        for evtx_record in self._get_records():
             try:
-                self.result_set.append(ParseDBTaskStage2([evtx_record], self.nodeidx, self.recordidx, self.fileledger))
+                evtx_record.parse()
+                evtx_record._raw_entry = bytes(evtx_record.raw_entry)
+                evtx_record._stream = None
+                evtx_record._chunk = None
+                evtx_record._instance = None
             except Exception as e:
-                Logger.error('Failed to create DB output record for EVTX record %d from node %d (%s)'%(self.recordidx, self.nodeidx, str(e)))
+                Logger.error('Failed to parse EVTX record %d in chunk %d from node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
+            else:
+                try:
+                    self.result_set.append(ParseDBTaskStage2([evtx_record], self.nodeidx, self.chunkidx, self.fileledger))
+                except Exception as e:
+                    Logger.error('Failed to create DB output record for EVTX record %d in chunk %d from node %d (%s)'%(evtx_record.get_record_id(), self.chunkidx, self.nodeidx, str(e)))
     def process_resultset(self, worker):
         '''
         @BaseParseTask.process_resultset
-        '''
+        NOTE:
+            if checkpointing, the results are followed by an empty stage 2
+            task that checkpoints the chunk once the DB writer reaches it
+            (so after every record of the chunk has been committed)
+        '''
+        self.result_set = self._limit_results(worker, self.result_set, True)
+        if worker.progress is not None and self.record_count > len(self.result_set):
+            worker.progress.increment(self.nodeidx, self.record_count - len(self.result_set))
+        if self.context.get('checkpoint') is not None:
+            self.result_set.append(ParseDBTaskStage2(\
+                list(),
+                self.nodeidx,
+                self.chunkidx,
+                self.fileledger,
+                journal=self.context.get('journal'),
+                checkpoint=self.context.checkpoint\
+            ))
         return self.result_set
 
 class ParseDBTaskStage2(ParseDBTaskStage1):
@@ -292,6 +814,8 @@ class ParseDBTaskStage2(ParseDBTaskStage1):
         '''
         @BaseParseTask.process_resultset
         '''
+        if worker.progress is not None:
+            worker.progress.increment(self.nodeidx, len(self.source))
         if worker.manager.session is None:
             try:
                 worker.manager.create_session()
@@ -309,4 +833,5 @@ class ParseDBTaskStage2(ParseDBTaskStage1):
                 worker.manager.rollback()
         if successful_results > 0:
             Logger.info('Successfully committed %d result(s) to database'%successful_results)
+        self._write_checkpoint()
         return [True]
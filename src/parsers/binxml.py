@@ -0,0 +1,638 @@
+## -*- coding: UTF-8 -*-
+## binxml.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+from struct import Struct
+from uuid import UUID
+from datetime import datetime, timezone
+from construct.lib import Container
+
+from src.utils.time import WindowsTime
+
+UINT8   = Struct('<B')
+UINT16  = Struct('<H')
+UINT32  = Struct('<I')
+UINT64  = Struct('<Q')
+SUBSTITUTION_DESCRIPTOR = Struct('<HBx')
+SYSTEMTIME = Struct('<8H')
+
+## BinXML tokens (see src.structures.binxml.BinXMLToken), masked with 0x0F
+TOKEN_EOF               = 0x00
+TOKEN_OPEN_START        = 0x01
+TOKEN_CLOSE_START       = 0x02
+TOKEN_CLOSE_EMPTY       = 0x03
+TOKEN_END_ELEMENT       = 0x04
+TOKEN_VALUE             = 0x05
+TOKEN_ATTRIBUTE         = 0x06
+TOKEN_CDATA             = 0x07
+TOKEN_CHARREF           = 0x08
+TOKEN_ENTITYREF         = 0x09
+TOKEN_PI_TARGET         = 0x0A
+TOKEN_PI_DATA           = 0x0B
+TOKEN_TEMPLATE_INSTANCE = 0x0C
+TOKEN_NORMAL_SUB        = 0x0D
+TOKEN_OPTIONAL_SUB      = 0x0E
+TOKEN_FRAGMENT_HEADER   = 0x0F
+
+## BinXML value types (see src.structures.binxml.BinXMLValue)
+VALUE_NULL          = 0x00
+VALUE_STRING        = 0x01
+VALUE_ANSI_STRING   = 0x02
+VALUE_BINARY        = 0x0E
+VALUE_GUID          = 0x0F
+VALUE_SIZET         = 0x10
+VALUE_FILETIME      = 0x11
+VALUE_SYSTIME       = 0x12
+VALUE_SID           = 0x13
+VALUE_HEXINT32      = 0x14
+VALUE_HEXINT64      = 0x15
+VALUE_BINXML        = 0x21
+VALUE_STRING_ARRAY  = 0x81
+VALUE_ARRAY_FLAG    = 0x80
+
+_FIXED_VALUE_TYPES = {\
+    0x03: Struct('<b'),
+    0x04: Struct('<B'),
+    0x05: Struct('<h'),
+    0x06: Struct('<H'),
+    0x07: Struct('<i'),
+    0x08: Struct('<I'),
+    0x09: Struct('<q'),
+    0x0A: Struct('<Q'),
+    0x0B: Struct('<f'),
+    0x0C: Struct('<d'),
+    0x0D: Struct('<I'),
+    VALUE_FILETIME: UINT64,
+    VALUE_HEXINT32: UINT32,
+    VALUE_HEXINT64: UINT64\
+}
+
+_ENTITIES = dict(amp='&', lt='<', gt='>', quot='"', apos='\'')
+
+## Flattened names for attributes of System child elements
+SYSTEM_ATTRIBUTE_ALIASES = {\
+    ('Provider', 'Name'):                   'Provider',
+    ('Provider', 'Guid'):                   'ProviderGuid',
+    ('Provider', 'EventSourceName'):        'EventSourceName',
+    ('EventID', 'Qualifiers'):              'Qualifiers',
+    ('TimeCreated', 'SystemTime'):          'TimeCreated',
+    ('Correlation', 'ActivityID'):          'ActivityID',
+    ('Correlation', 'RelatedActivityID'):   'RelatedActivityID',
+    ('Execution', 'ProcessID'):             'ProcessID',
+    ('Execution', 'ThreadID'):              'ThreadID',
+    ('Security', 'UserID'):                 'UserID'\
+}
+
+def filetime_to_datetime(filetime):
+    '''
+    Args:
+        filetime: Integer   => 64-bit FILETIME value
+    Returns:
+        DateTime
+        UTC datetime of FILETIME value (None if out of range)
+    Preconditions:
+        filetime is of type Integer (assumed True)
+    '''
+    return WindowsTime(dw_low_datetime=filetime & 0xFFFFFFFF, dw_high_datetime=filetime >> 32).parse()
+
+class BinXMLSubstitution(object):
+    '''
+    Reference to a substitution value in a template definition
+    '''
+    __slots__ = ('index', 'value_type', 'optional')
+
+    def __init__(self, index, value_type, optional):
+        self.index = index
+        self.value_type = value_type
+        self.optional = optional
+    def __repr__(self):
+        return 'BinXMLSubstitution(%d, 0x%02x, optional=%s)'%(self.index, self.value_type, self.optional)
+
+class BinXMLElement(object):
+    '''
+    Element of a BinXML template definition. Attribute values
+    and text content are stored as lists of parts, where each
+    part is either a literal String or a BinXMLSubstitution.
+    '''
+    __slots__ = ('name', 'attributes', 'children')
+
+    def __init__(self, name):
+        self.name = name
+        self.attributes = list()
+        self.children = list()
+    def __repr__(self):
+        return 'BinXMLElement(%s)'%self.name
+    def child(self, name):
+        '''
+        Args:
+            name: String    => name of child element to find
+        Returns:
+            BinXMLElement
+            First child element named name, None if not found
+        Preconditions:
+            name is of type String  (assumed True)
+        '''
+        for child in self.children:
+            if isinstance(child, BinXMLElement) and child.name == name:
+                return child
+        return None
+    @property
+    def text(self):
+        '''
+        @text.getter
+        '''
+        return [child for child in self.children if not isinstance(child, BinXMLElement)]
+    def attribute(self, name):
+        '''
+        Args:
+            name: String    => name of attribute to find
+        Returns:
+            List<String|BinXMLSubstitution>
+            Parts of attribute value, None if not found
+        Preconditions:
+            name is of type String  (assumed True)
+        '''
+        for attribute_name, parts in self.attributes:
+            if attribute_name == name:
+                return parts
+        return None
+
+class BinXMLTemplate(object):
+    '''
+    Parsed BinXML template definition, along with the fields of the
+    System and EventData sections it defines. Templates are shared by
+    all records in a chunk that instantiate them, so the field layout
+    is computed only once per template.
+    '''
+    def __init__(self, offset, guid, root):
+        self.offset = offset
+        self.guid = guid
+        self.root = root
+        self.system_fields = dict()
+        self.eventdata_fields = list()
+        self.userdata = None
+        self.nested = list()
+        self._prepare_fields()
+    def _prepare_fields(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Flatten the System section into name => parts mappings and
+            EventData section into ordered (name, parts) pairs, and collect
+            the BinXML substitutions that hold nested sections (i.e. the
+            EventData section of most Security log templates)
+        Preconditions:
+            N/A
+        '''
+        if self.root is None:
+            return
+        self.nested = [\
+            child for child in self.root.children \
+            if isinstance(child, BinXMLSubstitution) and child.value_type == VALUE_BINXML\
+        ]
+        system = self.root.child('System')
+        if system is not None:
+            for child in system.children:
+                if not isinstance(child, BinXMLElement):
+                    continue
+                if len(child.text) > 0:
+                    self.system_fields[child.name] = child.text
+                for attribute_name, parts in child.attributes:
+                    self.system_fields[SYSTEM_ATTRIBUTE_ALIASES.get(\
+                        (child.name, attribute_name),
+                        child.name + attribute_name\
+                    )] = parts
+        eventdata = self.root if self.root.name == 'EventData' else self.root.child('EventData')
+        if eventdata is not None:
+            for child in eventdata.children:
+                if isinstance(child, BinXMLElement):
+                    name_parts = child.attribute('Name')
+                    if name_parts is not None and all(isinstance(part, str) for part in name_parts):
+                        self.eventdata_fields.append((''.join(name_parts), child.text))
+                    else:
+                        self.eventdata_fields.append((child.name, child.text))
+                else:
+                    self.eventdata_fields.append((None, [child]))
+        self.userdata = self.root if self.root.name == 'UserData' else self.root.child('UserData')
+
+class BinXMLInstance(object):
+    '''
+    Instance of a BinXML template within a record (or nested BinXML
+    value), holding the spans of its substitution values. Values are
+    only decoded when requested, so callers that need a handful of
+    fields never pay for decoding the rest.
+    '''
+    __slots__ = ('reader', 'template', 'descriptors', '_values')
+
+    def __init__(self, reader, template, descriptors):
+        self.reader = reader
+        self.template = template
+        self.descriptors = descriptors
+        self._values = dict()
+    def value(self, index):
+        '''
+        Args:
+            index: Integer  => index of substitution value
+        Returns:
+            Any
+            Decoded substitution value, None if not present
+        Preconditions:
+            index is of type Integer    (assumed True)
+        '''
+        try:
+            return self._values[index]
+        except KeyError:
+            if index >= len(self.descriptors):
+                value = None
+            else:
+                value_type, offset, size = self.descriptors[index]
+                try:
+                    value = self.reader.read_value(value_type, offset, size)
+                except Exception as e:
+                    Logger.error('Failed to decode substitution %d of type 0x%02x at offset %d (%s)'%(index, value_type, offset, str(e)))
+                    value = None
+            self._values[index] = value
+            return value
+    def value_type(self, index):
+        '''
+        Args:
+            index: Integer  => index of substitution value
+        Returns:
+            Integer
+            Value type of substitution value, None if not present
+        Preconditions:
+            index is of type Integer    (assumed True)
+        '''
+        if index >= len(self.descriptors):
+            return None
+        return self.descriptors[index][0]
+    def resolve(self, parts):
+        '''
+        Args:
+            parts: List<String|BinXMLSubstitution>  => parts of attribute or text
+        Returns:
+            Any
+            Value of parts, keeping the type of a lone substitution value and
+            concatenating multiple parts as a String
+        Preconditions:
+            parts is of type List<String|BinXMLSubstitution>    (assumed True)
+        '''
+        if parts is None or len(parts) == 0:
+            return None
+        if len(parts) == 1:
+            part = parts[0]
+            if isinstance(part, BinXMLSubstitution):
+                return self.value(part.index)
+            return part
+        resolved = list()
+        for part in parts:
+            value = self.value(part.index) if isinstance(part, BinXMLSubstitution) else part
+            if value is not None:
+                resolved.append(value if isinstance(value, str) else render_string(value))
+        return ''.join(resolved)
+    def render(self, element=None):
+        '''
+        Args:
+            element: BinXMLElement  => element to render (default: template root)
+        Returns:
+            Container<String, Any>|Any
+            Generic rendering of element with substitutions applied
+        Preconditions:
+            element is of type BinXMLElement    (assumed True)
+        '''
+        if element is None:
+            element = self.template.root
+        if element is None:
+            return None
+        rendered = Container()
+        for attribute_name, parts in element.attributes:
+            value = self.resolve(parts)
+            if value is not None:
+                if '#attributes' not in rendered:
+                    rendered['#attributes'] = Container()
+                rendered['#attributes'][attribute_name] = value
+        text = list()
+        for child in element.children:
+            if isinstance(child, BinXMLElement):
+                value = self.render(child)
+                if child.name in rendered:
+                    if not isinstance(rendered[child.name], list):
+                        rendered[child.name] = [rendered[child.name]]
+                    rendered[child.name].append(value)
+                else:
+                    rendered[child.name] = value
+            else:
+                text.append(child)
+        if len(text) > 0:
+            value = self.resolve(text)
+            if isinstance(value, BinXMLInstance):
+                value = value.render()
+            if len(rendered) == 0:
+                return value
+            if value is not None:
+                rendered['#text'] = value
+        return rendered if len(rendered) > 0 else None
+
+def render_string(value):
+    '''
+    Args:
+        value: Any  => decoded BinXML value
+    Returns:
+        String
+        Textual representation of value
+    Preconditions:
+        N/A
+    '''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    if isinstance(value, list):
+        return ','.join(render_string(entry) for entry in value)
+    if isinstance(value, BinXMLInstance):
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+class BinXMLReader(object):
+    '''
+    Class for decoding BinXML from an EVTX chunk. All offsets handled
+    by this class are relative to the start of the chunk, which is how
+    names and templates are referenced within BinXML.
+    '''
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._names = dict()
+        self._templates = dict()
+    @property
+    def buffer(self):
+        '''
+        @buffer.getter
+        '''
+        return self._buffer
+    @property
+    def templates(self):
+        '''
+        @templates.getter
+        '''
+        return self._templates
+    def _read_utf16(self, offset, character_count):
+        '''
+        Args:
+            offset: Integer             => offset of string
+            character_count: Integer    => number of UTF-16 characters
+        Returns:
+            String
+            Decoded string
+        Preconditions:
+            offset is of type Integer           (assumed True)
+            character_count is of type Integer  (assumed True)
+        '''
+        return str(self._buffer[offset:offset + 2 * character_count], 'utf-16-le', 'replace')
+    def read_name(self, offset):
+        '''
+        Args:
+            offset: Integer => offset of name structure
+        Returns:
+            String
+            Name stored at offset (see src.structures.binxml.BinXMLName)
+        Preconditions:
+            offset is of type Integer   (assumed True)
+        '''
+        try:
+            return self._names[offset]
+        except KeyError:
+            name = self._read_utf16(offset + 8, UINT16.unpack_from(self._buffer, offset + 6)[0])
+            self._names[offset] = name
+            return name
+    def _name_length(self, offset):
+        '''
+        Args:
+            offset: Integer => offset of name structure
+        Returns:
+            Integer
+            Size of name structure (including terminating NULL)
+        Preconditions:
+            offset is of type Integer   (assumed True)
+        '''
+        return 10 + 2 * UINT16.unpack_from(self._buffer, offset + 6)[0]
+    def read_template(self, offset):
+        '''
+        Args:
+            offset: Integer => offset of template definition
+        Returns:
+            BinXMLTemplate
+            Template definition at offset
+        Preconditions:
+            offset is of type Integer   (assumed True)
+        '''
+        template = self._templates.get(offset)
+        if template is None:
+            guid = str(UUID(bytes_le=bytes(self._buffer[offset + 4:offset + 20])))
+            position = offset + 24
+            if self._buffer[position] & 0x0F == TOKEN_FRAGMENT_HEADER:
+                position += 4
+            root = None
+            if self._buffer[position] & 0x0F == TOKEN_OPEN_START:
+                root, position = self._read_element(position)
+            template = BinXMLTemplate(offset, guid, root)
+            self._templates[offset] = template
+        return template
+    def _read_element(self, position):
+        '''
+        Args:
+            position: Integer   => offset of open start element token
+        Returns:
+            Tuple<BinXMLElement, Integer>
+            Parsed element and offset following its end
+        Preconditions:
+            position is of type Integer (assumed True)
+        '''
+        buffer = self._buffer
+        token = buffer[position]
+        name_offset = UINT32.unpack_from(buffer, position + 7)[0]
+        current = position + 11
+        if name_offset > position:
+            current = name_offset + self._name_length(name_offset)
+        if token & 0x40:
+            current += 4
+        element = BinXMLElement(self.read_name(name_offset))
+        while True:
+            token = buffer[current] & 0x0F
+            if token == TOKEN_ATTRIBUTE:
+                attribute_offset = current
+                name_offset = UINT32.unpack_from(buffer, current + 1)[0]
+                current += 5
+                if name_offset > attribute_offset:
+                    current = name_offset + self._name_length(name_offset)
+                part, current = self._read_part(current)
+                element.attributes.append((self.read_name(name_offset), [] if part is None else [part]))
+            elif token == TOKEN_CLOSE_EMPTY:
+                return element, current + 1
+            elif token == TOKEN_CLOSE_START:
+                current += 1
+                break
+            else:
+                raise ValueError('Unexpected token 0x%02x in element %s at offset %d'%(buffer[current], element.name, current))
+        while True:
+            token = buffer[current] & 0x0F
+            if token == TOKEN_END_ELEMENT:
+                return element, current + 1
+            elif token == TOKEN_OPEN_START:
+                child, current = self._read_element(current)
+                element.children.append(child)
+            elif token == TOKEN_EOF:
+                return element, current
+            else:
+                part, current = self._read_part(current)
+                if part is not None:
+                    element.children.append(part)
+    def _read_part(self, position):
+        '''
+        Args:
+            position: Integer   => offset of value, substitution or reference token
+        Returns:
+            Tuple<String|BinXMLSubstitution, Integer>
+            Parsed part and offset following it
+        Preconditions:
+            position is of type Integer (assumed True)
+        '''
+        buffer = self._buffer
+        token = buffer[position] & 0x0F
+        if token == TOKEN_NORMAL_SUB or token == TOKEN_OPTIONAL_SUB:
+            index = UINT16.unpack_from(buffer, position + 1)[0]
+            return BinXMLSubstitution(index, buffer[position + 3], token == TOKEN_OPTIONAL_SUB), position + 4
+        elif token == TOKEN_VALUE:
+            value_type = buffer[position + 1]
+            if value_type == VALUE_STRING:
+                count = UINT16.unpack_from(buffer, position + 2)[0]
+                return self._read_utf16(position + 4, count), position + 4 + 2 * count
+            raise ValueError('Unsupported value type 0x%02x at offset %d'%(value_type, position))
+        elif token == TOKEN_CDATA or token == TOKEN_PI_DATA:
+            count = UINT16.unpack_from(buffer, position + 1)[0]
+            return self._read_utf16(position + 3, count), position + 3 + 2 * count
+        elif token == TOKEN_CHARREF:
+            return chr(UINT16.unpack_from(buffer, position + 1)[0]), position + 3
+        elif token == TOKEN_ENTITYREF or token == TOKEN_PI_TARGET:
+            name_offset = UINT32.unpack_from(buffer, position + 1)[0]
+            current = position + 5
+            if name_offset > position:
+                current = name_offset + self._name_length(name_offset)
+            if token == TOKEN_PI_TARGET:
+                return None, current
+            name = self.read_name(name_offset)
+            return _ENTITIES.get(name, '&%s;'%name), current
+        raise ValueError('Unexpected token 0x%02x at offset %d'%(buffer[position], position))
+    def read_fragment(self, position):
+        '''
+        Args:
+            position: Integer   => offset of BinXML fragment
+        Returns:
+            Tuple<BinXMLInstance, Integer>
+            Template instance of fragment and offset following its substitution values
+        Preconditions:
+            position is of type Integer (assumed True)
+        '''
+        buffer = self._buffer
+        if buffer[position] & 0x0F == TOKEN_FRAGMENT_HEADER:
+            position += 4
+        if buffer[position] & 0x0F != TOKEN_TEMPLATE_INSTANCE:
+            raise ValueError('Expected template instance at offset %d, found token 0x%02x'%(position, buffer[position]))
+        template_offset = UINT32.unpack_from(buffer, position + 6)[0]
+        current = position + 10
+        template = self.read_template(template_offset)
+        if template_offset > position:
+            current = template_offset + 24 + UINT32.unpack_from(buffer, template_offset + 20)[0]
+        count = UINT32.unpack_from(buffer, current)[0]
+        current += 4
+        value_offset = current + 4 * count
+        descriptors = list()
+        for size, value_type in SUBSTITUTION_DESCRIPTOR.iter_unpack(buffer[current:value_offset]):
+            descriptors.append((value_type, value_offset, size))
+            value_offset += size
+        return BinXMLInstance(self, template, descriptors), value_offset
+    def read_value(self, value_type, offset, size):
+        '''
+        Args:
+            value_type: Integer => BinXML value type
+            offset: Integer     => offset of value
+            size: Integer       => size of value in bytes
+        Returns:
+            Any
+            Decoded value
+        Preconditions:
+            value_type is of type Integer   (assumed True)
+            offset is of type Integer       (assumed True)
+            size is of type Integer         (assumed True)
+        '''
+        buffer = self._buffer
+        if value_type == VALUE_NULL or size == 0:
+            return None
+        elif value_type == VALUE_STRING:
+            return str(buffer[offset:offset + size], 'utf-16-le', 'replace').rstrip('\x00')
+        elif value_type == VALUE_ANSI_STRING:
+            return str(buffer[offset:offset + size], 'latin-1').rstrip('\x00')
+        elif value_type in _FIXED_VALUE_TYPES:
+            value = _FIXED_VALUE_TYPES[value_type].unpack_from(buffer, offset)[0]
+            if value_type == VALUE_FILETIME:
+                return filetime_to_datetime(value)
+            elif value_type == VALUE_HEXINT32 or value_type == VALUE_HEXINT64:
+                return '0x%x'%value
+            elif value_type == 0x0D:
+                return bool(value)
+            return value
+        elif value_type == VALUE_BINARY:
+            return bytes(buffer[offset:offset + size]).hex().upper()
+        elif value_type == VALUE_GUID:
+            return '{%s}'%str(UUID(bytes_le=bytes(buffer[offset:offset + 16]))).upper()
+        elif value_type == VALUE_SIZET:
+            return '0x%x'%(UINT64.unpack_from(buffer, offset)[0] if size == 8 else UINT32.unpack_from(buffer, offset)[0])
+        elif value_type == VALUE_SYSTIME:
+            year, month, _, day, hour, minute, second, millisecond = SYSTEMTIME.unpack_from(buffer, offset)
+            return datetime(year, month, day, hour, minute, second, millisecond * 1000, tzinfo=timezone.utc)
+        elif value_type == VALUE_SID:
+            revision = buffer[offset]
+            count = buffer[offset + 1]
+            authority = int.from_bytes(bytes(buffer[offset + 2:offset + 8]), 'big')
+            subauthorities = Struct('<%dI'%count).unpack_from(buffer, offset + 8)
+            return 'S-%d-%d'%(revision, authority) + ''.join('-%d'%subauthority for subauthority in subauthorities)
+        elif value_type == VALUE_BINXML:
+            return self.read_fragment(offset)[0]
+        elif value_type == VALUE_STRING_ARRAY:
+            return str(buffer[offset:offset + size], 'utf-16-le', 'replace').rstrip('\x00').split('\x00')
+        elif value_type & VALUE_ARRAY_FLAG:
+            element_type = value_type & ~VALUE_ARRAY_FLAG
+            if element_type == VALUE_ANSI_STRING:
+                return str(buffer[offset:offset + size], 'latin-1').rstrip('\x00').split('\x00')
+            element_size = {VALUE_GUID: 16, VALUE_SYSTIME: 16, VALUE_SIZET: 8}.get(\
+                element_type,
+                _FIXED_VALUE_TYPES[element_type].size if element_type in _FIXED_VALUE_TYPES else None\
+            )
+            if element_size is None:
+                raise ValueError('Unsupported array value type 0x%02x'%value_type)
+            return [\
+                self.read_value(element_type, element_offset, element_size) \
+                for element_offset in range(offset, offset + size - element_size + 1, element_size)\
+            ]
+        raise ValueError('Unsupported value type 0x%02x'%value_type)
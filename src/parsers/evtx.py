@@ -23,6 +23,7 @@
 
 import logging
 Logger = logging.getLogger(__name__)
+import sys
 from os import path
 from io import BytesIO
 import inspect
@@ -32,19 +33,38 @@ from datetime import datetime
 from dateutil.tz import tzlocal, tzutc
 
 import src.structures.evtx as evtxstructs
-from src.utils.time import WindowsTime
+from src.parsers.binxml import BinXMLReader, BinXMLInstance, UINT32, UINT64, filetime_to_datetime
+
+EVTX_FILE_HEADER_SIZE   = 0x1000
+EVTX_CHUNK_SIZE         = 0x10000
+EVTX_CHUNK_HEADER_SIZE  = 0x200
+EVTX_RECORD_HEADER_SIZE = 0x18
+EVTX_CHUNK_SIGNATURE    = b'ElfChnk\x00'
+EVTX_RECORD_SIGNATURE   = b'\x2a\x2a\x00\x00'
+EPOCH_AS_FILETIME_TICKS = 116444736000000000
 
 class EventLogXRecord(Container):
     '''
-    Class for parsing Windows EVTX file records
+    Class for parsing Windows EVTX file records. Records are decoded
+    lazily from the chunk they belong to, as BinXML names and templates
+    are referenced by offset relative to the start of the chunk.
     '''
 
-    def __init__(self, raw_entry, load=False):
+    def __init__(self, raw_entry, chunk=None, offset=0, load=False):
         super(EventLogXRecord, self).__init__()
         self._raw_entry = raw_entry
+        self._chunk = chunk
+        self._offset = offset
         self._stream = None
+        self._instance = None
         if load:
             self.parse()
+    @property
+    def raw_entry(self):
+        '''
+        @raw_entry.getter
+        '''
+        return self._raw_entry
     def _clean_transform(self, value, serialize=False):
         '''
         Args:
@@ -58,11 +78,7 @@ class EventLogXRecord(Container):
         '''
         if issubclass(type(value), Container):
             cleaned_value = Container(value)
-            if '_raw_entry' in cleaned_value:
-                del cleaned_value['_filepath']
-            if '_stream' in cleaned_value:
-                del cleaned_value['_stream']
-            for key in cleaned_value:
+            for key in list(cleaned_value.keys()):
                 if key.startswith('Raw') or key.startswith('_'):
                     del cleaned_value[key]
                 else:
@@ -171,24 +187,228 @@ class EventLogXRecord(Container):
         except Exception as e:
             Logger.error('Failed to parse %s structure (%s)'%(structure, str(e)))
             return None
+    def get_record_id(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Event record identifier from the record header
+        Preconditions:
+            N/A
+        '''
+        return UINT64.unpack_from(self._raw_entry, 8)[0]
+    def get_write_time(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            DateTime
+            Time record was written from the record header
+        Preconditions:
+            N/A
+        '''
+        return filetime_to_datetime(UINT64.unpack_from(self._raw_entry, 16)[0])
+    def get_write_timestamp(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Time record was written from the record header, as nanoseconds
+            since the Unix epoch (without converting to DateTime)
+        Preconditions:
+            N/A
+        '''
+        return (UINT64.unpack_from(self._raw_entry, 16)[0] - EPOCH_AS_FILETIME_TICKS) * 100
+    def get_instance(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            BinXMLInstance
+            Template instance of record BinXML (decoded once and cached)
+        Preconditions:
+            self._chunk is of type EventLogXChunk
+        '''
+        if self._instance is None:
+            self._instance = self._chunk.reader.read_fragment(self._offset + EVTX_RECORD_HEADER_SIZE)[0]
+        return self._instance
+    def get_sections(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<BinXMLInstance>
+            Template instance of record followed by any nested template
+            instances substituted directly into the Event element
+        Preconditions:
+            self._chunk is of type EventLogXChunk
+        '''
+        instance = self.get_instance()
+        sections = [instance]
+        for part in instance.template.nested:
+            value = instance.value(part.index)
+            if isinstance(value, BinXMLInstance):
+                sections.append(value)
+        return sections
+    def get_system_field(self, name):
+        '''
+        Args:
+            name: String    => name of (flattened) System field
+        Returns:
+            Any
+            Value of System field, decoding only the substitution values it requires
+        Preconditions:
+            name is of type String  (assumed True)
+        '''
+        instance = self.get_instance()
+        return instance.resolve(instance.template.system_fields.get(name))
+    def get_eventdata(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Name => value mapping of EventData section (unnamed Data
+            elements are collected into a list under Data)
+        Preconditions:
+            N/A
+        '''
+        eventdata = Container()
+        for instance in self.get_sections():
+            for name, parts in instance.template.eventdata_fields:
+                value = instance.resolve(parts)
+                if isinstance(value, BinXMLInstance):
+                    value = value.render()
+                if name is None or name == 'Data':
+                    if 'Data' not in eventdata:
+                        eventdata.Data = list()
+                    eventdata.Data.append(value)
+                else:
+                    eventdata[name] = value
+        return eventdata
+    def get_eventdata_field(self, name):
+        '''
+        Args:
+            name: String    => name of EventData field (Name attribute of Data element)
+        Returns:
+            Any
+            Value of EventData field, decoding only the substitution values it requires
+        Preconditions:
+            name is of type String  (assumed True)
+        '''
+        for instance in self.get_sections():
+            for field_name, parts in instance.template.eventdata_fields:
+                if field_name == name:
+                    value = instance.resolve(parts)
+                    return value.render() if isinstance(value, BinXMLInstance) else value
+        return None
+    def get_userdata(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Rendering of UserData section, None if record has no UserData
+        Preconditions:
+            N/A
+        '''
+        for instance in self.get_sections():
+            if instance.template.userdata is not None:
+                return instance.render(instance.template.userdata)
+        return None
     def parse(self):
         '''
         Args:
             N/A
         Procedure:
-            Attempt to parse the supplied MFT entry, extracting
-            header information and resident attribute data
+            Attempt to parse the supplied EVTX record, extracting header
+            information and the System, EventData and UserData sections
         Preconditions:
             N/A
         '''
         self.get_stream(persist=True)
         try:
+            self.Header = Container(\
+                EventRecordID=self.get_record_id(),
+                WriteTime=self.get_write_time()\
+            )
+            instance = self.get_instance()
+            self.System = Container()
+            for name in instance.template.system_fields:
+                self.System[name] = self.get_system_field(name)
+            eventdata = self.get_eventdata()
+            if len(eventdata) > 0:
+                self.EventData = eventdata
+            else:
+                userdata = self.get_userdata()
+                if userdata is not None:
+                    self.UserData = userdata
             return self
         finally:
             if self._stream is not None:
                 self._stream.close()
                 self._stream = None
 
+class EventLogXChunk(Container):
+    '''
+    Class for parsing Windows EVTX file chunks
+    '''
+    def __init__(self, raw_chunk, index=None):
+        super(EventLogXChunk, self).__init__()
+        self._raw_chunk = raw_chunk
+        self._reader = None
+        self.index = index
+        self.header = evtxstructs.EVTXChunkHeader.parse(bytes(raw_chunk[:evtxstructs.EVTXChunkHeader.sizeof()]))
+    @property
+    def reader(self):
+        '''
+        @reader.getter
+        '''
+        if self._reader is None:
+            self._reader = BinXMLReader(self._raw_chunk)
+        return self._reader
+    @property
+    def raw_chunk(self):
+        '''
+        @raw_chunk.getter
+        '''
+        return self._raw_chunk
+    @property
+    def record_count(self):
+        '''
+        @record_count.getter
+        '''
+        if self.header.LastEventRecordNumber < self.header.FirstEventRecordNumber:
+            return 0
+        return self.header.LastEventRecordNumber - self.header.FirstEventRecordNumber + 1
+    @property
+    def records(self):
+        '''
+        @records.getter
+        '''
+        raw_chunk = self._raw_chunk
+        free_space_offset = min(self.header.FreeSpaceOffset, len(raw_chunk))
+        offset = EVTX_CHUNK_HEADER_SIZE
+        while offset + EVTX_RECORD_HEADER_SIZE <= free_space_offset:
+            if raw_chunk[offset:offset + 4] != EVTX_RECORD_SIGNATURE:
+                break
+            size = UINT32.unpack_from(raw_chunk, offset + 4)[0]
+            if size < EVTX_RECORD_HEADER_SIZE or offset + size > len(raw_chunk):
+                Logger.error('Invalid EVTX record size %d at offset %d of chunk %s'%(size, offset, str(self.index)))
+                break
+            yield EventLogXRecord(raw_chunk[offset:offset + size], self, offset)
+            offset += size
+    @records.setter
+    def records(self, value):
+        '''
+        @records.setter
+        Preconditions:
+            N/A
+        '''
+        raise AttributeError('records is a dynamic attribute and cannot be set')
+
 class EventLogX(Container):
     '''
     Class for parsing Windows EVTX file
@@ -196,13 +416,35 @@ class EventLogX(Container):
     def __init__(self, filepath):
         super(EventLogX, self).__init__()
         self._filepath = filepath
+    @property
+    def is_stream(self):
+        '''
+        @is_stream.getter
+        Returns True if the source is not a regular file (i.e. stdin
+        given as '-', a pipe or a character device) and so can only be
+        read once from start to end
+        '''
+        return self._filepath == '-' or not path.isfile(self._filepath)
+    def _open(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            BufferedReader
+            Binary file object of source (stdin if filepath is '-')
+        Preconditions:
+            N/A
+        '''
+        if self._filepath == '-':
+            return sys.stdin.buffer
+        return open(self._filepath, 'rb')
     def _hash_file(self, algorithm):
         '''
         Args:
             algorithm: String   => hash algorithm to use
         Returns:
             String
-            Hex digest of hash of prefetch file
+            Hex digest of hash of EVTX file
         Preconditions:
             algorithm is of type String
         '''
@@ -212,23 +454,51 @@ class EventLogX(Container):
             Logger.error('Unable to obtain %s hash of EVTX file (%s)'%(algorithm, str(e)))
             return None
         else:
-            for record in self.records:
-                hash.update(record)
+            with open(self._filepath, 'rb') as evtx_file:
+                for block in iter(lambda: evtx_file.read(EVTX_CHUNK_SIZE), b''):
+                    hash.update(block)
             return hash.hexdigest()
     @property
-    def records(self):
+    def chunks(self):
         '''
-        @records.getter
+        @chunks.getter
         '''
         if self._filepath is None:
-            return list()
-        evtx_file = open(self._filepath, 'rb')
+            return
+        evtx_file = self._open()
         try:
-            #TODO: implement records
-            pass
+            if self.is_stream:
+                evtx_file.read(EVTX_FILE_HEADER_SIZE)
+            else:
+                evtx_file.seek(EVTX_FILE_HEADER_SIZE)
+            chunkidx = 0
+            while True:
+                raw_chunk = evtx_file.read(EVTX_CHUNK_SIZE)
+                if len(raw_chunk) < EVTX_CHUNK_SIZE:
+                    break
+                if raw_chunk[:8] == EVTX_CHUNK_SIGNATURE:
+                    yield EventLogXChunk(raw_chunk, chunkidx)
+                chunkidx += 1
         finally:
-            evtx_file.close()
+            if evtx_file is not sys.stdin.buffer:
+                evtx_file.close()
             evtx_file = None
+    @chunks.setter
+    def chunks(self, value):
+        '''
+        @chunks.setter
+        Preconditions:
+            N/A
+        '''
+        raise AttributeError('chunks is a dynamic attribute and cannot be set')
+    @property
+    def records(self):
+        '''
+        @records.getter
+        '''
+        for evtx_chunk in self.chunks:
+            for evtx_record in evtx_chunk.records:
+                yield evtx_record
     @records.setter
     def records(self, value):
         '''
@@ -237,6 +507,63 @@ class EventLogX(Container):
             N/A
         '''
         raise AttributeError('records is a dynamic attribute and cannot be set')
+    def get_record_count(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Number of records in this EVTX file according to its chunk headers,
+            None if the source is a stream (and so cannot be read ahead of parsing)
+        Preconditions:
+            N/A
+        '''
+        if self.is_stream:
+            return None
+        record_count = 0
+        header_size = evtxstructs.EVTXChunkHeader.sizeof()
+        with open(self._filepath, 'rb') as evtx_file:
+            offset = EVTX_FILE_HEADER_SIZE
+            while True:
+                evtx_file.seek(offset)
+                raw_header = evtx_file.read(header_size)
+                if len(raw_header) < header_size:
+                    break
+                if raw_header[:8] == EVTX_CHUNK_SIGNATURE:
+                    header = evtxstructs.EVTXChunkHeader.parse(raw_header)
+                    if header.LastEventRecordNumber >= header.FirstEventRecordNumber:
+                        record_count += header.LastEventRecordNumber - header.FirstEventRecordNumber + 1
+                offset += EVTX_CHUNK_SIZE
+        return record_count
+    def get_identity(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            String
+            SHA256 hash (hex digest) of the size, file header and chunk headers
+            of this EVTX file, which identifies its content without reading
+            every chunk (each chunk header holds the checksum of its records),
+            None if the source is a stream
+        Preconditions:
+            N/A
+        '''
+        if self.is_stream:
+            return None
+        hash = hashlib.sha256()
+        header_size = evtxstructs.EVTXChunkHeader.sizeof()
+        with open(self._filepath, 'rb') as evtx_file:
+            hash.update(str(path.getsize(self._filepath)).encode('utf8'))
+            hash.update(evtx_file.read(EVTX_FILE_HEADER_SIZE))
+            offset = EVTX_FILE_HEADER_SIZE
+            while True:
+                evtx_file.seek(offset)
+                raw_header = evtx_file.read(header_size)
+                if len(raw_header) < header_size:
+                    break
+                hash.update(raw_header)
+                offset += EVTX_CHUNK_SIZE
+        return hash.hexdigest()
     def get_metadata(self, simple_hash=True):
         '''
         Args:
@@ -275,9 +602,9 @@ class EventLogX(Container):
             N/A
         Returns:
             Gen<EventLogXRecord>
-            Iterator over the {{FILETYPE} records in this EVTX file
+            Iterator over the parsed records in this EVTX file
         Preconditions:
             N/A
         '''
         for record in self.records:
-            yield EventLogXRecord(record)
+            yield record.parse()
@@ -0,0 +1,314 @@
+## -*- coding: UTF-8 -*-
+## checkpoint.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+
+import logging
+Logger = logging.getLogger(__name__)
+import os
+
+def append_checkpoint(filepath, key, start, end):
+    '''
+    Args:
+        filepath: String    => path of checkpoint journal
+        key: String         => key of file (or file output) chunks belong to
+        start: Integer      => index of first completed chunk
+        end: Integer        => index after last completed chunk
+    Procedure:
+        Append completed chunk range to checkpoint journal at filepath.
+        Each entry is appended with a single write so that entries from
+        concurrent worker processes do not interleave
+    Preconditions:
+        N/A
+    '''
+    with open(filepath, 'a') as journal:
+        journal.write('C\t%s\t%d\t%d\n'%(key, start, end))
+
+class CheckpointJournal(object):
+    '''
+    Class to record which chunks of which files have been parsed and their
+    output written, so an interrupted run can be resumed without repeating
+    (or losing) that work. The journal is an append-only text file of
+    tab-separated entries:
+        F <nodeidx> <key>           node nodeidx is the file with key (see EventLogX.get_identity);
+                                    forgets chunks previously completed for key
+        C <key> <start> <end>       chunks [start, end) of key are complete
+        E <key> <chunk_count>       every chunk of key has been submitted
+        M <size> <target>           target was size bytes when output began being merged into it
+    Keys of outputs of a file are <key>:<output> (see get_keys). Entries
+    from a truncated last line (i.e. the run was killed while writing it)
+    are ignored.
+    '''
+    def __init__(self, filepath):
+        self._filepath = filepath
+        self._nodes = dict()
+        self._completed = dict()
+        self._chunk_counts = dict()
+        self._merges = list()
+    @property
+    def filepath(self):
+        '''
+        @filepath.getter
+        '''
+        return self._filepath
+    @property
+    def merges(self):
+        '''
+        @merges.getter
+        List of (target, size) for each target output was being merged into
+        '''
+        return self._merges
+    def exists(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Boolean
+            Whether the journal file exists
+        Preconditions:
+            N/A
+        '''
+        return os.path.isfile(self.filepath)
+    def _forget(self, key):
+        '''
+        Args:
+            key: String => key of file
+        Procedure:
+            Forget every chunk completed for key and its outputs
+        Preconditions:
+            N/A
+        '''
+        for completed_key in list(self._completed):
+            if completed_key == key or completed_key.startswith(key + ':'):
+                del self._completed[completed_key]
+        self._chunk_counts.pop(key, None)
+    def load(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Read the entries of the journal file into memory
+        Preconditions:
+            self.exists()
+        '''
+        with open(self.filepath, 'r') as journal:
+            for line in journal:
+                if not line.endswith('\n'):
+                    Logger.warning('Ignoring truncated entry at end of checkpoint journal %s'%self.filepath)
+                    break
+                entry = line.rstrip('\n').split('\t')
+                if entry[0] == 'F':
+                    self._forget(entry[2])
+                    self._nodes[int(entry[1])] = entry[2]
+                elif entry[0] == 'C':
+                    self._completed.setdefault(entry[1], set()).update(range(int(entry[2]), int(entry[3])))
+                elif entry[0] == 'E':
+                    self._chunk_counts[entry[1]] = int(entry[2])
+                elif entry[0] == 'M':
+                    self._merges.append((entry[2], int(entry[1])))
+    def _get_ranges(self, key):
+        '''
+        Args:
+            key: String => key of file (or file output)
+        Returns:
+            Gen<Tuple<Integer, Integer>>
+            Completed chunks of key as ranges [start, end) in ascending order
+        Preconditions:
+            N/A
+        '''
+        start = end = None
+        for chunkidx in sorted(self._completed.get(key, set())):
+            if chunkidx != end:
+                if start is not None:
+                    yield (start, end)
+                start = chunkidx
+            end = chunkidx + 1
+        if start is not None:
+            yield (start, end)
+    def compact(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Rewrite the journal file with one entry per node and one entry
+            per range of completed chunks, dropping merge entries (replaces
+            the journal file atomically)
+        Preconditions:
+            N/A
+        '''
+        compact_path = self.filepath + '.tmp'
+        with open(compact_path, 'w') as journal:
+            for nodeidx in sorted(self._nodes):
+                journal.write('F\t%d\t%s\n'%(nodeidx, self._nodes[nodeidx]))
+            for key in sorted(self._completed):
+                for start, end in self._get_ranges(key):
+                    journal.write('C\t%s\t%d\t%d\n'%(key, start, end))
+            for key in sorted(self._chunk_counts):
+                journal.write('E\t%s\t%d\n'%(key, self._chunk_counts[key]))
+        os.replace(compact_path, self.filepath)
+        self._merges = list()
+    def reset(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Start an empty journal file
+        Preconditions:
+            N/A
+        '''
+        open(self.filepath, 'w').close()
+        self._nodes = dict()
+        self._completed = dict()
+        self._chunk_counts = dict()
+        self._merges = list()
+    def remove(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Remove the journal file (i.e. once the run is complete)
+        Preconditions:
+            N/A
+        '''
+        if self.exists():
+            os.remove(self.filepath)
+    def _append(self, *entry):
+        '''
+        Args:
+            entry: Tuple<Any>   => fields of entry
+        Procedure:
+            Append entry to the journal file
+        Preconditions:
+            N/A
+        '''
+        with open(self.filepath, 'a') as journal:
+            journal.write('\t'.join(str(field) for field in entry) + '\n')
+    def get_key(self, nodeidx):
+        '''
+        Args:
+            nodeidx: Integer    => index of node (EVTX file)
+        Returns:
+            String
+            Key of file at nodeidx, None if unknown
+        Preconditions:
+            N/A
+        '''
+        return self._nodes.get(nodeidx)
+    def set_key(self, nodeidx, key):
+        '''
+        Args:
+            nodeidx: Integer    => index of node (EVTX file)
+            key: String         => key of file at nodeidx (see EventLogX.get_identity), None if
+                                   the file cannot be checkpointed (i.e. a stream)
+        Procedure:
+            Record that nodeidx is the file with key, forgetting chunks
+            previously completed for key if nodeidx was not that file
+        Preconditions:
+            N/A
+        '''
+        if key is None:
+            self._nodes.pop(nodeidx, None)
+        elif self._nodes.get(nodeidx) != key:
+            self._forget(key)
+            self._nodes[nodeidx] = key
+            self._append('F', nodeidx, key)
+    @staticmethod
+    def get_keys(key, outputs=None):
+        '''
+        Args:
+            key: String             => key of file
+            outputs: List<String>   => names of outputs of file (None if only one)
+        Returns:
+            List<String>
+            Keys chunks of each output of the file are completed under
+        Preconditions:
+            N/A
+        '''
+        if outputs is None:
+            return [key]
+        return ['%s:%s'%(key, output) for output in outputs]
+    def is_complete(self, keys, chunkidx):
+        '''
+        Args:
+            keys: List<String>  => keys of outputs of file (see get_keys)
+            chunkidx: Integer   => index of chunk
+        Returns:
+            Boolean
+            Whether chunkidx is complete for every key
+        Preconditions:
+            N/A
+        '''
+        return all(chunkidx in self._completed.get(key, ()) for key in keys)
+    def is_file_complete(self, key, keys):
+        '''
+        Args:
+            key: String         => key of file
+            keys: List<String>  => keys of outputs of file (see get_keys)
+        Returns:
+            Boolean
+            Whether every chunk of the file is complete for every key
+        Preconditions:
+            N/A
+        '''
+        chunk_count = self._chunk_counts.get(key)
+        if chunk_count is None:
+            return False
+        return all(self._completed.get(output_key, set()).issuperset(range(chunk_count)) for output_key in keys)
+    def complete(self, keys, start, end):
+        '''
+        Args:
+            keys: List<String>  => keys of outputs of file (see get_keys)
+            start: Integer      => index of first completed chunk
+            end: Integer        => index after last completed chunk
+        Procedure:
+            Record chunks [start, end) as complete for every key
+        Preconditions:
+            N/A
+        '''
+        for key in keys:
+            self._completed.setdefault(key, set()).update(range(start, end))
+            append_checkpoint(self.filepath, key, start, end)
+    def end_file(self, key, chunk_count):
+        '''
+        Args:
+            key: String             => key of file
+            chunk_count: Integer    => number of chunks in file
+        Procedure:
+            Record that every chunk of the file has been submitted
+        Preconditions:
+            N/A
+        '''
+        self._chunk_counts[key] = chunk_count
+        self._append('E', key, chunk_count)
+    def begin_merge(self, target):
+        '''
+        Args:
+            target: String  => path of file output is about to be merged into
+        Procedure:
+            Record the size of target before merging, so a resumed run can
+            truncate what an interrupted merge appended to it
+        Preconditions:
+            N/A
+        '''
+        size = os.path.getsize(target) if os.path.isfile(target) else 0
+        self._merges.append((target, size))
+        self._append('M', size, target)
@@ -0,0 +1,506 @@
+## -*- coding: UTF-8 -*-
+## columnar.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+
+import logging
+Logger = logging.getLogger(__name__)
+import os
+import sys
+from array import array
+from struct import Struct
+from json import dumps, loads
+from glob import glob
+from heapq import merge as heapq_merge
+from itertools import groupby
+from datetime import datetime, timezone
+from construct.lib import Container
+
+from src.utils.jsonl import JSONLinesEncoder
+
+COLUMNAR_MAGIC = b'AEVTXCOL'
+COLUMNAR_VERSION = 1
+FOOTER_SIZE = Struct('<Q')
+INT_COLUMNS = ('record_id', 'timestamp', 'event_id')
+DICT_COLUMNS = ('provider', 'channel', 'computer')
+BASE_COLUMNS = INT_COLUMNS + DICT_COLUMNS
+MISSING_EVENT_ID = -1
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_ENCODER = JSONLinesEncoder()
+
+def _pack_ints(values, typecode='q'):
+    '''
+    Args:
+        values: List<Integer>   => integers to pack
+        typecode: String        => array typecode (q for int64, i for int32)
+    Returns:
+        ByteString
+        values packed as little-endian integers
+    Preconditions:
+        every value fits in typecode    (assumed True)
+    '''
+    packed = array(typecode, values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+def _unpack_ints(data, typecode='q'):
+    '''
+    Args:
+        data: ByteString    => integers packed with _pack_ints
+        typecode: String    => array typecode data was packed with
+    Returns:
+        List<Integer>
+        Unpacked integers
+    Preconditions:
+        N/A
+    '''
+    unpacked = array(typecode)
+    unpacked.frombytes(data)
+    if sys.byteorder != 'little':
+        unpacked.byteswap()
+    return unpacked.tolist()
+
+def _pack_strings(values):
+    '''
+    Args:
+        values: List<String>    => strings to pack
+    Returns:
+        ByteString
+        int32 byte length of each string followed by the UTF-8 encoded strings
+    Preconditions:
+        N/A
+    '''
+    encoded = [value.encode('utf8') for value in values]
+    return _pack_ints([len(value) for value in encoded], 'i') + b''.join(encoded)
+
+def _unpack_strings(data, count):
+    '''
+    Args:
+        data: ByteString    => strings packed with _pack_strings
+        count: Integer      => number of strings packed
+    Returns:
+        List<String>
+        Unpacked strings
+    Preconditions:
+        N/A
+    '''
+    lengths = _unpack_ints(data[:count * 4], 'i')
+    values = list()
+    offset = count * 4
+    for length in lengths:
+        values.append(data[offset:offset + length].decode('utf8'))
+        offset += length
+    return values
+
+def _encode_values(values):
+    '''
+    Args:
+        values: List<Any>   => values of EventData field (one per record)
+    Returns:
+        Tuple<String, ByteString>
+        Type of column (int64 if every value is an integer, str if every
+        value is a string, json otherwise) and values encoded as that type
+    Preconditions:
+        N/A
+    '''
+    if all(type(value) is int and INT64_MIN <= value <= INT64_MAX for value in values):
+        return ('int64', _pack_ints(values))
+    if all(type(value) is str for value in values):
+        return ('str', _pack_strings(values))
+    return ('json', _pack_strings([_ENCODER.encode(value) for value in values]))
+
+def _decode_values(column_type, data, count, dictionary=None):
+    '''
+    Args:
+        column_type: String         => type of column (see _encode_values)
+        data: ByteString            => encoded column
+        count: Integer              => number of values in column
+        dictionary: List<String>    => distinct values of dict column
+    Returns:
+        List<Any>
+        Decoded values of column
+    Preconditions:
+        N/A
+    '''
+    if column_type == 'int64':
+        return _unpack_ints(data)
+    if column_type == 'dict':
+        return [dictionary[code] for code in _unpack_ints(data, 'i')]
+    if column_type == 'str':
+        return _unpack_strings(data, count)
+    return [loads(value) for value in _unpack_strings(data, count)]
+
+def to_timestamp(value):
+    '''
+    Args:
+        value: Integer|DateTime => timestamp (naive DateTimes are taken as UTC)
+    Returns:
+        Integer
+        value as nanoseconds since the Unix epoch
+    Preconditions:
+        N/A
+    '''
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000000 + delta.microseconds * 1000
+
+def encode_block(rows):
+    '''
+    Args:
+        rows: List<Container<String, Any>>  => rows to encode, with record_id, timestamp
+                                               (nanoseconds since the Unix epoch), event_id,
+                                               provider, channel, computer and event_data
+                                               (Container, None if record has no EventData)
+    Returns:
+        Tuple<ByteString, Dict<String, Any>>
+        Block of typed columns and its metadata:
+            rows                => number of rows
+            stats               => [min, max] of each of INT_COLUMNS
+            columns             => [type, offset, length] of each of BASE_COLUMNS
+                                   (plus the dictionary of dict columns)
+            templates           => for each set of EventData fields in block, the
+                                   fields, the column of indices of the rows that
+                                   have them and [type, offset, length] of each field
+        Offsets are relative to the start of the block
+    Preconditions:
+        N/A
+    '''
+    parts = list()
+    size = [0]
+    def add_column(column_type, data, *extra):
+        parts.append(data)
+        size[0] += len(data)
+        return [column_type, size[0] - len(data), len(data)] + list(extra)
+    meta = dict(rows=len(rows), stats=dict(), columns=dict(), templates=list())
+    for name in INT_COLUMNS:
+        values = [row[name] for row in rows]
+        if name == 'event_id':
+            values = [MISSING_EVENT_ID if value is None else value for value in values]
+        meta['columns'][name] = add_column('int64', _pack_ints(values))
+        meta['stats'][name] = [min(values), max(values)] if len(values) > 0 else None
+    for name in DICT_COLUMNS:
+        codes = dict()
+        values = [codes.setdefault(row[name], len(codes)) for row in rows]
+        meta['columns'][name] = add_column('dict', _pack_ints(values, 'i'), list(codes))
+    templates = dict()
+    for rowidx, row in enumerate(rows):
+        fields = tuple(row.event_data) if row.event_data is not None else None
+        templates.setdefault(fields, list()).append(rowidx)
+    for fields, rowidxs in templates.items():
+        template = dict(fields=list(fields) if fields is not None else None, columns=dict())
+        template['rows'] = add_column('int32', _pack_ints(rowidxs, 'i'))
+        for field in (fields or tuple()):
+            template['columns'][field] = add_column(*_encode_values([rows[rowidx].event_data[field] for rowidx in rowidxs]))
+        meta['templates'].append(template)
+    return (b''.join(parts), meta)
+
+def decode_block(block, meta):
+    '''
+    Args:
+        block: ByteString           => block encoded with encode_block
+        meta: Dict<String, Any>     => metadata of block
+    Returns:
+        List<Container<String, Any>>
+        Rows of block (see encode_block)
+    Preconditions:
+        N/A
+    '''
+    read_column = lambda column: block[column[1]:column[1] + column[2]]
+    return _decode_rows(meta, read_column, BASE_COLUMNS + ('event_data',))
+
+def _decode_rows(meta, read_column, columns):
+    '''
+    Args:
+        meta: Dict<String, Any>                     => metadata of block
+        read_column: Callable<List> -> ByteString   => function to read column of block
+        columns: NTuple<String>                     => names of columns to decode (of
+                                                       BASE_COLUMNS, event_data and
+                                                       EventData.<field>)
+    Returns:
+        List<Container<String, Any>>
+        Rows of block with only columns
+    Preconditions:
+        N/A
+    '''
+    count = meta['rows']
+    rows = [Container() for rowidx in range(count)]
+    for name in columns:
+        if name in BASE_COLUMNS:
+            column = meta['columns'][name]
+            values = _decode_values(column[0], read_column(column), count, *column[3:])
+            if name == 'event_id':
+                values = [None if value == MISSING_EVENT_ID else value for value in values]
+            for row, value in zip(rows, values):
+                row[name] = value
+            continue
+        field = name[len('EventData.'):] if name.startswith('EventData.') else None
+        for row in rows:
+            row[name] = None
+        for template in meta['templates']:
+            if template['fields'] is None or (field is not None and field not in template['fields']):
+                continue
+            rowidxs = _unpack_ints(read_column(template['rows']), 'i')
+            for template_field in (template['fields'] if field is None else [field]):
+                column = template['columns'][template_field]
+                values = _decode_values(column[0], read_column(column), len(rowidxs))
+                for rowidx, value in zip(rowidxs, values):
+                    if field is not None:
+                        rows[rowidx][name] = value
+                    else:
+                        if rows[rowidx][name] is None:
+                            rows[rowidx][name] = Container()
+                        rows[rowidx][name][template_field] = value
+    return rows
+
+def tag_block(block, meta, chunkidx):
+    '''
+    Args:
+        block: ByteString           => block encoded with encode_block
+        meta: Dict<String, Any>     => metadata of block
+        chunkidx: Integer           => index of chunk rows were parsed from
+    Returns:
+        ByteString
+        block prefixed with the header merge_tagged_blocks orders blocks
+        by (chunk index, length of block and metadata of block)
+    Preconditions:
+        N/A
+    '''
+    return ('%d\t%d\t%s\n'%(chunkidx, len(block), dumps(meta))).encode('utf8') + block
+
+def _read_tagged_blocks(handle):
+    '''
+    Args:
+        handle: BinaryIO    => open file of blocks written with tag_block
+    Returns:
+        Gen<Tuple<Integer, Dict<String, Any>, ByteString>>
+        Chunk index, metadata and block of each chunk (stopping at a block
+        cut short, i.e. by a worker being killed while writing it)
+    Preconditions:
+        handle is open for reading in binary mode   (assumed True)
+    '''
+    for header in handle:
+        try:
+            chunkidx, length, meta = header.decode('utf8').split('\t', 2)
+            block = handle.read(int(length))
+            complete = header.endswith(b'\n') and len(block) == int(length)
+            meta = loads(meta) if complete else None
+        except ValueError:
+            complete = False
+        if not complete:
+            Logger.warning('Ignoring truncated output at end of %s'%handle.name)
+            break
+        yield (int(chunkidx), meta, block)
+
+def merge_tagged_blocks(glob_pattern, target, sources, clean=True, limit=None):
+    '''
+    Args:
+        glob_pattern: String    => glob pattern of files to merge
+        target: String          => file path to write columnar file to
+        sources: List<String>   => paths of EVTX files, in node order
+        clean: Boolean          => whether to remove merged files
+        limit: Integer          => maximum number of rows to write (all if None)
+    Procedure:
+        Columnar counterpart of merge_tagged_files: files hold one block
+        per chunk written with tag_block, and target is written as the
+        blocks ordered by group (node) then chunk index, followed by the
+        footer (see ColumnarReader). Only the block the limit falls in is
+        decoded, to be encoded again without the rows past the limit
+    Preconditions:
+        glob_pattern is of type String
+        target is of type String
+    '''
+    assert isinstance(glob_pattern, str), 'Glob_pattern is not of type String'
+    assert isinstance(target, str), 'Target is not of type String'
+    file_list = sorted(glob(glob_pattern), key=os.path.basename)
+    remaining = limit
+    blocks = list()
+    with open(target, 'wb') as target_file:
+        target_file.write(COLUMNAR_MAGIC)
+        offset = len(COLUMNAR_MAGIC)
+        for group, group_files in groupby(file_list, key=lambda filepath: os.path.basename(filepath).split('_', 1)[0]):
+            if remaining is not None and remaining <= 0:
+                break
+            handle_list = [open(filepath, 'rb') for filepath in group_files]
+            try:
+                last_chunkidx = None
+                for chunkidx, meta, block in heapq_merge(*[_read_tagged_blocks(handle) for handle in handle_list], key=lambda result: result[0]):
+                    if chunkidx == last_chunkidx:
+                        continue
+                    last_chunkidx = chunkidx
+                    if remaining is not None:
+                        if remaining <= 0:
+                            break
+                        if meta['rows'] > remaining:
+                            block, meta = encode_block(decode_block(block, meta)[:remaining])
+                        remaining -= meta['rows']
+                    if meta['rows'] == 0:
+                        continue
+                    meta.update(source=int(group), chunk=chunkidx, offset=offset, length=len(block))
+                    target_file.write(block)
+                    offset += len(block)
+                    blocks.append(meta)
+            finally:
+                for handle in handle_list:
+                    handle.close()
+        footer = dumps(dict(version=COLUMNAR_VERSION, sources=list(sources), blocks=blocks)).encode('utf8')
+        target_file.write(footer)
+        target_file.write(FOOTER_SIZE.pack(len(footer)))
+        target_file.write(COLUMNAR_MAGIC)
+    if clean:
+        for filepath in file_list:
+            os.remove(filepath)
+
+class ColumnarReader(object):
+    '''
+    Class to read columnar files written by the columnar parse directive.
+    A columnar file is the magic number, then one block of typed columns
+    per EVTX chunk (record_id, timestamp and event_id as int64, provider,
+    channel and computer dictionary encoded, and the EventData fields
+    of each template in the block as int64, str or json columns), then a
+    JSON footer with the metadata of every block (including the min/max
+    of each int column), the footer length and the magic number again.
+    Only the columns asked for are read, and blocks whose statistics
+    rule out the time range or event IDs asked for are skipped unread.
+    '''
+    def __init__(self, filepath):
+        self._file = open(filepath, 'rb')
+        try:
+            self._file.seek(-(FOOTER_SIZE.size + len(COLUMNAR_MAGIC)), os.SEEK_END)
+            footer_size, magic = FOOTER_SIZE.unpack(self._file.read(FOOTER_SIZE.size)) + (self._file.read(),)
+            assert magic == COLUMNAR_MAGIC, '%s is not a columnar file'%filepath
+            self._file.seek(-(footer_size + FOOTER_SIZE.size + len(COLUMNAR_MAGIC)), os.SEEK_END)
+            self._footer = loads(self._file.read(footer_size).decode('utf8'))
+            assert self._footer['version'] == COLUMNAR_VERSION, 'Unsupported columnar file version %s'%self._footer['version']
+        except Exception:
+            self._file.close()
+            raise
+    @property
+    def sources(self):
+        '''
+        @sources.getter
+        '''
+        return self._footer['sources']
+    @property
+    def blocks(self):
+        '''
+        @blocks.getter
+        '''
+        return self._footer['blocks']
+    @property
+    def row_count(self):
+        '''
+        @row_count.getter
+        '''
+        return sum(block['rows'] for block in self.blocks)
+    def _read_column(self, block, column):
+        '''
+        Args:
+            block: Dict<String, Any>    => metadata of block
+            column: List<Any>           => [type, offset, length] of column in block
+        Returns:
+            ByteString
+            Encoded column
+        Preconditions:
+            N/A
+        '''
+        self._file.seek(block['offset'] + column[1])
+        return self._file.read(column[2])
+    def select_blocks(self, start=None, end=None, event_ids=None):
+        '''
+        Args:
+            start: Integer|DateTime => earliest timestamp of rows to read
+            end: Integer|DateTime   => latest timestamp of rows to read
+            event_ids: Set<Integer> => event IDs of rows to read
+        Returns:
+            List<Dict<String, Any>>
+            Metadata of blocks that may hold rows within start and end
+            (inclusive) with one of event_ids, by their min/max statistics
+        Preconditions:
+            N/A
+        '''
+        start, end = to_timestamp(start), to_timestamp(end)
+        selected = list()
+        for block in self.blocks:
+            min_timestamp, max_timestamp = block['stats']['timestamp']
+            if (start is not None and max_timestamp < start) or (end is not None and min_timestamp > end):
+                continue
+            if event_ids is not None:
+                min_event_id, max_event_id = block['stats']['event_id']
+                if not any(min_event_id <= event_id <= max_event_id for event_id in event_ids):
+                    continue
+            selected.append(block)
+        return selected
+    def read(self, columns=None, start=None, end=None, event_ids=None):
+        '''
+        Args:
+            columns: List<String>   => columns to read (of record_id, timestamp, event_id,
+                                       provider, channel, computer, event_data and
+                                       EventData.<field>, default: all but EventData.<field>)
+            start: Integer|DateTime => earliest timestamp of rows to read
+            end: Integer|DateTime   => latest timestamp of rows to read
+            event_ids: Set<Integer> => event IDs of rows to read
+        Returns:
+            Gen<Container<String, Any>>
+            Rows (in file and chunk order) with only columns, skipping blocks
+            ruled out by their statistics (see select_blocks) and rows outside
+            start and end or without one of event_ids. Timestamps are
+            nanoseconds since the Unix epoch, missing values are None
+        Preconditions:
+            N/A
+        '''
+        columns = tuple(columns) if columns is not None else BASE_COLUMNS + ('event_data',)
+        start, end = to_timestamp(start), to_timestamp(end)
+        if event_ids is not None:
+            event_ids = set(event_ids)
+        filters = tuple(name for name, active in (('timestamp', start is not None or end is not None), ('event_id', event_ids is not None)) if active and name not in columns)
+        for block in self.select_blocks(start, end, event_ids):
+            for row in _decode_rows(block, lambda column: self._read_column(block, column), columns + filters):
+                if start is not None and row.timestamp < start:
+                    continue
+                if end is not None and row.timestamp > end:
+                    continue
+                if event_ids is not None and row.event_id not in event_ids:
+                    continue
+                for name in filters:
+                    del row[name]
+                yield row
+    def close(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Close the columnar file
+        Preconditions:
+            N/A
+        '''
+        self._file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,123 @@
+## -*- coding: UTF-8 -*-
+## jsonl.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+
+import logging
+Logger = logging.getLogger(__name__)
+from datetime import datetime
+from json import dumps
+from json.encoder import encode_basestring_ascii
+from construct.lib import Container
+
+MAX_KEY_PLANS = 4096
+
+class JSONLinesEncoder(object):
+    '''
+    Class to encode parsed EVTX records as single-line JSON, producing the
+    same output as dumps(record.serialize(), sort_keys=True) without
+    building the serialized copy of the record. Records rendered from the
+    same template share their keys, so the sorted list of keys of each
+    Container (minus Raw and private keys), with every key pre-escaped,
+    is computed once per set of keys and reused. Strings, integers, None
+    and booleans are encoded directly, datetimes and bytes are converted
+    as serialize would convert them, and any other value (floats, plain
+    dicts, etc.) falls back to dumps.
+    '''
+    def __init__(self):
+        self._plans = dict()
+    def _get_plan(self, keys):
+        '''
+        Args:
+            keys: Tuple<String>    => keys of Container to encode, in order
+        Returns:
+            List<Tuple<String, String>>
+            Keys of Container to output in sorted order, each with the text
+            to output before its value (separator, escaped key and colon)
+        Preconditions:
+            N/A
+        '''
+        plan = self._plans.get(keys)
+        if plan is None:
+            if len(self._plans) >= MAX_KEY_PLANS:
+                self._plans.clear()
+            plan = list()
+            for key in sorted(key for key in keys if not (key.startswith('Raw') or key.startswith('_'))):
+                plan.append((key, ('{' if len(plan) == 0 else ', ') + encode_basestring_ascii(key) + ': '))
+            self._plans[keys] = plan
+        return plan
+    def _encode_value(self, value, parts):
+        '''
+        Args:
+            value: Any          => value to encode
+            parts: List<String> => list to append encoded text to
+        Procedure:
+            Append JSON encoding of value to parts
+        Preconditions:
+            N/A
+        '''
+        value_type = type(value)
+        if value_type is str:
+            parts.append(encode_basestring_ascii(value))
+        elif value is None:
+            parts.append('null')
+        elif value_type is int:
+            parts.append(int.__repr__(value))
+        elif value_type is bool:
+            parts.append('true' if value else 'false')
+        elif isinstance(value, Container):
+            plan = self._get_plan(tuple(value))
+            if len(plan) == 0:
+                parts.append('{}')
+            else:
+                for key, prefix in plan:
+                    parts.append(prefix)
+                    self._encode_value(value[key], parts)
+                parts.append('}')
+        elif isinstance(value, list):
+            if len(value) == 0:
+                parts.append('[]')
+            else:
+                for idx, entry in enumerate(value):
+                    parts.append('[' if idx == 0 else ', ')
+                    self._encode_value(entry, parts)
+                parts.append(']')
+        elif isinstance(value, datetime):
+            parts.append(encode_basestring_ascii(value.strftime('%Y-%m-%d %H:%M:%S.%f%z')))
+        elif isinstance(value, (bytes, bytearray)):
+            parts.append(encode_basestring_ascii(value.decode('UTF8', errors='replace')))
+        else:
+            parts.append(dumps(value, sort_keys=True))
+    def encode(self, record):
+        '''
+        Args:
+            record: Container<String, Any>  => parsed record to encode
+        Returns:
+            String
+            JSON encoding of record, identical to
+            dumps(record.serialize(), sort_keys=True)
+        Preconditions:
+            record is of type Container (assumed True)
+        '''
+        parts = list()
+        self._encode_value(record, parts)
+        return ''.join(parts)
@@ -0,0 +1,184 @@
+## -*- coding: UTF-8 -*-
+## leases.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+from time import monotonic
+from collections import deque
+from threading import Condition
+
+class LeaseTable(object):
+    '''
+    Class to hand out work units to remote workers as leases. A unit is
+    leased to one worker at a time; if the worker does not complete it
+    before the lease expires (i.e. the worker hung), or its owner releases
+    it (i.e. the worker's connection was lost), the unit is leased again
+    to the next worker that asks. Only the first
+    completion of a unit is accepted, so a slow worker that completes an
+    expired lease does not duplicate its output. At most max_units units
+    can be outstanding (added but not completed), bounding memory use.
+    '''
+    def __init__(self, timeout, max_units):
+        self._timeout = timeout
+        self._max_units = max_units
+        self._units = dict()
+        self._pending = deque()
+        self._leased = dict()
+        self._owners = dict()
+        self._next_unitid = 0
+        self._closed = False
+        self._condition = Condition()
+    def add(self, unit):
+        '''
+        Args:
+            unit: Container<String, Any>    => work unit to lease
+        Returns:
+            Integer
+            ID of unit, assigned as unit.unitid (blocks while max_units
+            units are outstanding)
+        Preconditions:
+            self.close has not been called
+        '''
+        with self._condition:
+            while len(self._units) >= self._max_units:
+                self._condition.wait()
+            unit.unitid = self._next_unitid
+            self._next_unitid += 1
+            self._units[unit.unitid] = unit
+            self._pending.append(unit.unitid)
+            self._condition.notify_all()
+            return unit.unitid
+    def close(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Mark that no more units will be added, so the table is
+            finished once all outstanding units are completed
+        Preconditions:
+            N/A
+        '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+    def _requeue_expired(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Return units whose lease has expired to the pending queue
+        Preconditions:
+            self._condition is held
+        '''
+        now = monotonic()
+        for unitid, deadline in list(self._leased.items()):
+            if deadline <= now:
+                Logger.warning('Lease on unit %d expired, requeueing it'%unitid)
+                del self._leased[unitid]
+                self._owners.pop(unitid, None)
+                self._pending.appendleft(unitid)
+    def acquire(self, owner=None):
+        '''
+        Args:
+            owner: Any  => owner of the lease (i.e. connection to worker), see release
+        Returns:
+            Container<String, Any>
+            Next unit to work on, None if there is no pending unit at the
+            moment (all remaining units are leased or not yet added)
+        Preconditions:
+            N/A
+        '''
+        with self._condition:
+            self._requeue_expired()
+            while len(self._pending) > 0:
+                unitid = self._pending.popleft()
+                if unitid in self._units:
+                    self._leased[unitid] = monotonic() + self._timeout
+                    self._owners[unitid] = owner
+                    return self._units[unitid]
+            return None
+    def release(self, owner):
+        '''
+        Args:
+            owner: Any  => owner of leases to release (see acquire)
+        Returns:
+            Integer
+            Number of units leased to owner that were returned to the front
+            of the pending queue, so they are leased again without waiting
+            for their leases to expire
+        Preconditions:
+            owner is not None
+        '''
+        with self._condition:
+            unitids = sorted(unitid for unitid, unit_owner in self._owners.items() if unit_owner is owner)
+            for unitid in reversed(unitids):
+                del self._owners[unitid]
+                del self._leased[unitid]
+                self._pending.appendleft(unitid)
+            if len(unitids) > 0:
+                self._condition.notify_all()
+            return len(unitids)
+    def complete(self, unitid, commit=None):
+        '''
+        Args:
+            unitid: Integer         => ID of unit a worker has completed
+            commit: Callable<Unit>  => function to keep the result of the unit, called
+                                       with the unit on its first completion only and
+                                       before the table can be seen as finished
+        Returns:
+            Container<String, Any>
+            Completed unit if this is the first completion of the unit (and
+            its result was kept), None otherwise
+        Preconditions:
+            N/A
+        '''
+        with self._condition:
+            unit = self._units.get(unitid)
+            if unit is not None:
+                if commit is not None:
+                    commit(unit)
+                del self._units[unitid]
+                self._leased.pop(unitid, None)
+                self._owners.pop(unitid, None)
+                self._condition.notify_all()
+            return unit
+    @property
+    def finished(self):
+        '''
+        @finished.getter
+        Returns True if the table is closed and every unit has been completed
+        '''
+        with self._condition:
+            return self._closed and len(self._units) == 0
+    def wait_finished(self, timeout=None):
+        '''
+        Args:
+            timeout: Float  => maximum number of seconds to wait
+        Returns:
+            Boolean
+            Whether the table finished within timeout
+        Preconditions:
+            N/A
+        '''
+        with self._condition:
+            return self._condition.wait_for(lambda: self._closed and len(self._units) == 0, timeout)
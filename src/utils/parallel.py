@@ -24,16 +24,39 @@
 import logging
 Logger = logging.getLogger(__name__)
 import os
+import bz2
+import gzip
+import lzma
 from uuid import uuid4
-from multiprocessing import Process, JoinableQueue, RLock, cpu_count
+from functools import partial
+from time import perf_counter
+from threading import Thread, Event, Condition
+from collections import OrderedDict, deque
+from multiprocessing import Process, Queue, JoinableQueue, RLock, Array, Pipe, cpu_count
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
 from glob import glob
 from heapq import merge as heapq_merge
+from itertools import groupby
 from tqdm import tqdm
+from construct.lib import Container
 
 from src.utils.config import initialize_logger
+from src.utils.checkpoint import append_checkpoint
 from src.database.models import BaseTable
 
 CPU_COUNT = cpu_count()
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+OUTPUT_SYNC_SIZE = 8 * 1024 * 1024
+OUTPUT_MAX_OPEN = 64
+COMPRESSORS = dict(\
+    gzip=(partial(gzip.compress, compresslevel=6, mtime=0), gzip.decompress),
+    bz2=(bz2.compress, bz2.decompress),
+    xz=(lzma.compress, lzma.decompress)\
+)
+COMPRESSED_EXTENSIONS = dict(gzip='.gz', bz2='.bz2', xz='.xz')
+ENTRY_STARTED = 0
+ENTRY_DONE = 1
 
 def coalesce_files(glob_pattern, target, transform=lambda line: line, clean=True):
     '''
@@ -71,6 +94,435 @@ def coalesce_files(glob_pattern, target, transform=lambda line: line, clean=True
                 for path in file_list:
                     os.remove(path)
 
+def tag_result(result, chunkidx, recordidx):
+    '''
+    Args:
+        result: String      => output record (may span multiple lines)
+        chunkidx: Integer   => index of chunk record was parsed from
+        recordidx: Integer  => record ID of record within its file
+    Returns:
+        String
+        result prefixed with the tag merge_tagged_files orders records by
+        (chunk index, record ID, number of lines in result), terminated by newline
+    Preconditions:
+        result is of type String    (assumed True)
+        chunkidx is of type Integer (assumed True)
+        recordidx is of type Integer (assumed True)
+    '''
+    return '%d\t%d\t%d\t%s\n'%(chunkidx, recordidx, result.count('\n') + 1, result)
+
+def _read_tagged_results(handle):
+    '''
+    Args:
+        handle: TextIO  => open file of results written with tag_result
+    Returns:
+        Gen<Tuple<Tuple<Integer, Integer>, String>>
+        Sort key (chunk index, record ID) and untagged text of each result
+        (stopping at a result cut short, i.e. by a worker being killed while
+        writing it)
+    Preconditions:
+        handle is open for reading  (assumed True)
+    '''
+    for line in handle:
+        complete = line.endswith('\n')
+        try:
+            chunkidx, recordidx, line_count, text = line.split('\t', 3)
+            for i in range(int(line_count) - 1):
+                line = handle.readline()
+                complete = complete and line.endswith('\n')
+                text += line
+        except ValueError:
+            complete = False
+        if not complete:
+            Logger.warning('Ignoring truncated result at end of %s'%handle.name)
+            break
+        yield ((int(chunkidx), int(recordidx)), text)
+
+def merge_tagged_files(glob_pattern, target, clean=True, limit=None):
+    '''
+    Args:
+        glob_pattern: String    => glob pattern of files to merge
+        target: String          => file path to merge files into
+        clean: Boolean          => whether to remove merged files
+        limit: Integer          => maximum number of results to append (all if None)
+    Procedure:
+        Gather all files that match glob_pattern and append their results
+        to target without tags, ordered by group then (chunk index, record ID).
+        Files are named <group>_<name>, where groups (i.e. zero-padded node
+        indices) sort in output order, and hold results written with tag_result
+        in ascending chunk order (one file per worker per group), so each
+        group is a k-way merge of its files on the numeric tags. A result
+        written more than once (i.e. a chunk parsed again after a run was
+        interrupted) is only output once. Files are only removed once all
+        results have been merged (or limit results have been appended)
+    Preconditions:
+        glob_pattern is of type String
+        target is of type String
+    '''
+    assert isinstance(glob_pattern, str), 'Glob_pattern is not of type String'
+    assert isinstance(target, str), 'Target is not of type String'
+    file_list = sorted(glob(glob_pattern), key=os.path.basename)
+    remaining = limit
+    with open(target, 'a') as target_file:
+        for group, group_files in groupby(file_list, key=lambda filepath: os.path.basename(filepath).split('_', 1)[0]):
+            if remaining is not None and remaining <= 0:
+                break
+            handle_list = [open(filepath, 'r') for filepath in group_files]
+            try:
+                last_key = None
+                for key, text in heapq_merge(*[_read_tagged_results(handle) for handle in handle_list], key=lambda result: result[0]):
+                    if key != last_key:
+                        if remaining is not None:
+                            if remaining <= 0:
+                                break
+                            remaining -= 1
+                        target_file.write(text)
+                        last_key = key
+            finally:
+                for handle in handle_list:
+                    handle.close()
+    if clean:
+        for filepath in file_list:
+            os.remove(filepath)
+
+def get_shard_path(filepath, shard):
+    '''
+    Args:
+        filepath: String    => path of output file
+        shard: String       => name of shard
+    Returns:
+        String
+        Path of output file for shard (shard inserted before the extension
+        of filepath, and before any compression extension)
+    Preconditions:
+        N/A
+    '''
+    root, extension = os.path.splitext(filepath)
+    if extension in COMPRESSED_EXTENSIONS.values():
+        root, format_extension = os.path.splitext(root)
+        extension = format_extension + extension
+    return root + '.' + shard + extension
+
+def compress_results(results, compress):
+    '''
+    Args:
+        results: List<String>   => output records (each may span multiple lines)
+        compress: String        => compression method (key of COMPRESSORS)
+    Returns:
+        ByteString
+        results, each terminated by newline, compressed as one independent
+        gzip member, bz2 stream or xz stream (i.e. one that is valid on its own
+        and when concatenated with others)
+    Preconditions:
+        compress is a key of COMPRESSORS    (assumed True)
+    '''
+    return COMPRESSORS[compress][0](''.join(result + '\n' for result in results).encode('utf8'))
+
+def tag_member(member, results, chunkidx):
+    '''
+    Args:
+        member: ByteString      => results compressed with compress_results
+        results: List<String>   => output records compressed into member
+        chunkidx: Integer       => index of chunk records were parsed from
+    Returns:
+        ByteString
+        member prefixed with the header merge_tagged_members orders members
+        by (chunk index, number of records, length of member and, if any
+        record spans multiple lines, number of lines in each record)
+    Preconditions:
+        N/A
+    '''
+    line_counts = [result.count('\n') + 1 for result in results]
+    if len(line_counts) == sum(line_counts):
+        line_counts = list()
+    return ('%d\t%d\t%d\t%s\n'%(chunkidx, len(results), len(member), ','.join(map(str, line_counts)))).encode('utf8') + member
+
+def _read_tagged_members(handle):
+    '''
+    Args:
+        handle: BinaryIO    => open file of members written with tag_member
+    Returns:
+        Gen<Tuple<Integer, Integer, List<Integer>, ByteString>>
+        Chunk index, number of records, number of lines in each record (empty
+        if every record is one line) and compressed member of each chunk
+        (stopping at a member cut short, i.e. by a worker being killed while
+        writing it)
+    Preconditions:
+        handle is open for reading in binary mode   (assumed True)
+    '''
+    for header in handle:
+        try:
+            chunkidx, record_count, length, line_counts = header.decode('utf8').split('\t')
+            member = handle.read(int(length))
+            complete = header.endswith(b'\n') and len(member) == int(length)
+            line_counts = [int(line_count) for line_count in line_counts.split(',')] if len(line_counts) > 1 else list()
+        except ValueError:
+            complete = False
+        if not complete:
+            Logger.warning('Ignoring truncated output at end of %s'%handle.name)
+            break
+        yield (int(chunkidx), int(record_count), line_counts, member)
+
+def _truncate_member(member, record_count, line_counts, compress):
+    '''
+    Args:
+        member: ByteString          => compressed member (see _read_tagged_members)
+        record_count: Integer       => number of records to keep
+        line_counts: List<Integer>  => number of lines in each record of member
+                                       (empty if every record is one line)
+        compress: String            => compression method of member
+    Returns:
+        ByteString
+        member recompressed with only its first record_count records
+    Preconditions:
+        N/A
+    '''
+    compressor, decompressor = COMPRESSORS[compress]
+    lines = decompressor(member).splitlines(keepends=True)
+    line_count = sum(line_counts[:record_count]) if len(line_counts) > 0 else record_count
+    return compressor(b''.join(lines[:line_count]))
+
+def merge_tagged_members(glob_pattern, target, compress, clean=True, limit=None):
+    '''
+    Args:
+        glob_pattern: String    => glob pattern of files to merge
+        target: String          => file path to merge files into
+        compress: String        => compression method members were written with
+        clean: Boolean          => whether to remove merged files
+        limit: Integer          => maximum number of results to append (all if None)
+    Procedure:
+        Compressed counterpart of merge_tagged_files: files hold one member
+        per chunk written with tag_member, and members are appended to
+        target as they are, ordered by group then chunk index, so target is
+        the byte-level concatenation of the members. Only the member the
+        limit falls in is decompressed, to be recompressed without the
+        records past the limit
+    Preconditions:
+        glob_pattern is of type String
+        target is of type String
+        compress is a key of COMPRESSORS    (assumed True)
+    '''
+    assert isinstance(glob_pattern, str), 'Glob_pattern is not of type String'
+    assert isinstance(target, str), 'Target is not of type String'
+    file_list = sorted(glob(glob_pattern), key=os.path.basename)
+    remaining = limit
+    with open(target, 'ab') as target_file:
+        for group, group_files in groupby(file_list, key=lambda filepath: os.path.basename(filepath).split('_', 1)[0]):
+            if remaining is not None and remaining <= 0:
+                break
+            handle_list = [open(filepath, 'rb') for filepath in group_files]
+            try:
+                last_chunkidx = None
+                for chunkidx, record_count, line_counts, member in heapq_merge(*[_read_tagged_members(handle) for handle in handle_list], key=lambda result: result[0]):
+                    if chunkidx != last_chunkidx:
+                        if remaining is not None:
+                            if remaining <= 0:
+                                break
+                            if record_count > remaining:
+                                member = _truncate_member(member, remaining, line_counts, compress)
+                                record_count = remaining
+                            remaining -= record_count
+                        target_file.write(member)
+                        last_chunkidx = chunkidx
+            finally:
+                for handle in handle_list:
+                    handle.close()
+    if clean:
+        for filepath in file_list:
+            os.remove(filepath)
+
+class TaskBatch(list):
+    '''
+    List of tasks (or results) transferred through a queue as a single
+    item, so the batch is pickled and sent through the pipe once
+    '''
+    pass
+
+class OutputWriter(object):
+    '''
+    Class to append output to a file that stays open for the lifetime of
+    a worker. Output is collected in memory and written with a single
+    write per flush; checkpoints of chunks whose output has been written
+    are held back until the file has been synced (every OUTPUT_SYNC_SIZE
+    bytes, and on close), so the journal never gets ahead of the output.
+    Binary writers append ByteStrings (i.e. compressed output)
+    '''
+    def __init__(self, filepath, buffer_size=OUTPUT_BUFFER_SIZE, sync_size=OUTPUT_SYNC_SIZE, binary=False):
+        self._file = open(filepath, 'ab' if binary else 'a', buffering=buffer_size)
+        self._binary = binary
+        self._pending = list()
+        self._checkpoints = list()
+        self._sync_size = sync_size
+        self._unsynced = 0
+    def write(self, text):
+        '''
+        Args:
+            text: String|ByteString => output to append (ByteString if binary)
+        Procedure:
+            Append text to the output waiting to be written
+        Preconditions:
+            N/A
+        '''
+        self._pending.append(text)
+    def add_checkpoint(self, journal, key, start, end):
+        '''
+        Args:
+            journal: String => path of checkpoint journal
+            key: String     => key chunks are checkpointed under
+            start: Integer  => index of first chunk whose output was written
+            end: Integer    => index after last chunk whose output was written
+        Procedure:
+            Checkpoint chunks [start, end) once the output written so far is synced
+        Preconditions:
+            N/A
+        '''
+        self._checkpoints.append((journal, key, start, end))
+    def flush(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Write the pending output to the file in one write, syncing
+            it and writing held back checkpoints if enough has been
+            written since the last sync
+        Preconditions:
+            N/A
+        '''
+        if len(self._pending) > 0:
+            text = (b'' if self._binary else '').join(self._pending)
+            self._pending = list()
+            self._file.write(text)
+            self._file.flush()
+            self._unsynced += len(text)
+        if len(self._checkpoints) > 0 and self._unsynced >= self._sync_size:
+            self.sync()
+    @property
+    def unsynced(self):
+        '''
+        @unsynced.getter
+        Returns number of bytes written since the last sync
+        '''
+        return self._unsynced
+    def sync(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Sync the output written so far to disk and write held back checkpoints
+        Preconditions:
+            Pending output has been flushed
+        '''
+        if self._unsynced > 0:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        for checkpoint in self._checkpoints:
+            append_checkpoint(*checkpoint)
+        self._checkpoints = list()
+    def close(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Flush and sync all output and checkpoints and close the file
+        Preconditions:
+            N/A
+        '''
+        try:
+            self.flush()
+            if len(self._checkpoints) > 0:
+                self.sync()
+        finally:
+            self._file.close()
+
+class OutputWriterCache(object):
+    '''
+    Class to keep the OutputWriter of each file a worker writes to open,
+    closing the least recently used writer once max_open are open.
+    Checkpoints of chunks whose output was spread over several files
+    (i.e. sharded output) are held back until every open writer has been
+    synced (writers are synced when closed)
+    '''
+    def __init__(self, max_open=OUTPUT_MAX_OPEN, buffer_size=OUTPUT_BUFFER_SIZE, sync_size=OUTPUT_SYNC_SIZE):
+        self._writers = OrderedDict()
+        self._max_open = max_open
+        self._buffer_size = buffer_size
+        self._sync_size = sync_size
+        self._checkpoints = list()
+    def get(self, filepath, binary=False):
+        '''
+        Args:
+            filepath: String    => path of file to write to
+            binary: Boolean     => whether to open filepath in binary mode
+        Returns:
+            OutputWriter
+            Writer appending to filepath (opened if not already open)
+        Preconditions:
+            filepath is always opened in the same mode  (assumed True)
+        '''
+        writer = self._writers.get(filepath)
+        if writer is not None:
+            self._writers.move_to_end(filepath)
+            return writer
+        while len(self._writers) >= self._max_open:
+            self._writers.popitem(last=False)[1].close()
+        writer = OutputWriter(filepath, self._buffer_size, binary=binary)
+        self._writers[filepath] = writer
+        return writer
+    def add_checkpoint(self, journal, key, start, end):
+        '''
+        @OutputWriter.add_checkpoint
+        NOTE:
+            chunks are checkpointed once every open writer is synced
+        '''
+        self._checkpoints.append((journal, key, start, end))
+    def flush(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Flush pending output of every open writer (i.e. once a task
+            is done, so its output survives the worker being killed),
+            syncing every writer and writing held back checkpoints if
+            enough has been written since the last sync
+        Preconditions:
+            N/A
+        '''
+        for writer in self._writers.values():
+            writer.flush()
+        if len(self._checkpoints) > 0 and sum(writer.unsynced for writer in self._writers.values()) >= self._sync_size:
+            self.sync()
+    def sync(self):
+        '''
+        @OutputWriter.sync
+        '''
+        for writer in self._writers.values():
+            writer.sync()
+        for checkpoint in self._checkpoints:
+            append_checkpoint(*checkpoint)
+        self._checkpoints = list()
+    def close(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Close every open writer, then write held back checkpoints
+            (unless a writer failed to close)
+        Preconditions:
+            N/A
+        '''
+        closed = True
+        while len(self._writers) > 0:
+            filepath, writer = self._writers.popitem(last=False)
+            try:
+                writer.close()
+            except Exception as e:
+                closed = False
+                Logger.error('Failed to close output file %s (%s)'%(filepath, str(e)))
+        if closed:
+            for checkpoint in self._checkpoints:
+                append_checkpoint(*checkpoint)
+        self._checkpoints = list()
+
 class BaseQueueWorker(Process):
     '''
     Class to spawn worker process with queue of tasks
@@ -153,162 +605,672 @@ class LoggedQueueWorker(BaseQueueWorker):
     '''
     @BaseQueueWorker
     '''
-    def __init__(self, *args, log_path=None, **kwargs):
-        super(LoggedQueueWorker, self).__init__(*args, **kwargs)
+    def __init__(self, queue, index=0, *args, log_path=None, batch_results=True, progress=None, ring=None, connection=None, metrics=None, limit=None, **kwargs):
+        super(LoggedQueueWorker, self).__init__(queue, *args, **kwargs)
+        self._index = index
         self._log_path = log_path
+        self._batch_results = batch_results
+        self._connection = connection
+        self._metrics = metrics
+        self.progress = progress
+        self.ring = ring
+        self.limit = limit
+        self.writers = None
     def _preamble(self):
         '''
         @BaseQueueWorker._preamble
         '''
         if self._log_path is not None:
-            initialize_logger(self._log_path, self.name + '_tmp_amft')
+            initialize_logger(self._log_path, self.name + '_tmp_aevtx')
             Logger.info('Started worker: ' + self.name)
+        self.writers = OutputWriterCache()
+    def _task_callback(self, task):
+        '''
+        Args:
+            task: Any   => task (or entry of task batch) that was run
+        Procedure:
+            Callback when a single task has been run (called once
+            per entry when a TaskBatch is taken off the queue)
+        Preconditions:
+            N/A
+        '''
+        return None
+    def _run_task(self, task):
+        '''
+        Args:
+            task: Any   => task (or entry of task batch) to run
+        Returns:
+            List<Any>
+            Results of running task (task itself if not callable)
+        Preconditions:
+            N/A
+        '''
+        try:
+            return task(self) if callable(task) else [task]
+        except Exception as e:
+            if self._log_path is not None:
+                Logger.error('Uncaught exception while executing %s (%s)'%(type(task).__name__, str(e)))
+            return [e]
+        finally:
+            self._task_callback(task)
+    def _get_task(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Any
+            Next task (or task batch) to run, None if worker should stop
+            (i.e. the pool closed the connection it sends tasks through)
+        Preconditions:
+            N/A
+        '''
+        if self._connection is None:
+            return self._queue.get()
+        try:
+            return self._connection.recv()
+        except (EOFError, OSError):
+            return None
+    def _report(self, message, entryidx):
+        '''
+        Args:
+            message: Integer    => ENTRY_STARTED or ENTRY_DONE
+            entryidx: Integer   => index of entry of batch
+        Procedure:
+            Tell the pool that sent the batch being run that an entry of it
+            has started or is done
+        Preconditions:
+            self._connection is not None
+        '''
+        self._connection.send((message, entryidx))
     def _process_task(self):
         '''
         @BaseQueueWorker._process_task
         '''
-        task = self._queue.get()
+        task = self._get_task()
         try:
             if task is None:
                 return False
-            result = task(self) if callable(task) else task
-            if self._result_queue is not None:
-                for entry in result:
-                    self._result_queue.put(entry)
+            start = perf_counter()
+            if self._connection is not None:
+                ## NOTE: output and results of each entry are handed off before the
+                ## entry is reported done, so a crash only ever loses unfinished entries
+                results = TaskBatch()
+                for entryidx, entry in enumerate(task):
+                    self._report(ENTRY_STARTED, entryidx)
+                    entry_results = self._run_task(entry)
+                    self._flush_writers()
+                    self._put_results(task, entry_results)
+                    results.extend(entry_results)
+                    self._report(ENTRY_DONE, entryidx)
+            else:
+                if isinstance(task, TaskBatch):
+                    results = TaskBatch()
+                    for entry in task:
+                        results.extend(self._run_task(entry))
+                else:
+                    results = self._run_task(task)
+                self._flush_writers()
+                self._put_results(task, results)
+            if self._metrics is not None:
+                self._metrics.record(\
+                    len(task) if isinstance(task, TaskBatch) else 1,
+                    len(results),
+                    perf_counter() - start\
+                )
             return True
+        finally:
+            if self._connection is None:
+                self._queue.task_done()
+    def _put_results(self, task, results):
+        '''
+        Args:
+            task: Any               => task (or task batch) that was run
+            results: List<Any>      => results of running (entries of) task
+        Procedure:
+            Put results on the result queue (if any), as one TaskBatch if
+            task was a TaskBatch or results are batched
+        Preconditions:
+            N/A
+        '''
+        if self._result_queue is not None and len(results) > 0:
+            if isinstance(task, TaskBatch) or self._batch_results:
+                self._result_queue.put(TaskBatch(results))
+            else:
+                for entry in results:
+                    self._result_queue.put(entry)
+    def _flush_writers(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Flush output written by the task (or task batch) just run
+        Preconditions:
+            N/A
+        '''
+        try:
+            self.writers.flush()
         except Exception as e:
             if self._log_path is not None:
-                Logger.error('Uncaught exception while executing %s (%s)'%(type(task).__name__, str(e)))
-            if self._result_queue is not None:
-                self._result_queue.put(e)
-            return True
-        finally:
-            self._queue.task_done()
+                Logger.error('Failed to write output (%s)'%str(e))
     def _postamble(self):
         '''
         @BaseQueueWorker._postamble
         '''
+        self.writers.close()
         if self._log_path is not None:
             Logger.info('Ended worker: ' + self.name)
 
-class ProgressTrackerWorker(LoggedQueueWorker):
-    '''
-    @BaseQueueWorker
-    '''
-    def __init__(self, *args, pcount=None, pdesc=None, punit=None, **kwargs):
-        super(ProgressTrackerWorker, self).__init__(*args, **kwargs)
-        self._pcount = pcount
-        self._pdesc = pdesc
-        self._punit = punit
-    def _preamble(self):
-        '''
-        @BaseQueueWorker._preamble
-        '''
-        super(ProgressTrackerWorker, self)._preamble()
-        self._progress = tqdm(total=self._pcount, desc=self._pdesc, unit=self._punit)
-    def _result_callback(self):
-        '''
-        @BaseQueueWorker._result_callback
-        '''
-        self._progress.update(1)
-    def _closing_callback(self):
-        '''
-        @BaseQueueWorker._closing_callback
-        '''
-        self._progress.close()
-
-class DBProgressTrackerWorker(ProgressTrackerWorker):
+class DBWriterWorker(LoggedQueueWorker):
     '''
     @BaseQueueWorker
     '''
     def __init__(self, *args, manager=None, **kwargs):
-        super(DBProgressTrackerWorker, self).__init__(*args, **kwargs)
+        super(DBWriterWorker, self).__init__(*args, **kwargs)
         self.manager = manager
     def _preamble(self):
         '''
         @BaseQueueWorker._preamble
         '''
-        super(DBProgressTrackerWorker, self)._preamble()
+        super(DBWriterWorker, self)._preamble()
         self.manager.initialize(metadata=BaseTable.metadata)
     def _postamble(self):
         '''
         @BaseQueueWorker._postamble
         '''
-        super(DBProgressTrackerWorker, self)._postamble()
+        super(DBWriterWorker, self)._postamble()
         self.manager.close_session()
         self.manager.engine.dispose()
 
-class WorkerPool(object):
+class ProgressCounter(object):
     '''
-    Class to manage pool of process workers
+    Class to count processed items per node (file) in shared memory, so
+    worker processes can report progress without sending a message
+    through a queue for every item
     '''
-    def __init__(self, task_queue, task_class, daemonize=True, worker_class=LoggedQueueWorker, worker_count=(2 if cpu_count() <= 4 else 4), worker_kwargs=dict(), task_kwargs=dict()):
-        self._queue = task_queue
-        self._task_class = task_class
-        self._worker_class = worker_class
-        self._task_kwargs = task_kwargs
-        self._worker_kwargs = worker_kwargs
-        self._workers = None
-        self.daemon = daemonize
-        self.worker_count = worker_count
-    def __repr__(self):
-        return 'WorkerPool(%s,%s worker_class=%s, daemonize=%s, worker_count=%s%s)'%(\
-            type(self._queue).__name__ + '()',\
-            ' *' + str(self._task_args) + ', ' if len(self._task_args) > 0 else '',\
-            type(self._worker_class).__name__,\
-            str(self.daemon),\
-            str(self.worker_count),\
-            ', **' + str(self._task_kwargs) if len(self._task_kwargs) > 0 else '')
-    @property
-    def queue(self):
+    def __init__(self, node_count):
+        self._counts = Array('q', max(node_count, 1))
+    def increment(self, nodeidx, count=1):
+        '''
+        Args:
+            nodeidx: Integer    => index of node items belong to
+            count: Integer      => number of items processed
+        Procedure:
+            Add count to the number of processed items for node nodeidx
+        Preconditions:
+            nodeidx is of type Integer  (assumed True)
+            count is of type Integer    (assumed True)
+        '''
+        with self._counts.get_lock():
+            self._counts[nodeidx] += count
+    def snapshot(self):
         '''
         Args:
             N/A
         Returns:
-            JoinableQueue
-            Underlying queue of worker pool
+            List<Integer>
+            Number of processed items for each node
         Preconditions:
             N/A
         '''
-        return self._queue
+        with self._counts.get_lock():
+            return self._counts[:]
+
+class RecordLimit(object):
+    '''
+    Class to count records output (per output, i.e. format) in shared
+    memory against a global limit, so the reader can stop submitting
+    chunks as soon as enough records have been output
+    '''
+    def __init__(self, limit, output_count=1):
+        self._limit = limit
+        self._counts = Array('q', max(output_count, 1))
     @property
-    def worker_kwargs(self):
+    def limit(self):
+        '''
+        @limit.getter
+        '''
+        return self._limit
+    def add(self, count, outputidx=0):
         '''
         Args:
+            count: Integer      => number of records output
+            outputidx: Integer  => index of output records were output to
+        Procedure:
+            Add count to the number of records output to output outputidx
+        Preconditions:
             N/A
+        '''
+        with self._counts.get_lock():
+            self._counts[outputidx] += count
+    def reserve(self, count, outputidx=0):
+        '''
+        Args:
+            count: Integer      => number of records to output
+            outputidx: Integer  => index of output records are output to
         Returns:
-            Dict<String, Any>
-            Arguments to be applied to all workers in pool
+            Integer
+            Number of the count records that can be output without exceeding
+            the limit (added to the number of records output)
         Preconditions:
             N/A
         '''
-        return self._worker_kwargs
-    @worker_kwargs.setter
-    def worker_kwargs(self, value):
+        with self._counts.get_lock():
+            count = max(0, min(count, self._limit - self._counts[outputidx]))
+            self._counts[outputidx] += count
+            return count
+    @property
+    def reached(self):
+        '''
+        @reached.getter
+        Returns True if limit records have been output to every output
+        '''
+        with self._counts.get_lock():
+            return min(self._counts[:]) >= self._limit
+
+class StageMetrics(object):
+    '''
+    Class to count tasks run, results produced and time spent running
+    tasks by the workers of a pipeline stage, in shared memory
+    '''
+    def __init__(self):
+        self._counts = Array('d', 3)
+    def record(self, task_count, result_count, busy_time):
         '''
         Args:
-            N/A
+            task_count: Integer => number of tasks run
+            result_count: Integer   => number of results the tasks produced
+            busy_time: Float    => seconds spent running the tasks
         Procedure:
-            Sets arguments to be applied to all workers in pool
+            Add a run of task_count tasks to the metrics
         Preconditions:
-            value is of type Dict<String, Any>
+            N/A
         '''
-        assert isinstance(value, dict), 'Value is not of type Dict<String, Any>'
-        self._worker_kwargs = value
-    @property
-    def task_kwargs(self):
+        with self._counts.get_lock():
+            self._counts[0] += task_count
+            self._counts[1] += result_count
+            self._counts[2] += busy_time
+    def snapshot(self):
         '''
         Args:
             N/A
         Returns:
-            Dict<String, Any>
-            Arguments to be applied to all tasks supplied to workers
+            Container<String, Any>
+            Number of tasks run (tasks), results produced (results) and
+            seconds spent running tasks summed over workers (busy_time)
         Preconditions:
             N/A
         '''
-        return self._task_kwargs
-    @task_kwargs.setter
-    def task_kwargs(self, value):
+        with self._counts.get_lock():
+            counts = self._counts[:]
+        return Container(tasks=int(counts[0]), results=int(counts[1]), busy_time=counts[2])
+
+class SharedChunkRing(object):
+    '''
+    Class to hand off fixed-size buffers (i.e. EVTX chunks) to worker
+    processes through a ring of slots in one shared memory block. The
+    reader copies each buffer into a free slot and sends only the slot
+    index through the task queue, workers read the slot as a memoryview,
+    and the slot is returned to the free list once every task that
+    references it has released it. Acquiring a slot blocks while all
+    slots are in use, so the ring also bounds the buffers in flight.
+    NOTE:
+        the ring must be passed to worker processes on creation
+        (i.e. through worker_kwargs), not through a queue
+    '''
+    def __init__(self, slot_count, slot_size):
+        self._slot_count = slot_count
+        self._slot_size = slot_size
+        self._memory = SharedMemory(create=True, size=slot_count * slot_size)
+        self._name = self._memory.name
+        self._refs = Array('i', slot_count)
+        self._blocked_time = 0.0
+        self._free = Queue()
+        for slot in range(slot_count):
+            self._free.put(slot)
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_memory'] = None
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+    @property
+    def memory(self):
+        '''
+        @memory.getter
+        '''
+        if self._memory is None:
+            self._memory = SharedMemory(name=self._name)
+        return self._memory
+    @property
+    def slot_count(self):
+        '''
+        @slot_count.getter
+        '''
+        return self._slot_count
+    @property
+    def stats(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Statistics of ring in the process that acquires slots:
+                blocked_time: seconds spent waiting for a free slot
+        Preconditions:
+            N/A
+        '''
+        return Container(blocked_time=self._blocked_time)
+    def acquire(self, refs=1):
+        '''
+        Args:
+            refs: Integer   => number of tasks that will release the slot
+        Returns:
+            Integer
+            Index of free slot (blocks until a slot is free)
+        Preconditions:
+            refs is of type Integer > 0 (assumed True)
+        '''
+        start = perf_counter()
+        slot = self._free.get()
+        self._blocked_time += perf_counter() - start
+        with self._refs.get_lock():
+            self._refs[slot] = refs
+        return slot
+    def write(self, slot, data):
+        '''
+        Args:
+            slot: Integer       => index of slot to write to
+            data: ByteString    => buffer to copy into slot
+        Procedure:
+            Copy data into slot
+        Preconditions:
+            slot was returned by acquire        (assumed True)
+            len(data) <= self._slot_size        (assumed True)
+        '''
+        offset = slot * self._slot_size
+        self.memory.buf[offset:offset + len(data)] = data
+    def view(self, slot):
+        '''
+        Args:
+            slot: Integer   => index of slot to read
+        Returns:
+            memoryview
+            View of slot in shared memory (no copy is made)
+        Preconditions:
+            slot was returned by acquire    (assumed True)
+        '''
+        offset = slot * self._slot_size
+        return self.memory.buf[offset:offset + self._slot_size]
+    def release(self, slot):
+        '''
+        Args:
+            slot: Integer   => index of slot to release
+        Procedure:
+            Drop one reference to slot, returning it to the free list
+            when no task references it anymore
+        Preconditions:
+            slot was returned by acquire    (assumed True)
+        '''
+        with self._refs.get_lock():
+            self._refs[slot] -= 1
+            free = self._refs[slot] <= 0
+        if free:
+            self._free.put(slot)
+    def close(self, unlink=False):
+        '''
+        Args:
+            unlink: Boolean => whether to also destroy the shared memory block
+        Procedure:
+            Detach from (and optionally destroy) the shared memory block
+        Preconditions:
+            No views of slots are still referenced in this process
+        '''
+        if self._memory is not None:
+            self._memory.close()
+            if unlink:
+                self._memory.unlink()
+            self._memory = None
+
+class ProgressSampler(Thread):
+    '''
+    Class to render progress of a ProgressCounter with tqdm, sampling
+    the shared counters a few times per second from the parent process
+    '''
+    def __init__(self, counter, totals, desc=None, unit=None, interval=0.25):
+        super(ProgressSampler, self).__init__(daemon=True)
+        self._counter = counter
+        self._totals = totals
+        self._desc = desc
+        self._unit = unit
+        self._interval = interval
+        self._stopped = Event()
+    def _sample(self, node_progress, progress, finished, final=False):
+        '''
+        Args:
+            node_progress: tqdm     => progress bar of nodes
+            progress: tqdm          => progress bar of items
+            finished: Set<Integer>  => indices of nodes already finished
+            final: Boolean          => whether all items have been processed
+        Procedure:
+            Update progress bars from current values of the shared counters
+            (nodes with an unknown total, i.e. streams, finish on the final sample)
+        Preconditions:
+            N/A
+        '''
+        counts = self._counter.snapshot()
+        progress.update(sum(counts) - progress.n)
+        for nodeidx, total in enumerate(self._totals):
+            if nodeidx in finished or total == 0:
+                continue
+            if final or (total is not None and counts[nodeidx] >= total):
+                finished.add(nodeidx)
+                node_progress.update(1)
+                Logger.info('Finished processing node %d'%nodeidx)
+    def run(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Sample shared counters every self._interval seconds until stopped
+        Preconditions:
+            N/A
+        '''
+        finished = set()
+        with tqdm(total=len([total for total in self._totals if total != 0]), desc='Total', unit='files', position=0) as node_progress, \
+                tqdm(total=None if None in self._totals else sum(self._totals), desc=self._desc, unit=self._unit, position=1) as progress:
+            while not self._stopped.wait(self._interval):
+                self._sample(node_progress, progress, finished)
+            self._sample(node_progress, progress, finished, final=True)
+    def stop(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Render the final values of the shared counters and wait for the sampler to end
+        Preconditions:
+            N/A
+        '''
+        self._stopped.set()
+        self.join()
+
+class WorkerAutoTuner(object):
+    '''
+    Class to scale the number of workers in a WorkerPool while it runs.
+    Every interval seconds (checked whenever step is called) it samples
+    the throughput of a ProgressCounter, the share of time the producer
+    spent blocked on full queues or buffers, and the depth of the pool's
+    queue and of a downstream (i.e. writer) queue, then:
+        - removes a worker if the downstream queue is backed up
+        - adds a worker if the producer is mostly waiting on the workers
+        - removes a worker if the workers are mostly waiting on the producer
+    If an added worker does not raise throughput by at least MIN_GAIN it
+    is removed again and the pool is not grown past that size.
+    NOTE:
+        step must be called from the process that adds tasks to the pool
+    '''
+    HIGH_WATER = 0.5
+    LOW_WATER = 0.1
+    MIN_GAIN = 0.05
+
+    def __init__(self, pool, counter, min_workers=1, max_workers=CPU_COUNT, stalls=None, downstream=None, interval=2.0):
+        self._pool = pool
+        self._counter = counter
+        self._min_workers = min_workers
+        self._max_workers = max_workers
+        self._stalls = [pool] if stalls is None else stalls
+        self._downstream = downstream
+        self._interval = interval
+        self._last_sample = None
+        self._last_rate = None
+        self._last_action = None
+        self._changes = 0
+    def _take_sample(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Tuple<Float, Integer, Float>
+            Time of sample, number of items processed and time spent blocked so far
+        Preconditions:
+            N/A
+        '''
+        return (\
+            perf_counter(),
+            sum(self._counter.snapshot()),
+            sum(stall.stats.blocked_time for stall in self._stalls)\
+        )
+    def step(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Resize the pool if the sampling interval has elapsed
+            since the last sample (see class description)
+        Preconditions:
+            The pool has been started
+        '''
+        if self._last_sample is None:
+            self._last_sample = self._take_sample()
+            return
+        sample = self._take_sample()
+        elapsed = sample[0] - self._last_sample[0]
+        if elapsed < self._interval:
+            return
+        rate = (sample[1] - self._last_sample[1]) / elapsed
+        wait = min(1.0, (sample[2] - self._last_sample[2]) / elapsed)
+        depth = self._pool.fill
+        backlog = self._downstream.fill if self._downstream is not None else 0.0
+        workers = self._pool.worker_count
+        action = None
+        if self._last_action == 'grow' and self._last_rate is not None and rate < self._last_rate * (1 + self.MIN_GAIN):
+            self._max_workers = workers - 1
+            action = 'shrink'
+        elif backlog >= self.HIGH_WATER and workers > self._min_workers:
+            action = 'shrink'
+        elif wait >= self.HIGH_WATER and workers < self._max_workers:
+            action = 'grow'
+        elif wait <= self.LOW_WATER and depth <= self.LOW_WATER and workers > self._min_workers:
+            action = 'shrink'
+        Logger.info('Autotune sample: %d worker(s), %.1f items/s, %.1fms worker time per item, producer blocked %d%%, queue %d%% full, downstream %d%% full'%(\
+            workers,
+            rate,
+            (workers * 1000.0 / rate) if rate > 0 else 0.0,
+            int(wait * 100),
+            int(depth * 100),
+            int(backlog * 100)\
+        ))
+        if action == 'grow':
+            self._pool.add_worker()
+        elif action == 'shrink':
+            self._pool.remove_worker()
+        if action is not None:
+            self._changes += 1
+            Logger.info('Autotune: %s pool to %d worker(s)'%(action, self._pool.worker_count))
+        self._last_action = action
+        self._last_rate = rate
+        self._last_sample = sample
+    @property
+    def changes(self):
+        '''
+        @changes.getter
+        '''
+        return self._changes
+
+class WorkerPool(object):
+    '''
+    Class to manage pool of process workers
+    '''
+    def __init__(self, task_queue, task_class, daemonize=True, worker_class=LoggedQueueWorker, worker_count=(2 if cpu_count() <= 4 else 4), worker_kwargs=dict(), task_kwargs=dict(), batch_size=1):
+        self._queue = task_queue
+        self._task_class = task_class
+        self._worker_class = worker_class
+        self._task_kwargs = task_kwargs
+        self._worker_kwargs = worker_kwargs
+        self._workers = None
+        self._batch = TaskBatch()
+        self._high_water_mark = 0
+        self._blocked_time = 0.0
+        self.daemon = daemonize
+        self.worker_count = worker_count
+        self.batch_size = batch_size
+    def __repr__(self):
+        return 'WorkerPool(%s,%s worker_class=%s, daemonize=%s, worker_count=%s%s)'%(\
+            type(self._queue).__name__ + '()',\
+            ' *' + str(self._task_args) + ', ' if len(self._task_args) > 0 else '',\
+            type(self._worker_class).__name__,\
+            str(self.daemon),\
+            str(self.worker_count),\
+            ', **' + str(self._task_kwargs) if len(self._task_kwargs) > 0 else '')
+    @property
+    def queue(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            JoinableQueue
+            Underlying queue of worker pool
+        Preconditions:
+            N/A
+        '''
+        return self._queue
+    @property
+    def worker_kwargs(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Dict<String, Any>
+            Arguments to be applied to all workers in pool
+        Preconditions:
+            N/A
+        '''
+        return self._worker_kwargs
+    @worker_kwargs.setter
+    def worker_kwargs(self, value):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Sets arguments to be applied to all workers in pool
+        Preconditions:
+            value is of type Dict<String, Any>
+        '''
+        assert isinstance(value, dict), 'Value is not of type Dict<String, Any>'
+        self._worker_kwargs = value
+    @property
+    def task_kwargs(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Dict<String, Any>
+            Arguments to be applied to all tasks supplied to workers
+        Preconditions:
+            N/A
+        '''
+        return self._task_kwargs
+    @task_kwargs.setter
+    def task_kwargs(self, value):
         '''
         Args:
             N/A
@@ -329,11 +1291,13 @@ class WorkerPool(object):
                 if poison_pill is True, None is added
                 if include is True, assumes first arg is already-created Task
                 else, self._task_class is used to create Task
+                if self.batch_size > 1, tasks are grouped into a TaskBatch
+                of self.batch_size tasks before being added
         Preconditions:
             N/A
         '''
-        action = 'put'
         if poison_pill:
+            self.flush()
             task = None
         elif included:
             task = args[0]
@@ -341,7 +1305,73 @@ class WorkerPool(object):
             task_args = dict(kwargs)
             task_args.update(self._task_kwargs)
             task = self._task_class(*args, **task_args)
-        getattr(self._queue, action)(task)
+        if task is not None and self.batch_size > 1:
+            self._batch.append(task)
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+        else:
+            self._put(task)
+    def _put(self, task):
+        '''
+        Args:
+            task: Any   => task (or batch of tasks) to add to task queue
+        Procedure:
+            Add task to task queue, blocking while the queue is full, and
+            record the queue depth high-water mark and time spent blocked
+        Preconditions:
+            N/A
+        '''
+        start = perf_counter()
+        self._queue.put(task)
+        self._blocked_time += perf_counter() - start
+        try:
+            self._high_water_mark = max(self._high_water_mark, self._queue.qsize())
+        except NotImplementedError:
+            pass
+    @property
+    def stats(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Transport statistics of task queue:
+                high_water_mark: maximum number of queued items observed
+                blocked_time: seconds spent waiting to add tasks to a full queue
+        Preconditions:
+            N/A
+        '''
+        return Container(\
+            high_water_mark=self._high_water_mark,
+            blocked_time=self._blocked_time\
+        )
+    @property
+    def fill(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Float
+            Fraction of task queue capacity in use (0 if unknown)
+        Preconditions:
+            N/A
+        '''
+        try:
+            return min(1.0, self._queue.qsize() / max(1, self._queue._maxsize))
+        except (NotImplementedError, AttributeError):
+            return 0.0
+    def flush(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Add any tasks waiting to fill a batch to task queue as a (partial) batch
+        Preconditions:
+            N/A
+        '''
+        if len(self._batch) > 0:
+            self._put(self._batch)
+            self._batch = TaskBatch()
     def add_poison_pills(self):
         '''
         Args:
@@ -353,6 +1383,17 @@ class WorkerPool(object):
         '''
         for i in range(self.worker_count):
             self.add_task(poison_pill=True)
+    def _create_worker(self, index):
+        '''
+        Args:
+            index: Integer  => index of worker in pool
+        Returns:
+            LoggedQueueWorker
+            New (unstarted) worker
+        Preconditions:
+            N/A
+        '''
+        return self._worker_class(self._queue, index, **self._worker_kwargs)
     def initialize_workers(self):
         '''
         Args:
@@ -362,10 +1403,38 @@ class WorkerPool(object):
         Preconditions:
             N/A
         '''
-        self._workers = [\
-            self._worker_class(self._queue, i, **self._worker_kwargs)\
-            for i in range(self.worker_count)\
-        ]
+        self._workers = [self._create_worker(i) for i in range(self.worker_count)]
+    def add_worker(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Create and start one more worker (the pool must already be started)
+        Preconditions:
+            N/A
+        '''
+        exited = [index for index, worker in enumerate(self._workers) if worker.exitcode == 0]
+        index = exited[0] if len(exited) > 0 else len(self._workers)
+        worker = self._create_worker(index)
+        worker.daemon = self.daemon
+        worker.start()
+        if index < len(self._workers):
+            self._workers[index] = worker
+        else:
+            self._workers.append(worker)
+        self.worker_count += 1
+    def remove_worker(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Stop one worker once it reaches the tasks currently queued,
+            by queueing a poison pill for it
+        Preconditions:
+            self.worker_count > 1
+        '''
+        self.worker_count -= 1
+        self.add_task(poison_pill=True)
     def start(self):
         '''
         Args:
@@ -390,6 +1459,7 @@ class WorkerPool(object):
         Preconditions:
             N/A
         '''
+        self.flush()
         if hasattr(self._queue, 'join') and callable(self._queue.join):
             self._queue.join()
     def join_workers(self):
@@ -429,3 +1499,701 @@ class WorkerPool(object):
         '''
         self._workers = None
         self.initialize_workers()
+
+class SupervisedWorkerPool(WorkerPool):
+    '''
+    Class to manage pool of process workers that are sent their tasks by
+    the pool instead of taking them off a shared queue, so the pool always
+    knows what every worker holds and can recover it if the worker dies.
+    Tasks are queued in the parent (as TaskBatches, at most queue_size of
+    them if queue_size > 0) and a dispatcher thread sends each batch to one
+    worker through the worker's own pipe, at most one batch ahead of the
+    batch the worker is running. Workers report when each entry of a batch
+    starts and when it is done (its output flushed and its results handed
+    off), and the dispatcher replaces a worker that dies (its pipe closes
+    or it exits) and requeues, ahead of every other batch:
+        - the entry it was running, alone (passed to on_quarantine instead
+          if it has now been running when MAX_CRASHES workers died)
+        - the entries of its batches it had not started
+    Requeued entries are passed through on_retry (so tasks can i.e. write
+    their output elsewhere). If the dispatcher fails (i.e. a batch cannot be
+    pickled), every worker is terminated, the exception and the entries that
+    were pending or sent to a worker are passed to on_error (so the caller
+    can i.e. release their resources), and the exception is raised by the
+    next call that adds tasks to or waits on the pool
+    NOTE:
+        a supervised pool has no task queue, so it can only be the first
+        stage of a Pipeline
+    '''
+    MAX_CRASHES = 2
+
+    def __init__(self, task_class, queue_size=0, on_retry=None, on_quarantine=None, on_error=None, **kwargs):
+        super(SupervisedWorkerPool, self).__init__(None, task_class, **kwargs)
+        self._queue_size = queue_size
+        self._on_retry = on_retry
+        self._on_quarantine = on_quarantine
+        self._on_error = on_error
+        self._pending = deque()
+        self._slots = list()
+        self._next_index = 0
+        self._retire = 0
+        self._closing = False
+        self._terminated = False
+        self._condition = Condition()
+        self._wakeup_reader, self._wakeup_writer = Pipe(duplex=False)
+        self._woken = False
+        self._dispatcher = None
+        self._error = None
+    @property
+    def fill(self):
+        '''
+        @WorkerPool.fill
+        '''
+        if self._queue_size <= 0:
+            return 0.0
+        return min(1.0, len(self._pending) / self._queue_size)
+    def _wake(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Wake the dispatcher so it sees changes to the pending batches
+            and workers (at most one wakeup is outstanding at a time)
+        Preconditions:
+            self._condition is held by the caller
+        '''
+        if not self._woken:
+            self._woken = True
+            self._wakeup_writer.send_bytes(b'\0')
+    def _raise_error(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Raise the exception the dispatcher failed with, if it failed
+        Preconditions:
+            N/A
+        '''
+        if self._error is not None:
+            raise self._error
+    def _put(self, task):
+        '''
+        @WorkerPool._put
+        '''
+        if task is None:
+            return
+        if not isinstance(task, TaskBatch):
+            task = TaskBatch([task])
+        start = perf_counter()
+        with self._condition:
+            while self._dispatcher is not None and self._queue_size > 0 and len(self._pending) >= self._queue_size:
+                self._condition.wait()
+            self._blocked_time += perf_counter() - start
+            self._raise_error()
+            self._pending.append(task)
+            self._high_water_mark = max(self._high_water_mark, len(self._pending))
+            self._wake()
+    def add_poison_pills(self):
+        '''
+        @WorkerPool.add_poison_pills
+        NOTE:
+            every worker is stopped once no batches are pending
+            and it has finished the batches it was sent
+        '''
+        self.flush()
+        with self._condition:
+            self._closing = True
+            self._wake()
+    def _create_worker(self, index):
+        '''
+        Args:
+            index: Integer  => index of worker in pool
+        Returns:
+            Container<String, Any>
+            Started worker (process) with the parent end of its pipe
+            (connection), the batches sent to it that are not done
+            (batches), the number of entries of the first of them that
+            have started (started) and are done (finished), and whether it
+            has been told to stop (retiring)
+        Preconditions:
+            self._condition is held by the caller (or the pool is not started)
+        '''
+        connection, worker_connection = Pipe()
+        worker_kwargs = dict(self._worker_kwargs)
+        worker_kwargs['connection'] = worker_connection
+        worker = self._worker_class(None, index, **worker_kwargs)
+        worker.daemon = self.daemon
+        worker.start()
+        worker_connection.close()
+        return Container(\
+            index=index,
+            process=worker,
+            connection=connection,
+            batches=deque(),
+            started=0,
+            finished=0,
+            retiring=False\
+        )
+    def _add_slot(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Start a new worker and add it to self._slots
+        Preconditions:
+            self._condition is held by the caller (or the pool is not started)
+        '''
+        self._slots.append(self._create_worker(self._next_index))
+        self._next_index += 1
+    def _send(self, slot, task):
+        '''
+        Args:
+            slot: Container<String, Any>    => worker to send task to (see _create_worker)
+            task: TaskBatch                 => batch to send (None to stop worker)
+        Procedure:
+            Send task to worker, recording batches as sent before sending them
+            (a worker whose pipe is broken is recovered once it has exited)
+        Preconditions:
+            self._condition is held by the caller
+        '''
+        if task is None:
+            slot.retiring = True
+        else:
+            slot.batches.append(task)
+        try:
+            slot.connection.send(task)
+        except (OSError, ValueError):
+            pass
+    def _dispatch(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Stop idle workers while the pool is shrinking, send pending batches
+            to idle workers, then to workers running the last entry of their
+            only batch, and stop idle workers once the pool is closing and no
+            batches are pending
+        Preconditions:
+            self._condition is held by the caller
+        '''
+        slots = [slot for slot in self._slots if not slot.retiring]
+        for slot in slots:
+            if self._retire > 0 and len(slot.batches) == 0:
+                self._send(slot, None)
+                self._retire -= 1
+        for slot in slots:
+            if len(self._pending) > 0 and not slot.retiring and len(slot.batches) == 0:
+                self._send(slot, self._pending.popleft())
+        for slot in slots:
+            if len(self._pending) > 0 and not slot.retiring and len(slot.batches) == 1 and \
+                slot.started == len(slot.batches[0]):
+                self._send(slot, self._pending.popleft())
+        if self._closing and len(self._pending) == 0:
+            for slot in slots:
+                if not slot.retiring and len(slot.batches) == 0:
+                    self._send(slot, None)
+        self._condition.notify_all()
+    def _receive(self, slot):
+        '''
+        Args:
+            slot: Container<String, Any>    => worker to receive reports from
+        Returns:
+            Boolean
+            False if the pipe of worker is closed (i.e. it died), True otherwise
+        Procedure:
+            Record every entry the worker reported as started or done,
+            forgetting a batch once all of its entries are done
+        Preconditions:
+            self._condition is held by the caller
+        '''
+        try:
+            while slot.connection.poll():
+                message, entryidx = slot.connection.recv()
+                if message == ENTRY_STARTED:
+                    slot.started = entryidx + 1
+                else:
+                    slot.finished = entryidx + 1
+                    if slot.finished == len(slot.batches[0]):
+                        slot.batches.popleft()
+                        slot.started = slot.finished = 0
+        except (EOFError, OSError):
+            return False
+        return True
+    def _recover(self, slot):
+        '''
+        Args:
+            slot: Container<String, Any>    => worker that died
+        Procedure:
+            Requeue the batches sent to worker ahead of every pending batch
+            (see class description)
+        Preconditions:
+            self._condition is held by the caller
+        '''
+        retry = self._on_retry if self._on_retry is not None else (lambda entry: entry)
+        requeued = list()
+        for batchidx, batch in enumerate(slot.batches):
+            crashes = getattr(batch, 'crashes', 0)
+            if batchidx == 0:
+                batch = batch[slot.finished:]
+            if batchidx == 0 and slot.started > slot.finished:
+                crashed = batch.pop(0)
+                crashes = (crashes if len(slot.batches[0]) == 1 else 0) + 1
+                if crashes >= self.MAX_CRASHES and self._on_quarantine is not None:
+                    Logger.error('Quarantining %s after %d worker crashes'%(type(crashed).__name__, crashes))
+                    self._on_quarantine(crashed)
+                else:
+                    Logger.warning('Requeueing %s after %d worker crash(es)'%(type(crashed).__name__, crashes))
+                    entry = TaskBatch([retry(crashed)])
+                    entry.crashes = crashes
+                    requeued.append(entry)
+            if len(batch) > 0:
+                requeued.append(TaskBatch(retry(entry) for entry in batch))
+        self._pending.extendleft(reversed(requeued))
+        slot.batches.clear()
+    def _reap(self, slot):
+        '''
+        Args:
+            slot: Container<String, Any>    => worker whose pipe closed or that exited
+        Procedure:
+            Remove worker from the pool and, unless it was told to stop
+            (and exited cleanly) or the pool was terminated, recover its
+            batches and replace it
+        Preconditions:
+            self._condition is held by the caller
+        '''
+        self._receive(slot)
+        slot.process.join()
+        slot.connection.close()
+        self._slots.remove(slot)
+        if self._terminated or (slot.retiring and slot.process.exitcode == 0):
+            return
+        if slot.retiring:
+            Logger.error('Worker %s exited with exit code %d while stopping'%(slot.process.name, slot.process.exitcode))
+            return
+        Logger.error('Worker %s died with exit code %d, restarting it'%(slot.process.name, slot.process.exitcode))
+        self._recover(slot)
+        self._add_slot()
+    def _fail(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Terminate every worker and drop the pending batches and the
+            batches sent to workers, passing the entries not done to
+            on_error with the exception the dispatcher failed with
+        Preconditions:
+            self._condition is held by the caller
+            self._error is not None
+        '''
+        for slot in self._slots:
+            if slot.process.is_alive():
+                slot.process.terminate()
+        dropped = list()
+        for slot in self._slots:
+            slot.process.join()
+            slot.connection.close()
+            for batchidx, batch in enumerate(slot.batches):
+                dropped.extend(batch[slot.finished:] if batchidx == 0 else batch)
+        for batch in self._pending:
+            dropped.extend(batch)
+        self._slots = list()
+        self._pending.clear()
+        if self._on_error is not None:
+            try:
+                self._on_error(self._error, dropped)
+            except Exception as e:
+                Logger.error('Failed to handle failure of worker pool (%s)'%str(e))
+    def _run_dispatcher(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Dispatch pending batches to workers and supervise them until the
+            pool is closing (or terminated) and every worker has exited
+        Preconditions:
+            N/A
+        '''
+        try:
+            while True:
+                with self._condition:
+                    self._dispatch()
+                    if len(self._slots) == 0 and (self._closing or self._terminated):
+                        break
+                    handles = dict()
+                    for slot in self._slots:
+                        handles[slot.connection] = slot
+                        handles[slot.process.sentinel] = slot
+                ready = wait(list(handles.keys()) + [self._wakeup_reader])
+                with self._condition:
+                    if self._wakeup_reader in ready:
+                        while self._wakeup_reader.poll():
+                            self._wakeup_reader.recv_bytes()
+                        self._woken = False
+                    for handle in ready:
+                        slot = handles.get(handle)
+                        if slot is None or slot not in self._slots:
+                            continue
+                        if handle == slot.process.sentinel or not self._receive(slot):
+                            self._reap(slot)
+        except Exception as e:
+            Logger.error('Failed to dispatch tasks to worker pool (%s)'%str(e))
+            with self._condition:
+                self._error = e
+                self._fail()
+        finally:
+            with self._condition:
+                self._dispatcher = None
+                self._condition.notify_all()
+    def add_worker(self):
+        '''
+        @WorkerPool.add_worker
+        '''
+        with self._condition:
+            if self._retire > 0:
+                self._retire -= 1
+            else:
+                self._add_slot()
+            self.worker_count += 1
+            self._wake()
+    def remove_worker(self):
+        '''
+        @WorkerPool.remove_worker
+        NOTE:
+            the next worker without batches to run is stopped
+        '''
+        with self._condition:
+            self.worker_count -= 1
+            self._retire += 1
+            self._wake()
+    def start(self):
+        '''
+        @WorkerPool.start
+        NOTE:
+            also starts the dispatcher thread
+        '''
+        with self._condition:
+            if self._dispatcher is not None:
+                return
+            while len(self._slots) < self.worker_count:
+                self._add_slot()
+            self._dispatcher = Thread(target=self._run_dispatcher, daemon=True)
+            self._dispatcher.start()
+    def join_tasks(self):
+        '''
+        @WorkerPool.join_tasks
+        NOTE:
+            waits until no batches are pending or sent to a worker
+        '''
+        self.flush()
+        with self._condition:
+            while self._dispatcher is not None and \
+                (len(self._pending) > 0 or any(len(slot.batches) > 0 for slot in self._slots)):
+                self._condition.wait()
+            self._raise_error()
+    def join_workers(self):
+        '''
+        @WorkerPool.join_workers
+        NOTE:
+            waits for the dispatcher, which ends once every worker has exited
+        '''
+        dispatcher = self._dispatcher
+        if dispatcher is not None:
+            dispatcher.join()
+        self._raise_error()
+    def terminate(self):
+        '''
+        @WorkerPool.terminate
+        '''
+        with self._condition:
+            self._terminated = True
+            for slot in self._slots:
+                if slot.process.is_alive():
+                    slot.process.terminate()
+            self._wake()
+
+class InlineWorker(object):
+    '''
+    Stand-in for a LoggedQueueWorker that runs tasks in the calling process
+    '''
+    def __init__(self, *args, name='inline', log_path=None, progress=None, ring=None, metrics=None, result_queue=None, limit=None, **kwargs):
+        self.name = name
+        self.progress = progress
+        self.ring = ring
+        self.limit = limit
+        self.metrics = metrics
+        self.result_queue = result_queue
+        self.writers = OutputWriterCache()
+
+class InlineWorkerPool(object):
+    '''
+    Class with the interface of WorkerPool that runs each task in the
+    calling process as soon as it is added, for inputs too small to be
+    worth starting worker processes for
+    '''
+    def __init__(self, task_class, worker_kwargs=dict(), task_kwargs=dict()):
+        self._task_class = task_class
+        self._task_kwargs = task_kwargs
+        self._worker_kwargs = worker_kwargs
+        self._worker = None
+        self.worker_count = 1
+        self.batch_size = 1
+    @property
+    def queue(self):
+        '''
+        @queue.getter
+        '''
+        return None
+    @property
+    def worker_kwargs(self):
+        '''
+        @worker_kwargs.getter
+        '''
+        return self._worker_kwargs
+    @worker_kwargs.setter
+    def worker_kwargs(self, value):
+        '''
+        @worker_kwargs.setter
+        '''
+        assert isinstance(value, dict), 'Value is not of type Dict<String, Any>'
+        self._worker_kwargs = value
+    @property
+    def task_kwargs(self):
+        '''
+        @task_kwargs.getter
+        '''
+        return self._task_kwargs
+    @property
+    def stats(self):
+        '''
+        @WorkerPool.stats
+        '''
+        return Container(high_water_mark=0, blocked_time=0.0)
+    @property
+    def fill(self):
+        '''
+        @WorkerPool.fill
+        '''
+        return 0.0
+    def add_task(self, *args, poison_pill=False, included=False, **kwargs):
+        '''
+        @WorkerPool.add_task
+        NOTE:
+            the task is run immediately and its results are put on the
+            result queue of the worker as a TaskBatch (or discarded if
+            there is none)
+        '''
+        if poison_pill:
+            return
+        elif included:
+            task = args[0]
+        else:
+            task_args = dict(kwargs)
+            task_args.update(self._task_kwargs)
+            task = self._task_class(*args, **task_args)
+        start = perf_counter()
+        try:
+            results = task(self._worker)
+        except Exception as e:
+            Logger.error('Uncaught exception while executing %s (%s)'%(type(task).__name__, str(e)))
+            results = [e]
+        if self._worker.metrics is not None:
+            self._worker.metrics.record(1, len(results) if results is not None else 0, perf_counter() - start)
+        if self._worker.result_queue is not None and results is not None and len(results) > 0:
+            self._worker.result_queue.put(TaskBatch(results))
+    def flush(self):
+        '''
+        @WorkerPool.flush
+        '''
+        pass
+    def add_poison_pills(self):
+        '''
+        @WorkerPool.add_poison_pills
+        '''
+        pass
+    def start(self):
+        '''
+        @WorkerPool.start
+        NOTE:
+            creates the in-process worker (with the current worker_kwargs)
+        '''
+        if self._worker is None:
+            self._worker = InlineWorker(**self._worker_kwargs)
+    def join_tasks(self):
+        '''
+        @WorkerPool.join_tasks
+        '''
+        pass
+    def join_workers(self):
+        '''
+        @WorkerPool.join_workers
+        NOTE:
+            closes the output files written to by tasks
+        '''
+        if self._worker is not None:
+            self._worker.writers.close()
+    def terminate(self):
+        '''
+        @WorkerPool.terminate
+        '''
+        pass
+
+class Pipeline(object):
+    '''
+    Class to run a chain of named stages, each a pool of workers with its
+    own worker count and batch size, where the results of every stage are
+    the tasks of the next. Stages are connected by their (bounded) task
+    queues, so a slow stage blocks the stages feeding it instead of
+    results piling up in memory, and each stage records StageMetrics
+    (tasks run, results produced, time spent running tasks) alongside
+    the transport statistics of its queue. Tasks are submitted to the
+    first stage by the caller; a stage that runs in process (inline) is
+    the only stage of its pipeline, as it has no queue to receive from
+    '''
+    def __init__(self):
+        self._pools = Container()
+        self._metrics = dict()
+        self._started = None
+        self._elapsed = None
+    @property
+    def pools(self):
+        '''
+        @pools.getter
+        Returns Container<String, WorkerPool> of stages by name, in order
+        '''
+        return self._pools
+    @property
+    def head(self):
+        '''
+        @head.getter
+        Returns pool of first stage, which tasks are submitted to
+        '''
+        return next(iter(self._pools.values()))
+    def add_stage(self, name, task_class, worker_count=1, batch_size=1, queue_size=0, inline=False, worker_kwargs=dict(), task_kwargs=dict(), **kwargs):
+        '''
+        Args:
+            name: String                    => name of stage (i.e. parser)
+            task_class: Type<Any>           => class of tasks run by stage
+            worker_count: Integer           => number of workers in stage
+            batch_size: Integer             => number of tasks per queue item
+            queue_size: Integer             => maximum number of items in task queue
+                                               of stage (unbounded if 0 or less)
+            inline: Boolean                 => whether to run tasks in the calling process
+            worker_kwargs: Dict<String, Any>    => arguments to pass to workers
+            task_kwargs: Dict<String, Any>      => arguments to pass to tasks
+            kwargs: Dict<String, Any>           => further arguments to pass to WorkerPool
+                                                   (i.e. worker_class), or supervised to use a
+                                                   SupervisedWorkerPool (with on_retry, on_quarantine, on_error)
+        Returns:
+            WorkerPool|SupervisedWorkerPool|InlineWorkerPool
+            Pool of new stage, fed by the results of the previous stage
+        Preconditions:
+            name is not the name of an existing stage
+            No stage runs in process (and no stage is added after one that does)
+            A supervised stage is the first stage
+        '''
+        supervised = kwargs.pop('supervised', False)
+        assert name not in self._pools, 'Stage %s already exists'%name
+        assert not inline or len(self._pools) == 0, 'In process stage must be only stage of pipeline'
+        assert not supervised or len(self._pools) == 0, 'Supervised stage must be first stage of pipeline'
+        assert not any(isinstance(pool, InlineWorkerPool) for pool in self._pools.values()), \
+            'Cannot add stage after in process stage'
+        if inline:
+            pool = InlineWorkerPool(task_class, worker_kwargs=dict(worker_kwargs), task_kwargs=task_kwargs)
+        elif supervised:
+            kwargs.setdefault('daemonize', False)
+            pool = SupervisedWorkerPool(\
+                task_class,
+                queue_size=queue_size,
+                worker_count=worker_count,
+                batch_size=batch_size,
+                worker_kwargs=dict(worker_kwargs),
+                task_kwargs=task_kwargs,
+                **kwargs\
+            )
+        else:
+            kwargs.setdefault('daemonize', False)
+            pool = WorkerPool(\
+                JoinableQueue(queue_size),
+                task_class,
+                worker_count=worker_count,
+                batch_size=batch_size,
+                worker_kwargs=dict(worker_kwargs),
+                task_kwargs=task_kwargs,
+                **kwargs\
+            )
+        self._pools[name] = pool
+        self._metrics[name] = StageMetrics()
+        return pool
+    def submit(self, *args, **kwargs):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Add task to first stage (see WorkerPool.add_task)
+        Preconditions:
+            At least one stage has been added
+        '''
+        self.head.add_task(*args, **kwargs)
+    def start(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Connect every stage to the queue of the next stage and start
+            the stages, last stage first so consumers are running before
+            their producers
+        Preconditions:
+            Worker arguments of every stage are final
+        '''
+        names = list(self._pools.keys())
+        for stageidx, name in enumerate(names):
+            worker_kwargs = dict(self._pools[name].worker_kwargs)
+            worker_kwargs['metrics'] = self._metrics[name]
+            if stageidx + 1 < len(names):
+                worker_kwargs['result_queue'] = self._pools[names[stageidx + 1]].queue
+            self._pools[name].worker_kwargs = worker_kwargs
+        self._started = perf_counter()
+        for name in reversed(names):
+            self._pools[name].start()
+    def close(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Close the stages in order, waiting for every worker of a stage
+            to finish (so all its results have been passed on) before
+            closing the next
+        Preconditions:
+            self.start has been called
+        '''
+        for pool in self._pools.values():
+            pool.add_poison_pills()
+            pool.join_workers()
+        if self._started is not None:
+            self._elapsed = perf_counter() - self._started
+    @property
+    def stats(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Container<String, Any>>
+            Statistics of each stage by name: worker_count, batch_size,
+            tasks, results and busy_time (see StageMetrics), high_water_mark
+            and blocked_time (see WorkerPool.stats) and utilization (share of
+            the time the pipeline ran its workers spent running tasks)
+        Preconditions:
+            N/A
+        '''
+        elapsed = self._elapsed
+        if elapsed is None and self._started is not None:
+            elapsed = perf_counter() - self._started
+        stats = Container()
+        for name, pool in self._pools.items():
+            stage = self._metrics[name].snapshot()
+            stage.update(pool.stats)
+            stage.worker_count = pool.worker_count
+            stage.batch_size = pool.batch_size
+            stage.utilization = stage.busy_time / (elapsed * pool.worker_count) if elapsed else 0.0
+            stats[name] = stage
+        return stats
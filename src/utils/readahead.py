@@ -0,0 +1,147 @@
+## -*- coding: UTF-8 -*-
+## readahead.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import os
+from threading import Thread, Condition
+
+READAHEAD_BLOCK_SIZE = 1024 * 1024
+
+class FileReadahead(Thread):
+    '''
+    Class to read a list of files ahead of the reader that parses them,
+    so their pages are in the page cache by the time the reader gets to
+    them. The files are treated as one sequence of bytes: the readahead
+    thread advises the kernel it will need (posix_fadvise WILLNEED, where
+    available) and then reads at most window bytes past the reader's
+    position, which the reader reports with advance.
+    '''
+    def __init__(self, filepaths, window):
+        super(FileReadahead, self).__init__(daemon=True)
+        self._filepaths = filepaths
+        self._window = window
+        self._offsets = dict()
+        total = 0
+        for filepath in filepaths:
+            self._offsets[filepath] = total
+            total += os.path.getsize(filepath)
+        self._reader_position = 0
+        self._position = 0
+        self._stopped = False
+        self._condition = Condition()
+    def advance(self, filepath, offset):
+        '''
+        Args:
+            filepath: String    => file the reader is reading
+            offset: Integer     => offset in filepath the reader has read up to
+        Procedure:
+            Move the position of the reader (and so the end of the window)
+            forward to offset in filepath
+        Preconditions:
+            filepath is one of the files passed to the constructor  (assumed True)
+        '''
+        base = self._offsets.get(filepath)
+        if base is None:
+            return
+        with self._condition:
+            self._reader_position = max(self._reader_position, base + offset)
+            self._condition.notify()
+    def _wait_for_window(self, length):
+        '''
+        Args:
+            length: Integer => number of bytes to be read next
+        Returns:
+            Integer
+            Position of reader once reading length more bytes stays within the
+            window, None if stopped
+        Preconditions:
+            N/A
+        '''
+        with self._condition:
+            while not self._stopped and self._position + length > self._reader_position + self._window:
+                self._condition.wait()
+            return None if self._stopped else self._reader_position
+    def _read_file(self, filepath, buffer):
+        '''
+        Args:
+            filepath: String        => path of file to read ahead
+            buffer: bytearray       => buffer to read blocks into
+        Procedure:
+            Advise and read filepath block by block within the window,
+            skipping ahead if the reader has already passed the current position
+        Preconditions:
+            N/A
+        '''
+        base = self._offsets[filepath]
+        with open(filepath, 'rb') as evtx_file:
+            fd = evtx_file.fileno()
+            offset = 0
+            while True:
+                reader_position = self._wait_for_window(len(buffer))
+                if reader_position is None:
+                    return
+                if reader_position > base + offset:
+                    offset = reader_position - base
+                    evtx_file.seek(offset)
+                if hasattr(os, 'posix_fadvise'):
+                    try:
+                        os.posix_fadvise(fd, offset, self._window, os.POSIX_FADV_WILLNEED)
+                    except OSError:
+                        pass
+                read = evtx_file.readinto(buffer)
+                if not read:
+                    break
+                offset += read
+                self._position = base + offset
+    def run(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Read ahead every file in order until all are read or stopped
+        Preconditions:
+            N/A
+        '''
+        buffer = bytearray(max(1, min(READAHEAD_BLOCK_SIZE, self._window // 4)))
+        for filepath in self._filepaths:
+            self._position = self._offsets[filepath]
+            try:
+                self._read_file(filepath, buffer)
+            except Exception as e:
+                Logger.error('Failed to read ahead %s (%s)'%(filepath, str(e)))
+            if self._stopped:
+                break
+    def stop(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Stop reading ahead and wait for the readahead thread to end
+        Preconditions:
+            N/A
+        '''
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.join()
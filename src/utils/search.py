@@ -0,0 +1,82 @@
+## -*- coding: UTF-8 -*-
+## search.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+
+import re
+from functools import lru_cache
+
+class KeywordSearcher(object):
+    '''
+    Class for searching raw EVTX chunk and record buffers for any of a set
+    of keywords before they are decoded. BinXML stores string values as
+    UTF-16LE, so keywords are encoded the same way and all of them are
+    matched against the raw bytes in a single pass of one compiled
+    alternation. Only string values stored in a record can be matched;
+    numeric and binary values are not stored as text and will not match.
+    '''
+    def __init__(self, keywords):
+        self._keywords = tuple(keywords)
+        self._patterns = tuple(sorted(\
+            set(keyword.encode('UTF_16_LE') for keyword in self._keywords if len(keyword) > 0),
+            key=len,
+            reverse=True\
+        ))
+        if len(self._patterns) == 0:
+            raise ValueError('no non-empty keywords provided')
+        self._regex = re.compile(b'|'.join(re.escape(pattern) for pattern in self._patterns))
+    def __repr__(self):
+        return 'KeywordSearcher(%r)'%(self._keywords,)
+    def __reduce__(self):
+        return (compile_keywords, (self._keywords,))
+    @property
+    def keywords(self):
+        '''
+        @keywords.getter
+        '''
+        return self._keywords
+    def search(self, buffer, start=0, end=None):
+        '''
+        Args:
+            buffer: ByteString  => raw buffer to search
+            start: Integer      => offset in buffer to start searching at
+            end: Integer        => offset in buffer to stop searching at
+        Returns:
+            Boolean
+            True if any keyword occurs in buffer[start:end], False otherwise
+        Preconditions:
+            buffer is of type ByteString    (assumed True)
+        '''
+        return self._regex.search(buffer, start, len(buffer) if end is None else end) is not None
+
+@lru_cache(maxsize=32)
+def compile_keywords(keywords):
+    '''
+    Args:
+        keywords: NTuple<String>    => keywords to search for
+    Returns:
+        KeywordSearcher
+        Searcher for keywords (cached, so each process compiles it once)
+    Preconditions:
+        keywords is of type NTuple<String>
+    '''
+    return KeywordSearcher(keywords)
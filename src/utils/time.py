@@ -21,7 +21,9 @@
 ## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 ## SOFTWARE.
 
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+
+EPOCH_AS_FILETIME = datetime(1601, 1, 1, tzinfo=timezone.utc)
 
 class WindowsTime(object):
     '''
@@ -62,9 +64,6 @@ class WindowsTime(object):
             N/A
         '''
         try:
-            return datetime.fromtimestamp(\
-                ( float(self._high) * 2 ** 32 + self._low ) * 1e-7 - 11644473600, \
-                tz=timezone.utc
-            )
+            return EPOCH_AS_FILETIME + timedelta(microseconds=((self._high << 32) + self._low) // 10)
         except:
             return None
@@ -0,0 +1,755 @@
+## -*- coding: UTF-8 -*-
+## xpath.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import re
+import operator
+from functools import lru_cache
+from datetime import datetime, timezone
+from dateutil.parser import isoparse
+
+from src.parsers.binxml import SYSTEM_ATTRIBUTE_ALIASES
+from src.main.exceptions import QueryCompilationError
+
+_TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<number>0[xX][0-9a-fA-F]+|\d+(?:\.\d+)?)
+      | '(?P<squote>[^']*)'
+      | "(?P<dquote>[^"]*)"
+      | (?P<operator><=|>=|!=|=|<|>)
+      | (?P<punctuation>[\[\]()/@*,.])
+      | (?P<name>[A-Za-z_][\w\-.]*)
+    )''', re.VERBOSE)
+
+_OPERATORS = {\
+    '=':    operator.eq,
+    '!=':   operator.ne,
+    '<':    operator.lt,
+    '<=':   operator.le,
+    '>':    operator.gt,
+    '>=':   operator.ge\
+}
+
+## Relative cost of resolving a value from each section of a record,
+## used to evaluate the cheapest terms of a conjunction first
+_SECTION_COSTS = dict(System=1, EventData=4, UserData=8)
+
+def _to_number(value):
+    '''
+    Args:
+        value: Any  => value to convert
+    Returns:
+        Integer|Float
+        Numeric value of value, None if not numeric
+    Preconditions:
+        N/A
+    '''
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            if value[:2].lower() == '0x':
+                return int(value, 16)
+            return int(value) if value.isdigit() else float(value)
+        except ValueError:
+            return None
+    return None
+
+def _to_datetime(value):
+    '''
+    Args:
+        value: Any  => value to convert
+    Returns:
+        DateTime
+        Timezone-aware datetime of value, None if not a timestamp
+    Preconditions:
+        N/A
+    '''
+    if isinstance(value, datetime):
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        try:
+            return _to_datetime(isoparse(value))
+        except ValueError:
+            return None
+    return None
+
+def _compare_values(compare, left, right):
+    '''
+    Args:
+        compare: Callable<Any, Any> -> Boolean  => comparison operator
+        left: Any                               => left operand
+        right: Any                              => right operand
+    Returns:
+        Boolean
+        Result of comparison, coercing operands to timestamps or numbers
+        when either side is one (otherwise compares as strings)
+    Preconditions:
+        compare is a function from _OPERATORS   (assumed True)
+    '''
+    if left is None or right is None:
+        return False
+    if isinstance(left, datetime) or isinstance(right, datetime):
+        left, right = _to_datetime(left), _to_datetime(right)
+    elif isinstance(left, (int, float)) or isinstance(right, (int, float)):
+        left, right = _to_number(left), _to_number(right)
+    else:
+        left, right = str(left), str(right)
+    if left is None or right is None:
+        return False
+    return compare(left, right)
+
+def _to_boolean(value):
+    '''
+    Args:
+        value: Any  => result of evaluating expression
+    Returns:
+        Boolean
+        Effective boolean value of value (node sets are true if non-empty)
+    Preconditions:
+        N/A
+    '''
+    if isinstance(value, list):
+        return len(value) > 0
+    return bool(value)
+
+def _to_event_ids(value):
+    '''
+    Args:
+        value: Integer|Float    => literal an EventID is compared to for equality
+    Returns:
+        FrozenSet<Integer>
+        Event IDs equal to value (none if value is not a whole number)
+    Preconditions:
+        N/A
+    '''
+    if isinstance(value, float) and not value.is_integer():
+        return frozenset()
+    return frozenset([int(value)])
+
+class _NodeSet(list):
+    '''
+    Values of the nodes selected by a location path
+    '''
+    pass
+
+class XPathQuery(object):
+    '''
+    Class for compiling the subset of XPath 1.0 supported by the
+    Windows Event Log service (i.e. wevtutil qe /q and Event Viewer
+    custom views) into a predicate over EventLogXRecord objects, such as:
+        *[System[(EventID=4624) and TimeCreated[@SystemTime>='2018-01-01T00:00:00.000Z']]]
+        *[System[Provider[@Name='Microsoft-Windows-Security-Auditing'] and (Level=1 or Level=2)]]
+        *[EventData[Data[@Name='TargetUserName']='Administrator']]
+    The predicate resolves fields through the record's lazy accessors,
+    so only the substitution values a query refers to are decoded, and
+    the terms of each conjunction are ordered so that System fields are
+    tested before EventData and UserData. EventID terms in the top-level
+    conjunction are collected into event_ids for callers that can use
+    them to skip work.
+    NOTE:
+        queries cannot prune whole chunks from the chunk header, as the
+        record IDs and times in the chunk header come from the record
+        headers, which can differ from System/EventRecordID and
+        System/TimeCreated (i.e. forwarded events)
+    '''
+    def __init__(self, expression):
+        self._expression = expression
+        self._tokens = None
+        self._position = 0
+        self.event_ids = None
+        self._predicate = self._compile_query(self._parse(expression))
+    def __repr__(self):
+        return 'XPathQuery(%r)'%self._expression
+    def __reduce__(self):
+        return (compile_query, (self._expression,))
+    @property
+    def expression(self):
+        '''
+        @expression.getter
+        '''
+        return self._expression
+    def matches(self, evtx_record):
+        '''
+        Args:
+            evtx_record: EventLogXRecord    => record to test
+        Returns:
+            Boolean
+            True if evtx_record satisfies this query, False otherwise
+        Preconditions:
+            evtx_record is of type EventLogXRecord  (assumed True)
+        '''
+        if self.event_ids is not None and \
+                _to_number(evtx_record.get_system_field('EventID')) not in self.event_ids:
+            return False
+        return _to_boolean(self._predicate(evtx_record))
+
+    ## Parsing
+
+    def _tokenize(self, expression):
+        '''
+        Args:
+            expression: String  => query to tokenize
+        Returns:
+            List<Tuple<String, String>>
+            (kind, text) pairs of tokens in expression
+        Preconditions:
+            expression is of type String
+        '''
+        tokens = list()
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = _TOKEN_PATTERN.match(expression, position)
+            if match is None or match.end() == position:
+                raise QueryCompilationError('unexpected character at position %d of %r'%(position, expression))
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind in ('squote', 'dquote'):
+                kind = 'string'
+            tokens.append((kind, text))
+            position = match.end()
+        return tokens
+    def _peek(self, text=None, kind=None):
+        '''
+        Args:
+            text: String    => text of token to match
+            kind: String    => kind of token to match
+        Returns:
+            Tuple<String, String>
+            Next token if it matches text and kind, None otherwise
+        Preconditions:
+            N/A
+        '''
+        if self._position >= len(self._tokens):
+            return None
+        token = self._tokens[self._position]
+        if (text is not None and token[1] != text) or (kind is not None and token[0] != kind):
+            return None
+        return token
+    def _next(self, text=None, kind=None):
+        '''
+        Args:
+            @XPathQuery._peek
+        Returns:
+            Tuple<String, String>
+            Next token (consumed)
+        Preconditions:
+            Next token matches text and kind if provided
+        '''
+        token = self._peek(text, kind)
+        if token is None:
+            found = self._tokens[self._position][1] if self._position < len(self._tokens) else 'end of query'
+            raise QueryCompilationError('expected %s but found %r'%(text or kind or 'token', found))
+        self._position += 1
+        return token
+    def _parse(self, expression):
+        '''
+        Args:
+            expression: String  => query to parse
+        Returns:
+            Tuple
+            Abstract syntax tree of query
+        Preconditions:
+            expression is of type String
+        '''
+        if not isinstance(expression, str) or len(expression.strip()) == 0:
+            raise QueryCompilationError('query is empty')
+        self._tokens = self._tokenize(expression)
+        self._position = 0
+        tree = self._parse_path()
+        if self._position != len(self._tokens):
+            raise QueryCompilationError('unexpected %r after end of query'%self._tokens[self._position][1])
+        return tree
+    def _parse_path(self):
+        '''
+        Parse location path (steps separated by /)
+        '''
+        self._peek('/') and self._next('/')
+        steps = [self._parse_step()]
+        while self._peek('/'):
+            self._next('/')
+            steps.append(self._parse_step())
+        return ('path', steps)
+    def _parse_step(self):
+        '''
+        Parse location step with optional predicates
+        '''
+        if self._peek('@'):
+            self._next('@')
+            return ('attribute', self._next(kind='name')[1], [])
+        if self._peek('.'):
+            self._next('.')
+            return ('self', '.', [])
+        if self._peek('*'):
+            name = self._next('*')[1]
+        else:
+            name = self._next(kind='name')[1]
+        predicates = list()
+        while self._peek('['):
+            self._next('[')
+            predicates.append(self._parse_or())
+            self._next(']')
+        return ('child', name, predicates)
+    def _parse_or(self):
+        '''
+        Parse disjunction
+        '''
+        operands = [self._parse_and()]
+        while self._peek('or', 'name'):
+            self._next()
+            operands.append(self._parse_and())
+        return operands[0] if len(operands) == 1 else ('or', operands)
+    def _parse_and(self):
+        '''
+        Parse conjunction
+        '''
+        operands = [self._parse_comparison()]
+        while self._peek('and', 'name'):
+            self._next()
+            operands.append(self._parse_comparison())
+        return operands[0] if len(operands) == 1 else ('and', operands)
+    def _parse_comparison(self):
+        '''
+        Parse comparison (or lone primary expression)
+        '''
+        left = self._parse_primary()
+        if self._peek(kind='operator'):
+            op = self._next()[1]
+            return ('compare', op, left, self._parse_primary())
+        return left
+    def _parse_primary(self):
+        '''
+        Parse parenthesized expression, literal, function call or location path
+        '''
+        if self._peek('('):
+            self._next('(')
+            expression = self._parse_or()
+            self._next(')')
+            return expression
+        if self._peek(kind='number'):
+            text = self._next()[1]
+            if text[:2].lower() == '0x':
+                return ('literal', int(text, 16))
+            return ('literal', float(text) if '.' in text else int(text))
+        if self._peek(kind='string'):
+            return ('literal', self._next()[1])
+        if self._peek(kind='name') and \
+                self._position + 1 < len(self._tokens) and \
+                self._tokens[self._position + 1][1] == '(':
+            name = self._next()[1]
+            self._next('(')
+            arguments = list()
+            if not self._peek(')'):
+                arguments.append(self._parse_or())
+                while self._peek(','):
+                    self._next(',')
+                    arguments.append(self._parse_or())
+            self._next(')')
+            return ('call', name, arguments)
+        return self._parse_path()
+
+    ## Compilation
+
+    def _compile_query(self, tree):
+        '''
+        Args:
+            tree: Tuple => abstract syntax tree of query
+        Returns:
+            Callable<EventLogXRecord> -> Boolean
+            Predicate over records
+        Preconditions:
+            tree is a location path
+        '''
+        steps = tree[1]
+        if steps[0][0] != 'child' or steps[0][1] not in ('*', 'Event'):
+            raise QueryCompilationError('query must select * or Event, not %r'%steps[0][1])
+        predicates = [self._compile(predicate, tuple(), True)[0] for predicate in steps[0][2]]
+        if len(steps) > 1:
+            getter = self._compile_path(steps[1:], tuple(), len(predicates) == 0)[0]
+            predicates.append(lambda evtx_record: len(getter(evtx_record)) > 0)
+        return self._conjunction(predicates)
+    def _conjunction(self, predicates):
+        '''
+        Args:
+            predicates: List<Callable<EventLogXRecord> -> Boolean>  => predicates to combine
+        Returns:
+            Callable<EventLogXRecord> -> Boolean
+            Predicate that is True when all predicates are True
+        Preconditions:
+            N/A
+        '''
+        if len(predicates) == 0:
+            return lambda evtx_record: True
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda evtx_record: all(predicate(evtx_record) for predicate in predicates)
+    def _compile(self, node, context, hoist):
+        '''
+        Args:
+            node: Tuple             => abstract syntax tree node
+            context: NTuple<String> => path of context node (i.e. ('System', 'TimeCreated'))
+            hoist: Boolean          => whether node is part of the top-level conjunction
+        Returns:
+            Tuple<Callable<EventLogXRecord> -> Any, Integer>
+            Function evaluating node against a record and its relative cost
+        Preconditions:
+            N/A
+        '''
+        kind = node[0]
+        if kind == 'literal':
+            value = node[1]
+            return (lambda evtx_record: value), 0
+        elif kind == 'and':
+            compiled = sorted(\
+                (self._compile(operand, context, hoist) for operand in node[1]),
+                key=lambda entry: entry[1]\
+            )
+            functions = [function for function, cost in compiled]
+            return (lambda evtx_record: all(_to_boolean(function(evtx_record)) for function in functions)), sum(cost for function, cost in compiled)
+        elif kind == 'or':
+            compiled = [self._compile(operand, context, False) for operand in node[1]]
+            if hoist:
+                self._hoist_event_ids(node[1], context)
+            functions = [function for function, cost in compiled]
+            return (lambda evtx_record: any(_to_boolean(function(evtx_record)) for function in functions)), sum(cost for function, cost in compiled)
+        elif kind == 'compare':
+            return self._compile_comparison(node, context, hoist)
+        elif kind == 'call':
+            return self._compile_call(node, context)
+        elif kind == 'path':
+            getter, cost, field = self._compile_path(node[1], context, hoist)
+            return getter, cost
+        raise QueryCompilationError('unsupported expression %r'%(node,))
+    def _compile_comparison(self, node, context, hoist):
+        '''
+        @XPathQuery._compile
+        '''
+        op, left, right = node[1], node[2], node[3]
+        compare = _OPERATORS[op]
+        left_function, left_cost = self._compile(left, context, False)
+        right_function, right_cost = self._compile(right, context, False)
+        if right[0] == 'literal' and isinstance(right[1], str) and _to_datetime(right[1]) is not None:
+            timestamp = _to_datetime(right[1])
+            right_function = lambda evtx_record: timestamp
+        if hoist:
+            self._hoist_comparison(node, context)
+        def evaluate(evtx_record):
+            left_value = left_function(evtx_record)
+            right_value = right_function(evtx_record)
+            left_values = left_value if isinstance(left_value, list) else [left_value]
+            right_values = right_value if isinstance(right_value, list) else [right_value]
+            for left_entry in left_values:
+                for right_entry in right_values:
+                    if _compare_values(compare, left_entry, right_entry):
+                        return True
+            return False
+        return evaluate, left_cost + right_cost
+    def _compile_call(self, node, context):
+        '''
+        @XPathQuery._compile
+        '''
+        name, arguments = node[1], node[2]
+        compiled = [self._compile(argument, context, False) for argument in arguments]
+        functions = [function for function, cost in compiled]
+        cost = sum(cost for function, cost in compiled)
+        def first(value):
+            if isinstance(value, list):
+                return value[0] if len(value) > 0 else None
+            return value
+        if name == 'band' and len(functions) == 2:
+            def band(evtx_record):
+                left = _to_number(first(functions[0](evtx_record)))
+                right = _to_number(first(functions[1](evtx_record)))
+                if left is None or right is None:
+                    return 0
+                return int(left) & int(right)
+            return band, cost
+        elif name == 'timediff' and len(functions) in (1, 2):
+            def timediff(evtx_record):
+                start = _to_datetime(first(functions[0](evtx_record)))
+                end = _to_datetime(first(functions[1](evtx_record))) if len(functions) == 2 else datetime.now(timezone.utc)
+                if start is None or end is None:
+                    return None
+                return int((end - start).total_seconds() * 1000)
+            return timediff, cost
+        elif name == 'not' and len(functions) == 1:
+            return (lambda evtx_record: not _to_boolean(functions[0](evtx_record))), cost
+        elif name in ('true', 'false') and len(functions) == 0:
+            value = name == 'true'
+            return (lambda evtx_record: value), 0
+        raise QueryCompilationError('unsupported function %s() with %d argument(s)'%(name, len(functions)))
+    def _compile_path(self, steps, context, hoist):
+        '''
+        Args:
+            steps: List<Tuple>      => location steps
+            @XPathQuery._compile
+        Returns:
+            Tuple<Callable<EventLogXRecord> -> List<Any>, Integer, Tuple<String, String>>
+            Function returning values of selected nodes, its relative cost, and the
+            (section, field) the path resolves to (None if it does not resolve to one field)
+        Preconditions:
+            N/A
+        '''
+        getter = lambda evtx_record: _NodeSet([''])
+        cost = 0
+        field = None
+        for kind, name, predicates in steps:
+            if kind == 'self':
+                continue
+            data_name = self._data_name(kind, name, predicates, context)
+            if data_name is not None:
+                getter = self._eventdata_field(data_name)
+                cost, field, context = _SECTION_COSTS['EventData'], ('EventData', data_name), context + (name,)
+                continue
+            getter, cost, field, context = self._compile_step(kind, name, context, getter, cost)
+            if len(predicates) > 0:
+                compiled = sorted(\
+                    (self._compile(predicate, context, hoist and len(steps) == 1) for predicate in predicates),
+                    key=lambda entry: entry[1]\
+                )
+                getter = self._filter_step(getter, [function for function, predicate_cost in compiled])
+                cost += sum(predicate_cost for function, predicate_cost in compiled)
+        return getter, cost, field
+    def _data_name(self, kind, name, predicates, context):
+        '''
+        Args:
+            kind: String            => kind of location step
+            name: String            => name of location step
+            predicates: List<Tuple> => predicates of location step
+            context: NTuple<String> => context of location step
+        Returns:
+            String
+            Value of X if step is EventData/Data[@Name='X'], None otherwise
+        Preconditions:
+            N/A
+        '''
+        if context != ('EventData',) or kind != 'child' or name != 'Data' or len(predicates) != 1:
+            return None
+        predicate = predicates[0]
+        if predicate[0] != 'compare' or predicate[1] != '=':
+            return None
+        left, right = predicate[2], predicate[3]
+        if left[0] == 'literal':
+            left, right = right, left
+        if right[0] != 'literal' or left != ('path', [('attribute', 'Name', [])]):
+            return None
+        return str(right[1])
+    def _eventdata_field(self, name):
+        '''
+        Args:
+            name: String    => name of EventData field
+        Returns:
+            Callable<EventLogXRecord> -> List<Any>
+            Getter of EventData field value
+        Preconditions:
+            name is of type String  (assumed True)
+        '''
+        def eventdata_field(evtx_record):
+            value = evtx_record.get_eventdata_field(name)
+            return _NodeSet() if value is None else _NodeSet([value])
+        return eventdata_field
+    def _filter_step(self, getter, predicates):
+        '''
+        Args:
+            getter: Callable<EventLogXRecord> -> List<Any>  => node value getter
+            predicates: List<Callable<EventLogXRecord> -> Any> => step predicates
+        Returns:
+            Callable<EventLogXRecord> -> List<Any>
+            Getter returning no nodes when any predicate is False
+        Preconditions:
+            N/A
+        '''
+        def filtered(evtx_record):
+            values = getter(evtx_record)
+            if len(values) == 0:
+                return values
+            for predicate in predicates:
+                if not _to_boolean(predicate(evtx_record)):
+                    return _NodeSet()
+            return values
+        return filtered
+    def _compile_step(self, kind, name, context, getter, cost):
+        '''
+        Args:
+            kind: String                                    => child or attribute
+            name: String                                    => name of node
+            context: NTuple<String>                         => context of step
+            getter: Callable<EventLogXRecord> -> List<Any>  => getter of context node
+            cost: Integer                                   => cost of context node
+        Returns:
+            Tuple<Callable, Integer, Tuple<String, String>, NTuple<String>>
+            Getter, cost, field and context of selected node
+        Preconditions:
+            N/A
+        '''
+        section = context[0] if len(context) > 0 else None
+        if section is None:
+            if kind != 'child' or name not in _SECTION_COSTS:
+                raise QueryCompilationError('%s is not a section of an event'%name)
+            if name == 'System':
+                return getter, 1, None, (name,)
+            elif name == 'EventData':
+                return (lambda evtx_record: _NodeSet([''])), _SECTION_COSTS[name], None, (name,)
+            def userdata(evtx_record):
+                value = evtx_record.get_userdata()
+                return _NodeSet() if value is None else _NodeSet([value])
+            return userdata, _SECTION_COSTS[name], None, (name,)
+        elif section == 'System':
+            if len(context) == 1 and kind == 'child':
+                field_name = name
+            elif len(context) == 2 and kind == 'attribute':
+                field_name = SYSTEM_ATTRIBUTE_ALIASES.get((context[1], name), context[1] + name)
+            else:
+                raise QueryCompilationError('unsupported System path %s'%'/'.join(context + (name,)))
+            element_fields = frozenset(\
+                alias for (element, attribute), alias in SYSTEM_ATTRIBUTE_ALIASES.items() if element == name\
+            ) if kind == 'child' else frozenset()
+            def system_field(evtx_record):
+                value = evtx_record.get_system_field(field_name)
+                if value is not None:
+                    return _NodeSet([value])
+                if kind == 'child':
+                    ## Element without text (i.e. Execution) exists if any of its attributes do
+                    for key in evtx_record.get_instance().template.system_fields:
+                        if key in element_fields or key.startswith(name):
+                            return _NodeSet([''])
+                return _NodeSet()
+            return system_field, 1, ('System', field_name), context + (name,)
+        elif section == 'EventData':
+            if len(context) == 1 and kind == 'child':
+                def eventdata_fields(evtx_record):
+                    eventdata = evtx_record.get_eventdata()
+                    if name == 'Data' or name == '*':
+                        values = list()
+                        for key, value in eventdata.items():
+                            values.extend(value if key == 'Data' else [value])
+                        return _NodeSet(values)
+                    return _NodeSet([eventdata[name]] if name in eventdata else [])
+                return eventdata_fields, _SECTION_COSTS['EventData'], None, context + (name,)
+            elif len(context) == 2 and kind == 'attribute' and name == 'Name':
+                raise QueryCompilationError('EventData attribute paths are only supported as Data[@Name=\'...\']')
+            raise QueryCompilationError('unsupported EventData path %s'%'/'.join(context + (name,)))
+        elif section == 'UserData':
+            def userdata_child(evtx_record):
+                values = list()
+                for value in getter(evtx_record):
+                    if not isinstance(value, dict):
+                        continue
+                    if kind == 'attribute':
+                        attributes = value.get('#attributes')
+                        if attributes is not None and name in attributes:
+                            values.append(attributes[name])
+                        continue
+                    for key, child in value.items():
+                        if key.startswith('#') or (name != '*' and key != name):
+                            continue
+                        values.extend(child if isinstance(child, list) else [child])
+                return _NodeSet(values)
+            return userdata_child, _SECTION_COSTS['UserData'], None, context + (name,)
+        raise QueryCompilationError('unsupported path %s'%'/'.join(context + (name,)))
+
+    ## Hoisting
+
+    def _field_of(self, node, context):
+        '''
+        Args:
+            node: Tuple             => abstract syntax tree node
+            context: NTuple<String> => context of node
+        Returns:
+            String
+            Name of System field node resolves to, None otherwise
+        Preconditions:
+            N/A
+        '''
+        if node[0] != 'path':
+            return None
+        try:
+            return self._compile_path(node[1], context, False)[2]
+        except QueryCompilationError:
+            return None
+    def _hoist_comparison(self, node, context):
+        '''
+        Args:
+            node: Tuple             => comparison node in top-level conjunction
+            context: NTuple<String> => context of node
+        Procedure:
+            Record equality on EventID
+        Preconditions:
+            node is a comparison node
+        '''
+        op, left, right = node[1], node[2], node[3]
+        if op != '=':
+            return
+        if left[0] == 'literal' and right[0] == 'path':
+            left, right = right, left
+        if right[0] != 'literal' or _to_number(right[1]) is None:
+            return
+        if self._field_of(left, context) == ('System', 'EventID'):
+            event_ids = _to_event_ids(_to_number(right[1]))
+            self.event_ids = event_ids if self.event_ids is None else (self.event_ids & event_ids)
+    def _hoist_event_ids(self, operands, context):
+        '''
+        Args:
+            operands: List<Tuple>   => operands of disjunction in top-level conjunction
+            context: NTuple<String> => context of disjunction
+        Procedure:
+            Record EventID values if every operand is an EventID equality
+        Preconditions:
+            N/A
+        '''
+        event_ids = set()
+        for operand in operands:
+            if operand[0] == 'or':
+                nested = XPathQuery.__new__(XPathQuery)
+                nested.event_ids = None
+                nested._hoist_event_ids(operand[1], context)
+                if nested.event_ids is None:
+                    return
+                event_ids |= nested.event_ids
+                continue
+            if operand[0] != 'compare' or operand[1] != '=':
+                return
+            left, right = operand[2], operand[3]
+            if left[0] == 'literal':
+                left, right = right, left
+            if right[0] != 'literal' or _to_number(right[1]) is None or \
+                    self._field_of(left, context) != ('System', 'EventID'):
+                return
+            event_ids |= _to_event_ids(_to_number(right[1]))
+        event_ids = frozenset(event_ids)
+        self.event_ids = event_ids if self.event_ids is None else (self.event_ids & event_ids)
+
+@lru_cache(maxsize=32)
+def compile_query(expression):
+    '''
+    Args:
+        expression: String  => XPath event query
+    Returns:
+        XPathQuery
+        Compiled query (cached, so each process compiles a query once)
+    Preconditions:
+        expression is of type String
+    '''
+    return XPathQuery(expression)
@@ -0,0 +1,75 @@
+## -*- coding: UTF-8 -*-
+## __init__.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+## Tests are run from the repository root (python3 -m unittest discover -s tests -t .)
+## and import src the way aevtx.py does, with lib on the path for its dependencies
+
+import sys
+from os import path
+
+REPO_PATH = path.dirname(path.dirname(path.abspath(__file__)))
+if REPO_PATH not in sys.path:
+    sys.path.insert(0, REPO_PATH)
+if path.join(REPO_PATH, 'lib') not in sys.path:
+    sys.path.append(path.join(REPO_PATH, 'lib'))
+
+## Security_short_selected.evtx is one of the sample logs of the evtx project
+## (https://github.com/omerbenamram/evtx): one chunk of 7 records
+SAMPLE_PATH = path.join(path.dirname(path.abspath(__file__)), 'samples', 'Security_short_selected.evtx')
+EVTX_FILE_HEADER_SIZE = 4096
+EVTX_CHUNK_SIZE = 65536
+SAMPLE_RECORD_COUNT = 7
+
+def make_evtx(filepath, chunk_count):
+    '''
+    Args:
+        filepath: String        => path of EVTX file to create
+        chunk_count: Integer    => number of chunks of file
+    Returns:
+        String
+        filepath, written as the file header of the sample log followed by
+        chunk_count copies of its chunk (SAMPLE_RECORD_COUNT records each)
+    Preconditions:
+        chunk_count is of type Integer > 0  (assumed True)
+    '''
+    with open(SAMPLE_PATH, 'rb') as sample:
+        header = sample.read(EVTX_FILE_HEADER_SIZE)
+        chunk = sample.read(EVTX_CHUNK_SIZE)
+    with open(filepath, 'wb') as evtx_file:
+        evtx_file.write(header)
+        for i in range(chunk_count):
+            evtx_file.write(chunk)
+    return filepath
+
+def run_aevtx(*argv):
+    '''
+    Args:
+        argv: List<String>  => command line arguments (without aevtx.py)
+    Procedure:
+        Run the directive selected by argv in this process, as aevtx.py would
+    Preconditions:
+        N/A
+    '''
+    from src.main.cli import initialize_parser
+    args = initialize_parser().parse_args(list(argv))
+    args.func(args)
@@ -0,0 +1,93 @@
+## -*- coding: UTF-8 -*-
+## test_api.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import unittest
+import multiprocessing
+from os import path
+from threading import Thread
+from tempfile import TemporaryDirectory
+
+from tests import make_evtx, SAMPLE_RECORD_COUNT
+
+from src.main.api import parse_files
+
+CHUNK_COUNT = 8
+RUN_TIMEOUT = 60
+
+def keep_all(record):
+    return True
+
+class PickledOnceFilter(object):
+    '''
+    Record filter that can be pickled only once, so it passes the check
+    of parse_files but cannot be sent to worker processes
+    '''
+    pickled = 0
+
+    def __call__(self, record):
+        return True
+    def __reduce__(self):
+        PickledOnceFilter.pickled += 1
+        if PickledOnceFilter.pickled > 1:
+            raise TypeError('filter was pickled more than once')
+        return (PickledOnceFilter, ())
+
+class TestParseFiles(unittest.TestCase):
+    '''
+    A record filter that cannot be sent to worker processes is refused up
+    front, and a failure to send chunks to the workers is raised by the
+    iterator instead of leaving it waiting for records
+    '''
+    def setUp(self):
+        self._tmpdir = TemporaryDirectory()
+        self.source = make_evtx(path.join(self._tmpdir.name, 'big.evtx'), CHUNK_COUNT)
+    def tearDown(self):
+        self._tmpdir.cleanup()
+    def _count(self, records):
+        outcome = dict()
+        def count():
+            try:
+                outcome['count'] = sum(len(batch) for batch in records)
+            except Exception as e:
+                outcome['error'] = e
+        reader = Thread(target=count, daemon=True)
+        reader.start()
+        reader.join(RUN_TIMEOUT)
+        self.assertFalse(reader.is_alive(), 'iterator did not finish')
+        return outcome
+    def test_picklable_filter(self):
+        for workers in (0, 2):
+            outcome = self._count(parse_files([self.source], workers=workers, filter=keep_all))
+            self.assertEqual(outcome, dict(count=CHUNK_COUNT * SAMPLE_RECORD_COUNT))
+    def test_unpicklable_filter_refused(self):
+        self.assertRaises(TypeError, parse_files, [self.source], workers=2, filter=lambda record: True)
+        outcome = self._count(parse_files([self.source], workers=0, filter=lambda record: True))
+        self.assertEqual(outcome, dict(count=CHUNK_COUNT * SAMPLE_RECORD_COUNT))
+    def test_failed_dispatch_raised(self):
+        PickledOnceFilter.pickled = 0
+        outcome = self._count(parse_files([self.source], workers=2, filter=PickledOnceFilter()))
+        self.assertIsInstance(outcome.get('error'), TypeError)
+        self.assertEqual(multiprocessing.active_children(), list())
+
+if __name__ == '__main__':
+    unittest.main()
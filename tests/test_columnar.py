@@ -0,0 +1,156 @@
+## -*- coding: UTF-8 -*-
+## test_columnar.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+
+import json
+import unittest
+from os import path, remove
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+
+from tests import make_evtx, run_aevtx, SAMPLE_PATH, SAMPLE_RECORD_COUNT
+
+from src.utils.columnar import ColumnarReader, to_timestamp
+
+CHUNK_COUNT = 4
+PARALLEL_ARGS = ('--threads', '2', '--inline-below-mb', '0')
+
+def to_row(record):
+    '''
+    Args:
+        record: Dict<String, Any>   => record output by parse json
+    Returns:
+        Dict<String, Any>
+        Columns of record, as ColumnarReader.read returns them
+    '''
+    write_time = datetime.strptime(record['Header']['WriteTime'], '%Y-%m-%d %H:%M:%S.%f%z')
+    return dict(\
+        record_id=record['Header']['EventRecordID'],
+        timestamp=to_timestamp(write_time),
+        event_id=record['System']['EventID'],
+        provider=record['System']['Provider'],
+        channel=record['System']['Channel'],
+        computer=record['System']['Computer'],
+        event_data=record['EventData'] if record['EventData'] else None\
+    )
+
+def to_dict(row):
+    '''
+    Args:
+        row: Container<String, Any> => row read by ColumnarReader
+    Returns:
+        Dict<String, Any>
+        row (and its event_data) as plain dictionaries
+    '''
+    row = dict(row)
+    if row.get('event_data') is not None:
+        row['event_data'] = dict(row['event_data'])
+    return row
+
+class TestColumnarReader(unittest.TestCase):
+    '''
+    A columnar file read back (whole, projected or bounded by time and event
+    IDs) holds the rows of the records parse json outputs for the same file,
+    and select_blocks prunes blocks that cannot hold the rows asked for
+    '''
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = TemporaryDirectory()
+        cls.tmpdir = cls._tmpdir.name
+        cls.source = make_evtx(path.join(cls.tmpdir, 'big.evtx'), CHUNK_COUNT)
+        cls.rows = cls._parse_json(cls.source)
+        assert len(cls.rows) == CHUNK_COUNT * SAMPLE_RECORD_COUNT
+        cls.reader = ColumnarReader(cls._parse_columnar(cls.source, 'big.col', *PARALLEL_ARGS))
+    @classmethod
+    def tearDownClass(cls):
+        cls.reader.close()
+        cls._tmpdir.cleanup()
+    @classmethod
+    def _parse_json(cls, source):
+        target = path.join(cls.tmpdir, 'output.json')
+        run_aevtx('parse', 'json', '--lpath', cls.tmpdir, '-s', source, '-t', target)
+        try:
+            with open(target, 'r') as output:
+                return [to_row(json.loads(line)) for line in output]
+        finally:
+            remove(target)
+    @classmethod
+    def _parse_columnar(cls, source, name, *args):
+        target = path.join(cls.tmpdir, name)
+        run_aevtx('parse', 'columnar', '--lpath', cls.tmpdir, '-s', source, '-t', target, *args)
+        return target
+    def _read(self, **kwargs):
+        return [to_dict(row) for row in self.reader.read(**kwargs)]
+    def test_round_trip(self):
+        self.assertEqual(self.reader.sources, [self.source])
+        self.assertEqual(len(self.reader.blocks), CHUNK_COUNT)
+        self.assertEqual(self.reader.row_count, len(self.rows))
+        self.assertEqual(self._read(), self.rows)
+    def test_inline_round_trip(self):
+        with ColumnarReader(self._parse_columnar(SAMPLE_PATH, 'sample.col')) as reader:
+            self.assertEqual([to_dict(row) for row in reader.read()], self._parse_json(SAMPLE_PATH))
+    def test_block_statistics(self):
+        for block in self.reader.blocks:
+            for name in ('record_id', 'timestamp', 'event_id'):
+                values = [row[name] for row in self.rows[:SAMPLE_RECORD_COUNT]]
+                self.assertEqual(block['stats'][name], [min(values), max(values)])
+    def test_projection(self):
+        columns = ['record_id', 'event_id', 'EventData.TargetUserName']
+        expected = [\
+            {'record_id': row['record_id'], 'event_id': row['event_id'], 'EventData.TargetUserName': (row['event_data'] or dict()).get('TargetUserName')} \
+            for row in self.rows\
+        ]
+        self.assertEqual(self._read(columns=columns), expected)
+        self.assertEqual(self._read(columns=['computer']), [dict(computer=row['computer']) for row in self.rows])
+    def test_absent_event_id(self):
+        self.assertEqual(self.reader.select_blocks(event_ids=[1]), list())
+        self.assertEqual(self.reader.select_blocks(event_ids=[1, 99999]), list())
+        self.assertEqual(self._read(event_ids=[1]), list())
+        ## within the event ID range of every block, so only filtered by row
+        self.assertEqual(len(self.reader.select_blocks(event_ids=[5000])), CHUNK_COUNT)
+        self.assertEqual(self._read(event_ids=[5000]), list())
+    def test_event_ids(self):
+        expected = [row for row in self.rows if row['event_id'] in (5152, 4673)]
+        self.assertEqual(len(expected), 3 * CHUNK_COUNT)
+        self.assertEqual(self._read(event_ids=[5152, 4673]), expected)
+    def test_time_bounds(self):
+        ## bounds equal to write times of records, as both are inclusive
+        start = datetime(2016, 6, 29, 15, 24, 36, 686000, tzinfo=timezone.utc)
+        end = datetime(2016, 6, 29, 15, 24, 57, 90800)
+        expected = [row for row in self.rows if to_timestamp(start) <= row['timestamp'] <= to_timestamp(end)]
+        self.assertEqual(len(expected), 4 * CHUNK_COUNT)
+        self.assertEqual(self._read(start=start, end=end), expected)
+        self.assertEqual(self._read(start=to_timestamp(start), end=to_timestamp(end)), expected)
+        self.assertEqual(\
+            self._read(columns=['record_id'], start=start, end=end),
+            [dict(record_id=row['record_id']) for row in expected]\
+        )
+    def test_time_bounds_prune_blocks(self):
+        first, last = self.rows[0]['timestamp'], self.rows[SAMPLE_RECORD_COUNT - 1]['timestamp']
+        self.assertEqual(self.reader.select_blocks(start=last + 1), list())
+        self.assertEqual(self.reader.select_blocks(end=first - 1), list())
+        self.assertEqual(len(self.reader.select_blocks(start=last, end=last)), CHUNK_COUNT)
+        self.assertEqual(self._read(start=last + 1), list())
+
+if __name__ == '__main__':
+    unittest.main()
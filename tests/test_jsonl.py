@@ -0,0 +1,106 @@
+## -*- coding: UTF-8 -*-
+## test_jsonl.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import unittest
+from json import dumps
+from datetime import datetime, timezone, timedelta
+from construct.lib import Container
+
+from tests import SAMPLE_PATH, SAMPLE_RECORD_COUNT
+
+from src.parsers.evtx import EventLogX, EventLogXRecord
+from src.utils.jsonl import JSONLinesEncoder
+
+class _String(str):
+    '''
+    String subclass (as construct enum values are)
+    '''
+    pass
+
+class TestJSONLinesEncoder(unittest.TestCase):
+    '''
+    JSONLinesEncoder.encode outputs exactly dumps(record.serialize(), sort_keys=True)
+    '''
+    def setUp(self):
+        self.encoder = JSONLinesEncoder()
+    def assertEncoded(self, record):
+        self.assertEqual(self.encoder.encode(record), dumps(record.serialize(), sort_keys=True))
+    def _make_record(self, **fields):
+        record = EventLogXRecord(b'')
+        record.update(fields)
+        return record
+    def test_sample_records(self):
+        records = [record.parse() for chunk in EventLogX(SAMPLE_PATH).chunks for record in chunk.records]
+        self.assertEqual(len(records), SAMPLE_RECORD_COUNT)
+        ## twice, so the second pass reuses the key plans of the first
+        for i in range(2):
+            for record in records:
+                self.assertEncoded(record)
+    def test_strings(self):
+        self.assertEncoded(self._make_record(\
+            control=''.join(chr(code) for code in range(0x20)) + '\x7f',
+            quotes='"\\/',
+            separators='\u2028 \u2029',
+            surrogates='\ud800 \udfff \udc00\ud800',
+            non_bmp='\U0001f600',
+            non_ascii='caf\xe9 \u4e2d',
+            subclass=_String('enum value'),
+            empty=''\
+        ))
+    def test_keys(self):
+        self.assertEncoded(self._make_record(**{\
+            'k\xe9y': 1,
+            'line\u2028separator': 2,
+            'quote"key': 3,
+            'RawData': b'\x00',
+            '_private': 4,
+            'b': 5,
+            'a': 6,
+            'B': 7\
+        }))
+    def test_numbers(self):
+        self.assertEncoded(self._make_record(\
+            floats=[0.1, 1e300, 1.5e-7, -0.0, 2.0, float('inf'), float('-inf'), float('nan')],
+            ints=[0, -1, 2 ** 64, -2 ** 63, 10 ** 30],
+            booleans=[True, False],
+            none=None\
+        ))
+    def test_containers(self):
+        self.assertEncoded(self._make_record(\
+            empty_container=Container(),
+            raw_only=Container(RawValue=1, _hidden=2),
+            empty_list=list(),
+            nested=[Container(b=[Container()], a=list()), [list(), [None]]],
+            plain_dict=dict(b=1, a=dict(d=None, c=[1.5]))\
+        ))
+    def test_converted_values(self):
+        self.assertEncoded(self._make_record(\
+            aware=datetime(2016, 6, 29, 15, 24, 34, 346000, tzinfo=timezone.utc),
+            offset=datetime(2016, 6, 29, 15, 24, 34, tzinfo=timezone(timedelta(hours=-5))),
+            naive=datetime(1601, 1, 1),
+            data=b'\xff\xfe valid \xe2\x80\xa8',
+            buffer=bytearray(b'abc')\
+        ))
+
+if __name__ == '__main__':
+    unittest.main()
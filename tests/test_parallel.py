@@ -0,0 +1,117 @@
+## -*- coding: UTF-8 -*-
+## test_parallel.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import os
+import signal
+import unittest
+from threading import Thread, Lock
+from time import sleep
+from multiprocessing import SimpleQueue
+
+import tests
+
+from src.utils import parallel
+
+JOIN_TIMEOUT = 30
+
+class EchoTask(object):
+    '''
+    Task that returns its value (killing its worker first if value is negative)
+    '''
+    def __init__(self, value):
+        self.value = value
+    def __call__(self, worker):
+        if self.value < 0:
+            os.kill(os.getpid(), signal.SIGKILL)
+        return [self.value]
+
+class TestSupervisedWorkerPool(unittest.TestCase):
+    '''
+    Workers of a supervised pool that die are replaced and the tasks
+    they were sent are run again (or quarantined), without hanging the pool
+    '''
+    def setUp(self):
+        self.results = SimpleQueue()
+        self.quarantined = list()
+        self.dropped = list()
+        self.pool = parallel.SupervisedWorkerPool(\
+            EchoTask,
+            queue_size=4,
+            worker_count=2,
+            batch_size=3,
+            on_quarantine=self.quarantined.append,
+            on_error=lambda error, entries: self.dropped.extend(entries),
+            worker_kwargs=dict(result_queue=self.results)\
+        )
+        self.pool.start()
+    def tearDown(self):
+        self.pool.terminate()
+        try:
+            self.pool.join_workers()
+        except TypeError:
+            pass
+    def _close(self):
+        errors = list()
+        def close():
+            try:
+                self.pool.add_poison_pills()
+                self.pool.join_workers()
+            except Exception as e:
+                errors.append(e)
+        closer = Thread(target=close, daemon=True)
+        closer.start()
+        closer.join(JOIN_TIMEOUT)
+        self.assertFalse(closer.is_alive(), 'pool did not close')
+        return errors
+    def _get_results(self):
+        results = list()
+        while not self.results.empty():
+            results.extend(self.results.get())
+        return sorted(results)
+    def test_idle_workers_killed(self):
+        for slot in list(self.pool._slots):
+            os.kill(slot.process.pid, signal.SIGKILL)
+        sleep(0.5)
+        for value in range(20):
+            self.pool.add_task(value)
+        self._close()
+        self.assertEqual(self._get_results(), list(range(20)))
+    def test_crashing_task_quarantined(self):
+        for value in (0, 1, -1, 2, 3, 4):
+            self.pool.add_task(value)
+        self._close()
+        self.assertEqual(self._get_results(), [0, 1, 2, 3, 4])
+        self.assertEqual([task.value for task in self.quarantined], [-1])
+    def test_dispatch_failure_raised(self):
+        processes = [slot.process for slot in self.pool._slots]
+        lock = Lock()
+        self.pool.add_task(lock)
+        errors = self._close()
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], TypeError)
+        self.assertEqual([task.value for task in self.dropped], [lock])
+        self.assertFalse(any(process.is_alive() for process in processes))
+        self.assertRaises(TypeError, self.pool.join_tasks)
+
+if __name__ == '__main__':
+    unittest.main()
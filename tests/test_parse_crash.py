@@ -0,0 +1,97 @@
+## -*- coding: UTF-8 -*-
+## test_parse_crash.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import os
+import signal
+import unittest
+import multiprocessing
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from tests import make_evtx, run_aevtx, SAMPLE_RECORD_COUNT
+
+from src.main import tasks
+
+CHUNK_COUNT = 40
+CRASH_CHUNKIDX = 5
+
+def crash_once(extract_resultset, marker):
+    '''
+    Args:
+        extract_resultset: Callable => ParseCSVTask.extract_resultset to wrap
+        marker: String              => path of file marking the crash happened
+    Returns:
+        Callable
+        extract_resultset, except that the first worker to parse chunk
+        CRASH_CHUNKIDX is killed with SIGKILL (as by the OOM killer)
+    Preconditions:
+        N/A
+    '''
+    def wrapper(self, worker):
+        if self.chunkidx == CRASH_CHUNKIDX and not path.exists(marker):
+            open(marker, 'w').close()
+            os.kill(os.getpid(), signal.SIGKILL)
+        return extract_resultset(self, worker)
+    return wrapper
+
+@unittest.skipUnless(multiprocessing.get_start_method() == 'fork', 'crash injection needs forked workers')
+class TestParseCrash(unittest.TestCase):
+    '''
+    A worker killed part way through a batch must not lose the output
+    of the entries of the batch it already ran, nor of the rest of it
+    '''
+    def setUp(self):
+        self._tmpdir = TemporaryDirectory()
+        self.tmpdir = self._tmpdir.name
+        self.source = make_evtx(path.join(self.tmpdir, 'big.evtx'), CHUNK_COUNT)
+    def tearDown(self):
+        self._tmpdir.cleanup()
+    def _parse_csv(self, name, *args):
+        target = path.join(self.tmpdir, name)
+        run_aevtx(\
+            'parse', 'csv', 'summary',
+            '--lpath', self.tmpdir,
+            '-s', self.source,
+            '-t', target,
+            *args\
+        )
+        with open(target, 'r') as output:
+            return output.read().splitlines()
+    def test_worker_killed_mid_batch(self):
+        expected = self._parse_csv('inline.csv', '--threads', '1')
+        self.assertEqual(len(expected), CHUNK_COUNT * SAMPLE_RECORD_COUNT)
+        marker = path.join(self.tmpdir, 'crashed')
+        wrapper = crash_once(tasks.ParseCSVTask.extract_resultset, marker)
+        with mock.patch.object(tasks.ParseCSVTask, 'extract_resultset', wrapper):
+            actual = self._parse_csv(\
+                'crash.csv',
+                '--threads', '2',
+                '--batch-size', '4',
+                '--inline-below-mb', '0'\
+            )
+        self.assertTrue(path.exists(marker))
+        self.assertEqual(actual, expected)
+
+if __name__ == '__main__':
+    unittest.main()
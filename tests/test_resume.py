@@ -0,0 +1,147 @@
+## -*- coding: UTF-8 -*-
+## test_resume.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import sys
+import signal
+import subprocess
+import unittest
+import multiprocessing
+from os import path
+from glob import glob
+from tempfile import TemporaryDirectory
+
+from tests import REPO_PATH, make_evtx, run_aevtx, SAMPLE_RECORD_COUNT
+
+CHUNK_COUNT = 40
+KILL_CHUNKIDX = 20
+MERGE_LIMIT = CHUNK_COUNT * SAMPLE_RECORD_COUNT // 2
+RUN_TIMEOUT = 60
+PARALLEL_ARGS = ('--threads', '2', '--inline-below-mb', '0')
+
+## Run that is killed (with its worker processes, as by a power loss) at
+## the point named by its first argument:
+##  parse:      when chunk KILL_CHUNKIDX is parsed
+##  merge:      after appending MERGE_LIMIT records of the spill files to the target
+##  merged:     once the spill files are merged, before the journal is finished
+##  finished:   once the journal is finished
+KILLED_RUN = '''
+import os
+import signal
+import sys
+sys.path.insert(0, %r)
+from tests import run_aevtx
+from src.main import tasks, directives
+import src.utils.parallel as parallel
+
+def kill():
+    os.killpg(0, signal.SIGKILL)
+
+kill_point = sys.argv[1]
+if kill_point == 'parse':
+    extract_resultset = tasks.ParseJSONTask.extract_resultset
+    def parse(self, worker):
+        if self.chunkidx == %d:
+            kill()
+        return extract_resultset(self, worker)
+    tasks.ParseJSONTask.extract_resultset = parse
+elif kill_point == 'merge':
+    merge_tagged_files = parallel.merge_tagged_files
+    def merge(glob_pattern, target, clean=True, limit=None):
+        merge_tagged_files(glob_pattern, target, clean=False, limit=%d)
+        kill()
+    parallel.merge_tagged_files = merge
+else:
+    finish_journal = directives.ParseDirectiveMixin._finish_journal
+    def finish(self):
+        if kill_point == 'finished':
+            finish_journal(self)
+        kill()
+    directives.ParseDirectiveMixin._finish_journal = finish
+run_aevtx(*sys.argv[2:])
+'''%(REPO_PATH, KILL_CHUNKIDX, MERGE_LIMIT)
+
+@unittest.skipUnless(multiprocessing.get_start_method() == 'fork', 'kill injection needs forked workers')
+class TestResume(unittest.TestCase):
+    '''
+    A run killed before, during or after merging its output, and then
+    resumed (see --resume), outputs each record exactly once, as a run
+    that was never killed does
+    '''
+    def setUp(self):
+        self._tmpdir = TemporaryDirectory()
+        self.tmpdir = self._tmpdir.name
+        self.source = make_evtx(path.join(self.tmpdir, 'big.evtx'), CHUNK_COUNT)
+        self.target = path.join(self.tmpdir, 'resumed.json')
+        self.expected = self._parse_json('clean.json')
+        self.assertEqual(len(self.expected.splitlines()), CHUNK_COUNT * SAMPLE_RECORD_COUNT)
+    def tearDown(self):
+        self._tmpdir.cleanup()
+    def _get_args(self, target, *args):
+        return ['parse', 'json', '--lpath', self.tmpdir, '-s', self.source, '-t', target] + list(args)
+    def _parse_json(self, name, *args):
+        target = path.join(self.tmpdir, name)
+        run_aevtx(*self._get_args(target, *args))
+        with open(target, 'r') as output:
+            return output.read()
+    def _kill_run(self, kill_point, *args):
+        process = subprocess.Popen(\
+            [sys.executable, '-c', KILLED_RUN, kill_point] + self._get_args(self.target, *args),
+            cwd=REPO_PATH,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True\
+        )
+        self.assertEqual(process.wait(RUN_TIMEOUT), -signal.SIGKILL)
+    def _assert_resumed(self, *args):
+        actual = self._parse_json(path.basename(self.target), '--resume', *args)
+        self.assertEqual(actual, self.expected)
+        self.assertFalse(path.exists(self.target + '.journal'))
+        self.assertEqual(glob(path.join(self.tmpdir, '*_tmp_aevtx.out')), list())
+    def test_killed_while_parsing(self):
+        self._kill_run('parse', *PARALLEL_ARGS)
+        self.assertTrue(path.exists(self.target + '.journal'))
+        self._assert_resumed(*PARALLEL_ARGS)
+    def test_killed_while_merging(self):
+        self._kill_run('merge', *PARALLEL_ARGS)
+        with open(self.target, 'r') as output:
+            self.assertEqual(len(output.read().splitlines()), MERGE_LIMIT)
+        self._assert_resumed(*PARALLEL_ARGS)
+    def test_killed_after_merging(self):
+        self._kill_run('merged', *PARALLEL_ARGS)
+        self.assertTrue(path.exists(self.target + '.journal'))
+        self._assert_resumed(*PARALLEL_ARGS)
+    def test_killed_after_finishing(self):
+        self._kill_run('finished', *PARALLEL_ARGS)
+        self.assertFalse(path.exists(self.target + '.journal'))
+        self._assert_resumed(*PARALLEL_ARGS)
+    def test_resumed_after_completing(self):
+        self._parse_json(path.basename(self.target), '--resume', *PARALLEL_ARGS)
+        self._assert_resumed(*PARALLEL_ARGS)
+    def test_inline_killed_after_finishing(self):
+        self._kill_run('finished')
+        with open(self.target, 'r') as output:
+            self.assertEqual(output.read(), self.expected)
+        self._assert_resumed()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+## -*- coding: UTF-8 -*-
+## test_serve.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import sys
+import signal
+import socket
+import subprocess
+import unittest
+from os import path, mkdir
+from time import sleep
+from tempfile import TemporaryDirectory
+
+from tests import REPO_PATH, make_evtx, run_aevtx
+
+CHUNK_COUNT = 40
+AUTHKEY = 'aevtx-test'
+RUN_TIMEOUT = 60
+
+## Worker that is killed (as by the OOM killer) when it starts parsing its first lease
+CRASHING_WORKER = '''
+import os
+import signal
+import sys
+sys.path.insert(0, %r)
+from tests import run_aevtx
+from src.main import tasks
+def crash(self, worker):
+    os.kill(os.getpid(), signal.SIGKILL)
+tasks.BaseParseFileOutputTask.collect_results = crash
+run_aevtx(*sys.argv[1:])
+'''%REPO_PATH
+
+def get_free_port():
+    '''
+    Args:
+        N/A
+    Returns:
+        Integer
+        Port on localhost that was free when checked
+    Preconditions:
+        N/A
+    '''
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class TestServeWorkerCrash(unittest.TestCase):
+    '''
+    Units leased to a worker that dies are leased again as soon as its
+    connection is lost, not once the lease times out, and the output of
+    the run is that of a single process run
+    '''
+    def setUp(self):
+        self._tmpdir = TemporaryDirectory()
+        self.tmpdir = self._tmpdir.name
+        self.source = make_evtx(path.join(self.tmpdir, 'big.evtx'), CHUNK_COUNT)
+        self.address = '127.0.0.1:%d'%get_free_port()
+        self.processes = list()
+    def tearDown(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        self._tmpdir.cleanup()
+    def _start(self, *argv):
+        ## each process coalesces the logs in its log directory on exit,
+        ## so processes running at once cannot share one
+        log_path = path.join(self.tmpdir, 'log%d'%len(self.processes))
+        mkdir(log_path)
+        process = subprocess.Popen(\
+            [sys.executable] + list(argv) + ['--lpath', log_path],
+            cwd=REPO_PATH,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL\
+        )
+        self.processes.append(process)
+        return process
+    def _start_worker(self, *argv):
+        return self._start(*(list(argv) + ['worker', '--connect', self.address, '--authkey', AUTHKEY, '--threads', '1']))
+    def _read(self, target):
+        with open(target, 'r') as output:
+            return output.read()
+    def test_worker_killed_mid_lease(self):
+        expected = path.join(self.tmpdir, 'single.json')
+        run_aevtx('parse', 'json', '--lpath', self.tmpdir, '-s', self.source, '-t', expected)
+        target = path.join(self.tmpdir, 'served.json')
+        coordinator = self._start(\
+            path.join(REPO_PATH, 'aevtx.py'), 'serve',
+            '-s', self.source,
+            '-t', target,
+            '--bind', self.address,
+            '--authkey', AUTHKEY,
+            '--lease-chunks', '4',
+            '--lease-timeout', '300'\
+        )
+        ## retry until the coordinator is listening (a worker that cannot
+        ## connect exits cleanly instead of being killed)
+        for attempt in range(50):
+            crashing = self._start_worker('-c', CRASHING_WORKER)
+            if crashing.wait(RUN_TIMEOUT) == -signal.SIGKILL:
+                break
+            sleep(0.2)
+        self.assertEqual(crashing.returncode, -signal.SIGKILL)
+        worker = self._start_worker(path.join(REPO_PATH, 'aevtx.py'))
+        self.assertEqual(coordinator.wait(RUN_TIMEOUT), 0)
+        self.assertEqual(worker.wait(RUN_TIMEOUT), 0)
+        self.assertEqual(self._read(target), self._read(expected))
+
+if __name__ == '__main__':
+    unittest.main()
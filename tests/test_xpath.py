@@ -0,0 +1,147 @@
+## -*- coding: UTF-8 -*-
+## test_xpath.py
+##
+## Copyright (c) 2018 Noah Rubin
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import io
+import json
+import unittest
+from os import path, remove
+from contextlib import redirect_stderr
+from tempfile import TemporaryDirectory
+
+from tests import make_evtx, run_aevtx, SAMPLE_RECORD_COUNT
+
+from src.main.exceptions import QueryCompilationError
+from src.utils.xpath import XPathQuery
+
+CHUNK_COUNT = 2
+
+class TestXPathQueryCompile(unittest.TestCase):
+    '''
+    EventID equalities of the top-level conjunction are hoisted into
+    event_ids, and malformed queries are refused
+    '''
+    def assertEventIDs(self, expression, event_ids):
+        self.assertEqual(XPathQuery(expression).event_ids, event_ids)
+    def test_event_id_hoisted(self):
+        self.assertEventIDs('*[System[EventID=4624]]', frozenset([4624]))
+        self.assertEventIDs('*[System[4624=EventID]]', frozenset([4624]))
+        self.assertEventIDs('*[System[(EventID=4624) and Level=0]]', frozenset([4624]))
+    def test_event_id_or_set_hoisted(self):
+        self.assertEventIDs('*[System[(EventID=4624 or EventID=4625)]]', frozenset([4624, 4625]))
+        self.assertEventIDs('*[System[(EventID=1 or (EventID=2 or EventID=3))]]', frozenset([1, 2, 3]))
+        self.assertEventIDs('*[System[EventID=4624] and System[EventID=4625]]', frozenset())
+    def test_event_id_not_hoisted(self):
+        self.assertEventIDs('*[System[EventID=4624 or Level=2]]', None)
+        self.assertEventIDs('*[System[EventID!=4624]]', None)
+        self.assertEventIDs('*[System[not(EventID=4624)]]', None)
+        self.assertEventIDs('*[System[EventID=\'abc\']]', None)
+    def test_non_integer_event_id(self):
+        self.assertEventIDs('*[System[EventID=4624.5]]', frozenset())
+        self.assertEventIDs('*[System[EventID=4624.0]]', frozenset([4624]))
+    def test_malformed_queries(self):
+        for expression in (\
+            '',
+            '*[System[EventID=]]',
+            '*[System[EventID=4624]',
+            '*[System[EventID=\'4624]]',
+            '*[System[EventID=4624]] junk',
+            '*[System[frob(EventID)]]',
+            'Foo[System[EventID=4624]]'):
+            with self.subTest(expression=expression):
+                self.assertRaises(QueryCompilationError, XPathQuery, expression)
+    def test_malformed_query_argument(self):
+        with redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, run_aevtx, 'parse', 'json', '-s', 'a.evtx', '-t', 'a.json', '--query', '*[System[')
+
+class TestXPathQueryParse(unittest.TestCase):
+    '''
+    Parsing with --query outputs exactly the records that satisfy the
+    query, as found by filtering the output of parsing without it
+    '''
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = TemporaryDirectory()
+        cls.tmpdir = cls._tmpdir.name
+        cls.source = make_evtx(path.join(cls.tmpdir, 'big.evtx'), CHUNK_COUNT)
+        cls.records = cls._parse_json(None)
+        assert len(cls.records) == CHUNK_COUNT * SAMPLE_RECORD_COUNT
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmpdir.cleanup()
+    @classmethod
+    def _parse_json(cls, query):
+        target = path.join(cls.tmpdir, 'output.json')
+        args = ['parse', 'json', '--lpath', cls.tmpdir, '-s', cls.source, '-t', target]
+        if query is not None:
+            args.extend(['--query', query])
+        run_aevtx(*args)
+        try:
+            with open(target, 'r') as output:
+                return [json.loads(line) for line in output]
+        finally:
+            remove(target)
+    def assertQuery(self, query, predicate):
+        expected = [record for record in self.records if predicate(record)]
+        self.assertEqual(self._parse_json(query), expected)
+        return expected
+    def test_event_id(self):
+        matched = self.assertQuery('*[System[EventID=5152]]', lambda record: record['System']['EventID'] == 5152)
+        self.assertEqual(len(matched), 2 * CHUNK_COUNT)
+    def test_event_id_or_set(self):
+        self.assertQuery(\
+            '*[System[(EventID=4776 or EventID=4625)]]',
+            lambda record: record['System']['EventID'] in (4776, 4625)\
+        )
+    def test_non_integer_event_id(self):
+        self.assertQuery('*[System[EventID=5152.5]]', lambda record: False)
+    def test_time_created(self):
+        ## the record header write time of the sixth record is later than
+        ## its System/TimeCreated, which is what the query tests
+        matched = self.assertQuery(\
+            '*[System[TimeCreated[@SystemTime>=\'2016-06-29T15:24:57.0908Z\']]]',
+            lambda record: record['System']['TimeCreated'] >= '2016-06-29 15:24:57.090800'\
+        )
+        self.assertEqual(len(matched), 3 * CHUNK_COUNT)
+        self.assertQuery(\
+            '*[System[TimeCreated[@SystemTime<\'2016-06-29T15:24:57.0908Z\']]]',
+            lambda record: record['System']['TimeCreated'] < '2016-06-29 15:24:57.090800'\
+        )
+    def test_data_name(self):
+        matched = self.assertQuery(\
+            '*[EventData[Data[@Name=\'TargetUserName\']=\'Administrator\']]',
+            lambda record: record['EventData'].get('TargetUserName') == 'Administrator'\
+        )
+        self.assertEqual(len(matched), 2 * CHUNK_COUNT)
+    def test_band(self):
+        self.assertQuery(\
+            '*[System[band(Keywords,0x0020000000000000)]]',
+            lambda record: int(record['System']['Keywords'], 16) & 0x0020000000000000 != 0\
+        )
+    def test_not(self):
+        self.assertQuery(\
+            '*[System[not(EventID=5152) and Provider[@Name=\'Microsoft-Windows-Security-Auditing\']]]',
+            lambda record: record['System']['EventID'] != 5152\
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: UTF-8 -*-
+# bench_transport.py
+#
+# Benchmark of the queue transport overhead per record of WorkerPool, with
+# and without batching tasks and results (run from anywhere, i.e.
+# python3 tools/benchmarks/bench_transport.py --batch-size 8)
+
+import sys
+from os import path
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '..', '..')))
+sys.path.append(path.abspath(path.join(path.dirname(__file__), '..', '..', 'lib')))
+
+from time import perf_counter
+from argparse import ArgumentParser
+
+import src.utils.parallel as parallel
+
+class EchoTask(object):
+    '''
+    Task that returns payload once per record, standing in for a
+    parse task that produces one output line per record
+    '''
+    def __init__(self, payload, record_count):
+        self._payload = payload
+        self._record_count = record_count
+    def __call__(self, worker):
+        return [self._payload] * self._record_count
+
+def run_pipeline(record_count, records_per_task, batch_size, batch_results, threads, payload):
+    '''
+    Args:
+        record_count: Integer       => total number of records to send through pipeline
+        records_per_task: Integer   => number of records each task produces
+        batch_size: Integer         => number of tasks per queue transfer
+        batch_results: Boolean      => whether results are sent to the result queue in batches
+        threads: Integer            => number of worker processes
+        payload: String             => result produced for each record
+    Returns:
+        Float
+        Wall clock time to push all tasks through the workers and all
+        results through the result queue
+    Preconditions:
+        N/A
+    '''
+    results = parallel.WorkerPool(\
+        parallel.JoinableQueue(-1),
+        None,
+        daemonize=False,
+        worker_count=1\
+    )
+    workers = parallel.WorkerPool(\
+        parallel.JoinableQueue(-1),
+        EchoTask,
+        daemonize=False,
+        worker_count=threads,
+        worker_kwargs=dict(result_queue=results.queue, batch_results=batch_results),
+        batch_size=batch_size\
+    )
+    start = perf_counter()
+    results.start()
+    workers.start()
+    for i in range(record_count // records_per_task):
+        workers.add_task(payload, records_per_task)
+    workers.add_poison_pills()
+    workers.join_workers()
+    results.add_poison_pills()
+    results.join_workers()
+    return perf_counter() - start
+
+def main():
+    parser = ArgumentParser(description='Benchmark queue transport overhead per record')
+    parser.add_argument('-n', '--records', type=int, default=200000, help='Number of records to send', dest='records')
+    parser.add_argument('-r', '--records-per-chunk', type=int, default=100, help='Records produced per chunk task', dest='records_per_chunk')
+    parser.add_argument('--batch-size', type=int, default=8, help='Number of chunk tasks per queue transfer', dest='batch_size')
+    parser.add_argument('--threads', type=int, default=(2 if parallel.CPU_COUNT <= 4 else 4), help='Number of worker processes', dest='threads')
+    args = parser.parse_args()
+    payload = 'x' * 256
+    cases = [\
+        ('per-record tasks, per-record results', 1, 1, False),
+        ('per-chunk tasks, per-record results', args.records_per_chunk, 1, False),
+        ('per-chunk tasks, batched results', args.records_per_chunk, 1, True),
+        ('batched chunk tasks, batched results', args.records_per_chunk, args.batch_size, True)\
+    ]
+    for description, records_per_task, batch_size, batch_results in cases:
+        elapsed = run_pipeline(args.records, records_per_task, batch_size, batch_results, args.threads, payload)
+        print('%-40s %8.3fs %8.2fus/record'%(description, elapsed, elapsed / args.records * 1e6))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())